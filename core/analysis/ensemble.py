@@ -1,29 +1,56 @@
 import numpy as np
 import pandas as pd
+from scipy import linalg
 from sklearn.ensemble import IsolationForest
 from sklearn.mixture import GaussianMixture
 from sklearn.preprocessing import StandardScaler
-import tensorflow as tf
-from tensorflow.keras.models import Sequential, Model
-from tensorflow.keras.layers import LSTM, Dense, RepeatVector, TimeDistributed, Input
 from loguru import logger
+import copy
 import pickle
 import os
 
+from core.analysis.lstm_numpy import NumpyLSTMAutoencoder
+
+COMPONENTS = ("isolation_forest", "gmm", "lstm_ae")
+CALIBRATION_POINTS = 1001 # Quantile levels per ECDF table (0.1% resolution)
+TAIL_LEVEL = 0.95 # Above this quantile the ECDF is extrapolated with an exponential tail
+MIN_HOLDOUT = 100 # Fewer held-out rows than this: calibrate on the training rows
+# Per-tree IsolationForest state spliced when trees are rotated (private in sklearn; missing ones are skipped)
+FOREST_TREE_ATTRS = ("estimators_", "estimators_features_", "_seeds",
+                     "_decision_path_lengths", "_average_path_length_per_tree")
+
+
 class AnomalyEnsemble:
-    def __init__(self, contamination=0.01):
+    def __init__(self, contamination=0.01, weights=None):
+        """
+        Args:
+            contamination: Expected anomaly share (Isolation Forest).
+            weights: Per-component weights of the aggregate (default: equal).
+        """
         self.contamination = contamination
+        self.weights = dict(weights or {name: 1.0 for name in COMPONENTS})
         self.scaler = StandardScaler()
         
         # Models
         self.iso_forest = IsolationForest(contamination=contamination, random_state=42)
         self.gmm = GaussianMixture(n_components=3, covariance_type='full', random_state=42)
-        self.lstm_ae = None # To be built based on input shape
-        
+        self.lstm_ae = None # To be built based on input shape (Keras, training only)
+        self.lstm_np = None # NumPy copy of its weights, used for scoring
+
+        # ECDF tables from the training scores: component -> raw-score quantiles at self.levels
+        self.levels = np.linspace(0.0, 1.0, CALIBRATION_POINTS)
+        self.calibration = {}
+
         self.is_fitted = False
+        self.updates = 0 # partial_fit steps since the last full fit
+        self._next_tree = 0 # Oldest IsolationForest tree, replaced first
 
     def _build_lstm_ae(self, input_shape):
         """Builds a simple LSTM Autoencoder."""
+        # TensorFlow is only needed to train; scoring uses the NumPy copy
+        from tensorflow.keras.models import Model
+        from tensorflow.keras.layers import LSTM, Dense, RepeatVector, TimeDistributed, Input
+
         # input_shape = (timesteps, features)
         timesteps, features = input_shape
         
@@ -37,13 +64,27 @@ class AnomalyEnsemble:
         model.compile(optimizer='adam', loss='mse')
         return model
 
-    def fit(self, X: np.ndarray, Sequence_X: np.ndarray = None):
+    def fit(self, X: np.ndarray, Sequence_X: np.ndarray = None, holdout: float = 0.2):
         """
         Fit the ensemble.
         X: 2D array (samples, features) for IF and GMM.
         Sequence_X: 3D array (samples, timesteps, features) for LSTM-AE.
                     If None, LSTM-AE is skipped or needs shaping.
+        holdout: Share of rows kept out of training and used to calibrate.
+                 Rows a model was fit on score lower than new normal traffic,
+                 so in-sample tables would make every threshold too strict.
         """
+        calibration_X, calibration_seq = X, Sequence_X
+        n_holdout = int(len(X) * holdout)
+        if n_holdout >= MIN_HOLDOUT:
+            order = np.random.default_rng(42).permutation(len(X))
+            held, kept = order[:n_holdout], order[n_holdout:]
+            calibration_X, X = X[held], X[kept]
+            if Sequence_X is not None:
+                calibration_seq, Sequence_X = Sequence_X[held], Sequence_X[kept]
+        elif holdout > 0:
+            logger.warning(f"Only {len(X)} samples: calibrating on the training rows (scores run high).")
+
         logger.info("Fitting Scaler...")
         X_scaled = self.scaler.fit_transform(X)
         
@@ -58,56 +99,228 @@ class AnomalyEnsemble:
             # Assuming Sequence_X is already sufficient length
             self.lstm_ae = self._build_lstm_ae(Sequence_X.shape[1:])
             self.lstm_ae.fit(Sequence_X, Sequence_X, epochs=10, batch_size=32, verbose=0, shuffle=True)
+            self.lstm_np = NumpyLSTMAutoencoder.from_keras(self.lstm_ae)
         else:
             logger.warning("No sequence data provided. LSTM-AE skipped.")
         
         self.is_fitted = True
+        self.updates = 0
+        self._next_tree = 0
+        self.calibrate(calibration_X, calibration_seq)
         logger.info("Ensemble fitted.")
 
-    def score(self, X: np.ndarray, Sequence_X: np.ndarray = None) -> np.ndarray:
+    def _raw_scores(self, X: np.ndarray, Sequence_X: np.ndarray = None) -> dict:
+        """Uncalibrated component scores, higher = more anomalous."""
+        X_scaled = self.scaler.transform(X)
+        raw = {
+            # decision_function: lower is more anomalous, so invert
+            "isolation_forest": -self.iso_forest.decision_function(X_scaled),
+            # score_samples: log-likelihood, so negative log-likelihood
+            "gmm": -self.gmm.score_samples(X_scaled),
+        }
+        lstm = getattr(self, "lstm_np", None) or self.lstm_ae
+        if lstm is not None and Sequence_X is not None:
+            reconstruction = lstm.predict(Sequence_X, verbose=0)
+            raw["lstm_ae"] = np.mean(np.power(Sequence_X - reconstruction, 2), axis=(1, 2))
+        return raw
+
+    def calibrate(self, X: np.ndarray, Sequence_X: np.ndarray = None):
+        """
+        Build the ECDF tables: quantiles of each component's score over X
+        (normal traffic the models were not fit on), plus one for the
+        weighted aggregate.
+        A calibrated score is then the share of those samples that scored
+        lower, so 0.99 means "more anomalous than 99% of normal traffic"
+        whatever the model.
+        """
+        raw = self._raw_scores(X, Sequence_X)
+        self.calibration = {name: np.quantile(values, self.levels) for name, values in raw.items()}
+        self.calibration["aggregate"] = np.quantile(self._combine(self._to_unit(raw)), self.levels)
+        logger.info(f"Calibrated {', '.join(raw)} on {len(X)} samples.")
+
+    def _to_unit(self, raw: dict) -> dict:
+        """Map raw scores onto [0, 1] through their ECDF tables."""
+        return {name: self._ecdf(values, self.calibration[name]) for name, values in raw.items()}
+
+    def _ecdf(self, values: np.ndarray, table: np.ndarray) -> np.ndarray:
+        """
+        Share of calibration samples below ``values``. Past TAIL_LEVEL the
+        table rests on a handful of samples and would saturate at 1.0, so
+        the tail is an exponential fitted to the mean excess of the top
+        quantiles (peaks over threshold): window scores need it, since
+        they look far past the 0.99 quantile of any one device.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        unit = np.interp(values, table, self.levels)
+        i = int(np.searchsorted(self.levels, TAIL_LEVEL))
+        start = table[i]
+        scale = max(float(np.mean(table[i:] - start)), 1e-12)
+        tail = values > start
+        unit[tail] = 1.0 - (1.0 - self.levels[i]) * np.exp(-(values[tail] - start) / scale)
+        return unit
+
+    def _combine(self, calibrated: dict) -> np.ndarray:
+        """Weighted mean of -log(1 - p): unbounded, so the aggregate keeps a tail to calibrate."""
+        names = [name for name in COMPONENTS if name in calibrated]
+        weights = np.array([self.weights.get(name, 1.0) for name in names])
+        unit = np.minimum(np.vstack([calibrated[name] for name in names]), 1.0 - 1e-15)
+        return weights @ -np.log1p(-unit) / weights.sum()
+
+    def score(self, X: np.ndarray, Sequence_X: np.ndarray = None) -> dict:
         """
-        Returns an aggregate anomaly score (0.0 to 1.0 approx).
-        Higher = More Anomalous.
+        Per-sample anomaly scores, each calibrated to [0, 1] against the
+        training distribution (higher = more anomalous). "aggregate" is the
+        calibrated weighted mean of the components, so one threshold (e.g.
+        0.99) means the same thing for every trained model.
         """
         if not self.is_fitted:
             raise ValueError("Model not fitted.")
-            
+        if not getattr(self, "calibration", None):
+            raise ValueError("Model has no calibration tables (saved by an older version); call calibrate() or retrain.")
+
+        raw = self._raw_scores(X, Sequence_X)
+        # Components without a table (or without input) are left out of the aggregate
+        calibrated = self._to_unit({name: values for name, values in raw.items() if name in self.calibration})
+        aggregate = self._ecdf(self._combine(calibrated), self.calibration["aggregate"])
+        calibrated.setdefault("lstm_ae", np.zeros(X.shape[0]))
+        calibrated["aggregate"] = aggregate
+        return calibrated
+
+    @staticmethod
+    def window_score(aggregate: np.ndarray) -> float:
+        """
+        Calibrated score of a whole window from its per-device aggregates.
+
+        On normal traffic the max of N calibrated scores stays below t with
+        probability t^N, so an alert on the max alone fires far more often
+        than 1 - t once many devices are scored. max^N is uniform again:
+        0.99 means one normal window in a hundred whatever the device count.
+        """
+        aggregate = np.asarray(aggregate, dtype=np.float64)
+        return float(aggregate.max()) ** len(aggregate) if len(aggregate) else 0.0
+
+    # --- Incremental updates ---
+
+    def fork(self) -> "AnomalyEnsemble":
+        """
+        Deep copy to update while this instance keeps scoring. The Keras
+        LSTM-AE is shared (scoring only reads the NumPy copy).
+        """
+        keras_model, self.lstm_ae = self.lstm_ae, None
+        try:
+            forked = copy.deepcopy(self)
+        finally:
+            self.lstm_ae = keras_model
+        forked.lstm_ae = keras_model
+        return forked
+
+    def partial_fit(self, X: np.ndarray, Sequence_X: np.ndarray = None, rate: float = 0.05,
+                    trees: int = None, lstm_epochs: int = 1, seed: int = None):
+        """
+        Move the fitted ensemble a step towards recent normal data, without
+        refitting from scratch:
+
+        - scaler: exponentially weighted mean / variance; the GMM is
+          re-expressed in the new scaled coordinates so it is unaffected
+        - GMM: one stepwise (online) EM step on the sufficient statistics
+        - IsolationForest: the ``trees`` oldest trees are replaced by trees
+          grown on X
+        - LSTM-AE: ``lstm_epochs`` warm-started epochs on Sequence_X (needs
+          the Keras model, see load(keras=True)), then re-exported
+        - calibration tables: blended with the quantiles of X's new scores
+
+        Args:
+            rate: Weight of X against the current state (scaler, GMM, tables).
+            trees: IsolationForest trees replaced (default: rate x n_estimators, at least 1).
+        """
+        if not self.is_fitted:
+            raise ValueError("Model not fitted.")
+        X = np.asarray(X, dtype=np.float64)
+        self._update_scaler(X, rate)
         X_scaled = self.scaler.transform(X)
-        n_samples = X.shape[0]
-        
-        # 1. Isolation Forest Score
-        # decision_function: lower is more anomalous (negative).
-        # range roughly -1 to 1. We invert it so high is anomalous.
-        if_score = -self.iso_forest.decision_function(X_scaled) 
-        
-        # 2. GMM Score
-        # score_samples: log-likelihood. Lower is more anomalous.
-        gmm_log_prob = self.gmm.score_samples(X_scaled)
-        gmm_score = -gmm_log_prob # Invert
-        
-        # 3. LSTM-AE Reconstruction Error
-        lstm_score = np.zeros(n_samples)
-        if self.lstm_ae and Sequence_X is not None:
-            reconstruction = self.lstm_ae.predict(Sequence_X)
-            mse = np.mean(np.power(Sequence_X - reconstruction, 2), axis=(1, 2))
-            lstm_score = mse
-        
-        # Normalization (Simple MinMax scaling on the fly or just weighted sum)
-        # For production, we should track min/max from training.
-        # Here we'll just sum them roughly.
-        
-        # Sigmoid-ish squash to keep in bounds?
-        # Let's just return raw sum for now, or a dict.
-        
-        # Normalize to 0-1 range roughly based on typical values
-        # This is a heuristic.
-        
-        return {
-            "isolation_forest": if_score,
-            "gmm": gmm_score,
-            "lstm_ae": lstm_score,
-            "aggregate": (if_score + (gmm_score / 100) + (lstm_score * 10)) # Arbitrary weighting
-        }
+        self._update_gmm(X_scaled, rate)
+        n_trees = trees if trees is not None else max(1, int(round(rate * len(self.iso_forest.estimators_))))
+        self._rotate_trees(X_scaled, n_trees, seed=seed if seed is not None else self.updates)
+        if Sequence_X is not None and self.lstm_ae is not None and lstm_epochs:
+            self.lstm_ae.fit(Sequence_X, Sequence_X, epochs=lstm_epochs, batch_size=32, verbose=0, shuffle=True)
+            self.lstm_np = NumpyLSTMAutoencoder.from_keras(self.lstm_ae)
+        self._update_calibration(X, Sequence_X, rate)
+        self.updates += 1
+
+    def _update_scaler(self, X: np.ndarray, rate: float):
+        old_mean, old_scale = self.scaler.mean_.copy(), self.scaler.scale_.copy()
+        mean = (1 - rate) * old_mean + rate * X.mean(axis=0)
+        var = (1 - rate) * (self.scaler.var_ + (old_mean - mean) ** 2) \
+            + rate * (X.var(axis=0) + (X.mean(axis=0) - mean) ** 2)
+        scale = np.sqrt(var)
+        scale[scale < 10 * np.finfo(scale.dtype).eps] = 1.0 # As StandardScaler does for constant features
+        self.scaler.mean_, self.scaler.var_, self.scaler.scale_ = mean, var, scale
+
+        # x_new = (x_old * old_scale + old_mean - mean) / scale, i.e. x_new = D x_old + shift
+        d = old_scale / scale
+        gmm = self.gmm
+        gmm.means_ = (gmm.means_ * old_scale + old_mean - mean) / scale
+        gmm.covariances_ = gmm.covariances_ * d[None, :, None] * d[None, None, :]
+        gmm.precisions_cholesky_ = gmm.precisions_cholesky_ / d[None, :, None]
+        gmm.precisions_ = gmm.precisions_cholesky_ @ gmm.precisions_cholesky_.transpose(0, 2, 1)
+        # Same density, new units: the NLL of every sample shifts by log|det D| (the Jacobian)
+        if "gmm" in self.calibration:
+            self.calibration["gmm"] = self.calibration["gmm"] + np.sum(np.log(d))
+
+    def _update_gmm(self, X_scaled: np.ndarray, rate: float):
+        """Stepwise EM: blend the expected sufficient statistics, then re-derive the parameters."""
+        gmm = self.gmm
+        resp = gmm.predict_proba(X_scaled) # E-step, (n, K)
+        nk = resp.sum(axis=0) + 10 * np.finfo(resp.dtype).eps
+        batch_weights = nk / len(X_scaled)
+        batch_means = resp.T @ X_scaled / nk[:, None]
+        batch_second = np.einsum("nk,ni,nj->kij", resp, X_scaled, X_scaled) / nk[:, None, None]
+
+        # s0 = weight, s1 = weight * mean, s2 = weight * E[x x^T] per component
+        second = gmm.covariances_ + np.einsum("ki,kj->kij", gmm.means_, gmm.means_)
+        s0 = (1 - rate) * gmm.weights_ + rate * batch_weights
+        s1 = (1 - rate) * gmm.weights_[:, None] * gmm.means_ + rate * batch_weights[:, None] * batch_means
+        s2 = (1 - rate) * gmm.weights_[:, None, None] * second + rate * batch_weights[:, None, None] * batch_second
+
+        means = s1 / s0[:, None]
+        covariances = s2 / s0[:, None, None] - np.einsum("ki,kj->kij", means, means)
+        covariances += gmm.reg_covar * np.eye(means.shape[1])
+        precisions_cholesky = np.empty_like(covariances)
+        for k, covariance in enumerate(covariances):
+            cov_chol = linalg.cholesky(covariance, lower=True)
+            precisions_cholesky[k] = linalg.solve_triangular(cov_chol, np.eye(len(covariance)), lower=True).T
+        gmm.weights_ = s0 / s0.sum()
+        gmm.means_, gmm.covariances_ = means, covariances
+        gmm.precisions_cholesky_ = precisions_cholesky
+        gmm.precisions_ = precisions_cholesky @ precisions_cholesky.transpose(0, 2, 1)
+
+    def _rotate_trees(self, X_scaled: np.ndarray, n_trees: int, seed: int):
+        forest = self.iso_forest
+        if len(X_scaled) < forest.max_samples_:
+            logger.debug(f"IsolationForest not rotated: {len(X_scaled)} samples < max_samples {forest.max_samples_}")
+            return
+        n_trees = min(n_trees, len(forest.estimators_))
+        fresh = IsolationForest(n_estimators=n_trees, max_samples=forest.max_samples_,
+                                max_features=forest.max_features, random_state=seed).fit(X_scaled)
+        replaced = [(self._next_tree + i) % len(forest.estimators_) for i in range(n_trees)]
+        for attr in FOREST_TREE_ATTRS:
+            if not (hasattr(forest, attr) and hasattr(fresh, attr)):
+                continue
+            values = list(getattr(forest, attr))
+            for i, tree in zip(replaced, getattr(fresh, attr)):
+                values[i] = tree
+            setattr(forest, attr, values)
+        self._next_tree = (replaced[-1] + 1) % len(forest.estimators_)
+
+    def _update_calibration(self, X: np.ndarray, Sequence_X: np.ndarray, rate: float):
+        """Blend each ECDF table with the quantiles of the updated model's scores on X."""
+        if not self.calibration:
+            return
+        raw = {name: values for name, values in self._raw_scores(X, Sequence_X).items() if name in self.calibration}
+        for name, values in raw.items():
+            self.calibration[name] = (1 - rate) * self.calibration[name] + rate * np.quantile(values, self.levels)
+        aggregate = np.quantile(self._combine(self._to_unit(raw)), self.levels)
+        self.calibration["aggregate"] = (1 - rate) * self.calibration["aggregate"] + rate * aggregate
 
     def save(self, path="models/ensemble.pkl"):
         directory = os.path.dirname(path)
@@ -130,24 +343,64 @@ class AnomalyEnsemble:
             self.lstm_ae = lstm_backup
 
     @staticmethod
-    def load(path="models/ensemble.pkl"):
+    def load(path="models/ensemble.pkl", keras=False):
+        """
+        Load a saved ensemble. The Keras LSTM-AE (and TensorFlow) is only
+        loaded when ``keras`` is set, or once to export the NumPy weights
+        of a model saved without them.
+        """
         if not os.path.exists(path):
             raise FileNotFoundError(f"Model file not found at {path}")
             
         with open(path, 'rb') as f:
             ensemble = pickle.load(f)
-            
+        defaults = {  # Attributes added since older versions saved the model
+            "weights": {name: 1.0 for name in COMPONENTS},
+            "levels": np.linspace(0.0, 1.0, CALIBRATION_POINTS),
+            "calibration": {},
+            "lstm_np": None,
+            "updates": 0,
+            "_next_tree": 0,
+        }
+        for attr, default in defaults.items():
+            if not hasattr(ensemble, attr):
+                setattr(ensemble, attr, default)
+        if ensemble.is_fitted and not ensemble.calibration:
+            logger.warning(f"{path} has no calibration tables (saved by an older version): "
+                           "call calibrate() on normal traffic or retrain before scoring.")
+
         # Restore Keras model
         keras_path = path.replace(".pkl", ".keras")
-        if os.path.exists(keras_path):
-            from tensorflow.keras.models import load_model
+        if os.path.exists(keras_path) and (keras or ensemble.lstm_np is None):
+            try:
+                from tensorflow.keras.models import load_model
+            except ImportError:
+                logger.warning(f"TensorFlow not installed; {keras_path} not loaded, LSTM-AE skipped.")
+                return ensemble
             ensemble.lstm_ae = load_model(keras_path)
             logger.info(f"Loaded LSTM model from {keras_path}")
+            if ensemble.lstm_np is None:
+                ensemble.lstm_np = NumpyLSTMAutoencoder.from_keras(ensemble.lstm_ae)
+                logger.info("Exported LSTM weights for NumPy inference (save the model to skip this next time).")
             
         return ensemble
 
 if __name__ == "__main__":
-    # Test
+    # Test: normal windows of N devices raise a false alert about 1 - threshold of the time, whatever N
+    rng = np.random.default_rng(0)
+    mixing = rng.normal(size=(13, 13)) * 0.3
+    model = AnomalyEnsemble()
+    model.fit(rng.normal(size=(20_000, 13)) @ mixing)
+    for devices in (1, 20, 64):
+        windows = model.score(rng.normal(size=(2000 * devices, 13)) @ mixing)["aggregate"].reshape(2000, devices)
+        alerts = np.mean([model.window_score(w) >= 0.99 for w in windows])
+        per_device = np.mean(windows.max(axis=1) >= 0.99)
+        print(f"{devices:>3} devices: {alerts:.2%} of normal windows alert (max device score alone: {per_device:.2%})")
+        assert 0.0025 <= alerts <= 0.025, f"false-alert rate {alerts:.2%} is not close to 1%"
+    outlier = rng.normal(size=(20, 13)) @ mixing
+    outlier[7] += 6
+    assert model.window_score(model.score(outlier)["aggregate"]) >= 0.99, "one anomalous device must still alert"
+
     model = AnomalyEnsemble()
     X = np.random.rand(100, 10) # 100 samples, 10 features
     
@@ -157,6 +410,9 @@ if __name__ == "__main__":
     model.fit(X, Seq_X)
     scores = model.score(X, Seq_X)
     print(pd.DataFrame(scores).head())
+    keras_mse = np.mean((Seq_X - model.lstm_ae.predict(Seq_X, verbose=0)) ** 2, axis=(1, 2))
+    numpy_mse = np.mean((Seq_X - model.lstm_np.predict(Seq_X)) ** 2, axis=(1, 2))
+    print(f"LSTM-AE NumPy vs Keras: max |diff| = {np.abs(keras_mse - numpy_mse).max():.2e}")
     
     # Test Save/Load
     model.save("/tmp/test_sentra.pkl")
@@ -0,0 +1,134 @@
+"""
+Flow-level Scan / Flood Detection
+
+Per-device windows cover a few seconds of traffic, so a scan that probes
+one port a minute, or a flood spread over thousands of sources, never
+stands out in any single window. This stage reads the finished flow
+records of FlowTable and keeps, over a sliding ``horizon`` of event time,
+the distinct targets each source left without a reply (scans) and the
+distinct sources that left each destination port without a reply
+(floods). A key that reaches its threshold is reported once per horizon.
+
+Both maps are BoundedState tables and each key keeps at most its
+threshold of peers, so memory stays bounded under spoofed sources.
+"""
+
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+from loguru import logger
+
+from core.data.state import BoundedState
+
+
+class _PeerWindow:
+    """Distinct peers of one key seen in the last ``horizon`` seconds (at most ``limit``)."""
+
+    __slots__ = ("peers", "alerted_at")
+
+    def __init__(self):
+        self.peers: Dict[Any, float] = {}  # peer -> last seen, oldest first
+        self.alerted_at: Optional[float] = None
+
+    def add(self, peer: Any, ts: float, horizon: float, limit: int) -> int:
+        self.peers.pop(peer, None)
+        self.peers[peer] = ts
+        for old, seen in list(self.peers.items()):
+            if seen > ts - horizon and len(self.peers) <= limit:
+                break
+            del self.peers[old]
+        return len(self.peers)
+
+
+class FlowDetector:
+    """Slow scans and distributed floods from finished flow records."""
+
+    def __init__(
+        self,
+        horizon: float = 600.0,
+        scan_targets: int = 20,
+        flood_sources: int = 100,
+        max_keys: int = 4096,
+    ):
+        """
+        Args:
+            horizon: Seconds of event time a target / source stays counted.
+            scan_targets: Distinct unanswered (dst, port) targets of one source that make a scan.
+            flood_sources: Distinct sources with unanswered flows to one dst:port that make a flood.
+            max_keys: Sources and destinations tracked each (least recently active dropped).
+        """
+        self.horizon = horizon
+        self.scan_targets = scan_targets
+        self.flood_sources = flood_sources
+        self.scans = BoundedState(max_entries=max_keys, name="flow_scans")
+        self.floods = BoundedState(max_entries=max_keys, name="flow_floods")
+
+        self.flows_seen = 0
+        self.flows_one_sided = 0
+        self.alerts: Counter = Counter()
+
+    def update(self, records: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Fold in finished flow records; returns the scans / floods they complete."""
+        alerts = []
+        for record in records:
+            self.flows_seen += 1
+            if record["bwd_packets"]:
+                continue  # Answered: neither a probe nor a flood packet
+            self.flows_one_sided += 1
+            ts = record["last_seen"]
+            src, dst, port = record["src_ip"], record["dst_ip"], record["dst_port"]
+
+            alert = self._count(self.scans, src, (dst, port), ts, self.scan_targets, "scan")
+            if alert:
+                alerts.append(alert)
+            alert = self._count(self.floods, f"{dst}:{port}", src, ts, self.flood_sources, "flood")
+            if alert:
+                alerts.append(alert)
+        return alerts
+
+    def _count(self, table: BoundedState, key: str, peer: Any, ts: float, threshold: int,
+               kind: str) -> Optional[Dict[str, Any]]:
+        window = table.get(key)
+        if window is None:
+            window = table[key] = _PeerWindow()
+        peers = window.add(peer, ts, self.horizon, threshold)
+        if peers < threshold or (window.alerted_at is not None and ts - window.alerted_at < self.horizon):
+            return None
+        window.alerted_at = ts
+        self.alerts[kind] += 1
+        first_seen = next(iter(window.peers.values()))
+        logger.debug(f"[FLOWS] {kind} {key}: {peers} unanswered peers in {ts - first_seen:.0f}s")
+        return {"kind": kind, "device": key, "peers": peers, "first_seen": first_seen, "last_seen": ts}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "flows_seen": self.flows_seen,
+            "flows_one_sided": self.flows_one_sided,
+            "alerts": dict(self.alerts),
+            "sources": len(self.scans),
+            "destinations": len(self.floods),
+        }
+
+
+if __name__ == "__main__":
+    # Test: a slow scan (one port every 30 s) and a spoofed flood among normal answered flows
+    import numpy as np
+
+    def flow(ts, src, dst, port, replies=1):
+        return {"src_ip": src, "dst_ip": dst, "dst_port": port, "last_seen": ts, "bwd_packets": replies}
+
+    rng = np.random.default_rng(0)
+    normal = [flow(t, f"192.168.1.{rng.integers(2, 40)}", "10.0.0.2", 554) for t in range(0, 1200, 2)]
+    normal += [flow(t, "192.168.1.7", "224.0.0.251", 5353, replies=0) for t in range(0, 1200, 10)]  # mDNS
+    detector = FlowDetector()
+    assert detector.update(sorted(normal, key=lambda f: f["last_seen"])) == [], "normal traffic must not alert"
+
+    scan = [flow(1200 + 30 * i, "192.168.1.66", "10.0.0.2", 1000 + i, replies=0) for i in range(30)]
+    alerts = detector.update(scan)
+    assert [(a["kind"], a["device"]) for a in alerts] == [("scan", "192.168.1.66")], alerts
+    print(f"slow scan: {alerts[0]['peers']} ports in {alerts[0]['last_seen'] - alerts[0]['first_seen']:.0f}s")
+
+    flood = [flow(2200 + i * 0.001, f"{rng.integers(1, 224)}.{rng.integers(0, 256)}.0.1", "10.0.0.2", 554, replies=0)
+             for i in range(5000)]
+    alerts = detector.update(flood)
+    assert [(a["kind"], a["device"]) for a in alerts] == [("flood", "10.0.0.2:554")], alerts
+    print(f"flood: {alerts[0]['peers']} sources | {detector.get_stats()}")
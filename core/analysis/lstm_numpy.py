@@ -0,0 +1,134 @@
+"""
+NumPy LSTM Autoencoder
+
+Inference-only copy of the ensemble's Keras LSTM-AE
+(LSTM -> RepeatVector -> LSTM(return_sequences) -> TimeDistributed(Dense)).
+The trained weights are copied out once after fit; scoring then runs a
+plain NumPy forward pass, with no TensorFlow import and no per-call
+``predict`` overhead. Results match Keras to float32 rounding.
+
+Keras LSTM cell (gate order i, f, c, o):
+    z = x @ kernel + h @ recurrent_kernel + bias
+    i, f, o = sigmoid(z_i), sigmoid(z_f), sigmoid(z_o)
+    c = f * c + i * act(z_c)
+    h = o * act(c)
+"""
+
+from typing import Dict
+import numpy as np
+
+ACTIVATIONS = {
+    "relu": lambda x: np.maximum(x, 0.0),
+    "tanh": np.tanh,
+    "linear": lambda x: x,
+}
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 0.5 * (np.tanh(0.5 * x) + 1.0)  # Overflow-free
+
+
+class NumpyLSTMAutoencoder:
+    """LSTM-AE forward pass over (N, T, F) float32 arrays."""
+
+    def __init__(self, weights: Dict[str, np.ndarray], activation: str = "relu"):
+        """
+        Args:
+            weights: enc_kernel, enc_recurrent, enc_bias, dec_kernel, dec_recurrent,
+                     dec_bias, out_kernel, out_bias (Keras layouts).
+            activation: LSTM cell / output activation used at training time.
+        """
+        self.weights = {name: np.asarray(value, dtype=np.float32) for name, value in weights.items()}
+        self.activation = activation
+        self.units = self.weights["enc_recurrent"].shape[0]
+
+    @classmethod
+    def from_keras(cls, model) -> "NumpyLSTMAutoencoder":
+        """Copy the weights of a model built by AnomalyEnsemble._build_lstm_ae."""
+        lstms = [layer for layer in model.layers if type(layer).__name__ == "LSTM"]
+        dense = [layer for layer in model.layers if type(layer).__name__ == "TimeDistributed"][0]
+        encoder, decoder = lstms
+        if encoder.recurrent_activation.__name__ != "sigmoid":
+            raise ValueError(f"Unsupported recurrent activation {encoder.recurrent_activation.__name__}")
+        weights = {}
+        for prefix, layer in (("enc", encoder), ("dec", decoder)):
+            kernel, recurrent, bias = layer.get_weights()
+            weights.update({f"{prefix}_kernel": kernel, f"{prefix}_recurrent": recurrent, f"{prefix}_bias": bias})
+        weights["out_kernel"], weights["out_bias"] = dense.get_weights()
+        return cls(weights, activation=encoder.activation.__name__)
+
+    def _run(self, xw: np.ndarray, prefix: str, steps: int) -> np.ndarray:
+        """Unroll one LSTM layer; ``xw`` is the input projection (N, T, 4U) or (N, 4U) if constant."""
+        recurrent, bias = self.weights[f"{prefix}_recurrent"], self.weights[f"{prefix}_bias"]
+        act = ACTIVATIONS[self.activation]
+        u = self.units
+        n = xw.shape[0]
+        h = np.zeros((n, u), dtype=np.float32)
+        c = np.zeros((n, u), dtype=np.float32)
+        out = np.empty((n, steps, u), dtype=np.float32)
+        for t in range(steps):
+            z = (xw[:, t] if xw.ndim == 3 else xw) + h @ recurrent + bias
+            i, f, o = _sigmoid(z[:, :u]), _sigmoid(z[:, u:2 * u]), _sigmoid(z[:, 3 * u:])
+            c = f * c + i * act(z[:, 2 * u:3 * u])
+            h = o * act(c)
+            out[:, t] = h
+        return out
+
+    def predict(self, x: np.ndarray, **_) -> np.ndarray:
+        """Reconstruction of ``x`` (N, T, F); extra keyword arguments (Keras ``verbose``) are ignored."""
+        x = np.asarray(x, dtype=np.float32)
+        n, steps, _features = x.shape
+        w = self.weights
+        encoded = self._run(x @ w["enc_kernel"], "enc", steps)[:, -1]
+        # RepeatVector: the decoder sees the same input every step, so project it once
+        decoded = self._run(encoded @ w["dec_kernel"], "dec", steps)
+        return decoded @ w["out_kernel"] + w["out_bias"]
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"units": self.units, "parameters": int(sum(v.size for v in self.weights.values()))}
+
+
+if __name__ == "__main__":
+    # Test: against Keras when available, else against a per-sample reference loop
+    import time
+
+    rng = np.random.default_rng(0)
+    x = rng.random((256, 5, 13)).astype(np.float32)
+    try:
+        from core.analysis.ensemble import AnomalyEnsemble
+        keras_model = AnomalyEnsemble()._build_lstm_ae((5, 13))
+        keras_model.fit(x, x, epochs=2, verbose=0)
+        ae = NumpyLSTMAutoencoder.from_keras(keras_model)
+        reference = keras_model.predict(x, verbose=0)
+        label = "keras"
+    except ImportError:
+        u, f = 16, 13
+        ae = NumpyLSTMAutoencoder({
+            "enc_kernel": rng.normal(0, 0.3, (f, 4 * u)), "enc_recurrent": rng.normal(0, 0.3, (u, 4 * u)),
+            "enc_bias": rng.normal(0, 0.1, 4 * u), "dec_kernel": rng.normal(0, 0.3, (u, 4 * u)),
+            "dec_recurrent": rng.normal(0, 0.3, (u, 4 * u)), "dec_bias": rng.normal(0, 0.1, 4 * u),
+            "out_kernel": rng.normal(0, 0.3, (u, f)), "out_bias": rng.normal(0, 0.1, f),
+        })
+
+        def cell(xt, h, c, kernel, recurrent, bias):
+            z = xt @ kernel + h @ recurrent + bias
+            sig = lambda v: 1 / (1 + np.exp(-v))
+            c = sig(z[u:2 * u]) * c + sig(z[:u]) * np.maximum(z[2 * u:3 * u], 0)
+            return sig(z[3 * u:]) * np.maximum(c, 0), c
+
+        w = {k: v.astype(np.float64) for k, v in ae.weights.items()}
+        reference = np.empty_like(x)
+        for s in range(len(x)):
+            h = c = np.zeros(u)
+            for t in range(5):
+                h, c = cell(x[s, t], h, c, w["enc_kernel"], w["enc_recurrent"], w["enc_bias"])
+            enc, h, c = h, np.zeros(u), np.zeros(u)
+            for t in range(5):
+                h, c = cell(enc, h, c, w["dec_kernel"], w["dec_recurrent"], w["dec_bias"])
+                reference[s, t] = h @ w["out_kernel"] + w["out_bias"]
+        label = "reference loop"
+
+    started = time.perf_counter()
+    out = ae.predict(x)
+    elapsed = time.perf_counter() - started
+    print(f"max |numpy - {label}| = {np.abs(out - reference).max():.2e} | {len(x)} sequences in {elapsed * 1000:.2f} ms")
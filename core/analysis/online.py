@@ -0,0 +1,199 @@
+"""
+Online Model Updates
+
+Keeps a fitted AnomalyEnsemble tracking slow drift in normal device
+behaviour without retraining. The main loop submits whole windows that
+raised no alert (dropping only individual rows would trim the tail of
+the normal distribution and make every update stricter); a background
+thread wakes every ``interval`` seconds and, once enough samples are
+buffered, applies one ``partial_fit`` step to a copy of the model and
+swaps the copy in. Scoring never waits on an update and never sees a
+half-updated model.
+
+The thread lowers its own scheduling priority (Linux ``nice`` per thread)
+so updates yield to capture and scoring.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+import numpy as np
+from loguru import logger
+
+
+class OnlineUpdater:
+    """Background incremental updates for an AnomalyEnsemble."""
+
+    def __init__(
+        self,
+        model,
+        interval: float = 300.0,
+        min_samples: int = 512,
+        max_samples: int = 20_000,
+        rate: float = 0.05,
+        lstm_epochs: int = 1,
+        on_update: Optional[Callable[[Any], None]] = None,
+        nice: int = 19,
+    ):
+        """
+        Args:
+            model: Fitted AnomalyEnsemble; read the current one from ``.model``.
+            interval: Seconds between update attempts.
+            min_samples: Benign samples needed for an update (also enough for IsolationForest trees).
+            max_samples: Most recent samples kept between updates (older ones dropped).
+            rate: Weight of the new samples in each update (see AnomalyEnsemble.partial_fit).
+            lstm_epochs: Warm-started LSTM-AE epochs per update (0: never; needs the Keras model).
+            on_update: Called with the new model after each update (e.g. to save it).
+            nice: Priority increment for the update thread.
+        """
+        self.model = model
+        self.interval = interval
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.rate = rate
+        self.lstm_epochs = lstm_epochs
+        self.on_update = on_update
+        self.nice = nice
+
+        self._lock = threading.Lock()
+        self._buffer: deque = deque() # (X, Seq_X or None) chunks, oldest first
+        self._buffered = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.samples_submitted = 0
+        self.samples_dropped = 0
+        self.updates = 0
+        self.failures = 0
+        self.last_update_seconds = 0.0
+        self.last_update_at: Optional[float] = None
+
+    # --- Producer side (main loop) ---
+
+    def submit(self, X: np.ndarray, Sequence_X: Optional[np.ndarray] = None):
+        """Buffer benign samples (copied: callers usually pass views of the sequence buffer)."""
+        if not len(X):
+            return
+        chunk = (np.array(X, copy=True), None if Sequence_X is None else np.array(Sequence_X, copy=True))
+        with self._lock:
+            self._buffer.append(chunk)
+            self._buffered += len(X)
+            self.samples_submitted += len(X)
+            while self._buffered - len(self._buffer[0][0]) >= self.max_samples:
+                dropped = self._buffer.popleft()
+                self._buffered -= len(dropped[0])
+                self.samples_dropped += len(dropped[0])
+
+    # --- Updates ---
+
+    def _take(self):
+        with self._lock:
+            if self._buffered < self.min_samples:
+                return None
+            chunks, self._buffer, self._buffered = list(self._buffer), deque(), 0
+        X = np.vstack([c[0] for c in chunks])
+        # Sequences only if every chunk has them (rows must stay aligned with X)
+        sequences = [c[1] for c in chunks]
+        Seq_X = np.vstack(sequences) if all(s is not None for s in sequences) else None
+        return X[-self.max_samples:], None if Seq_X is None else Seq_X[-self.max_samples:]
+
+    def update(self) -> bool:
+        """Apply one update if enough samples are buffered; returns True if the model changed."""
+        taken = self._take()
+        if taken is None:
+            return False
+        X, Seq_X = taken
+        started = time.perf_counter()
+        try:
+            updated = self.model.fork()
+            updated.partial_fit(X, Seq_X, rate=self.rate, lstm_epochs=self.lstm_epochs)
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"[ONLINE] Model update failed, keeping the current model: {e}")
+            return False
+        self.model = updated # Atomic swap: scoring picks it up on its next read
+        self.updates += 1
+        self.last_update_seconds = time.perf_counter() - started
+        self.last_update_at = time.time()
+        logger.info(f"[ONLINE] Model updated on {len(X)} benign samples in {self.last_update_seconds:.2f}s "
+                    f"(update {updated.updates})")
+        if self.on_update is not None:
+            try:
+                self.on_update(updated)
+            except Exception as e:
+                logger.error(f"[ONLINE] on_update failed: {e}")
+        return True
+
+    # --- Thread ---
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="online-updater", daemon=True)
+        self._thread.start()
+        logger.info(f"[ONLINE] Incremental updates every {self.interval:.0f}s (min {self.min_samples} samples)")
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _loop(self):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.nice) # Linux: per-thread nice
+        except (AttributeError, OSError) as e:
+            logger.debug(f"[ONLINE] Could not lower update thread priority: {e}")
+        while not self._stop.wait(self.interval):
+            self.update()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            buffered = self._buffered
+        return {
+            "updates": self.updates,
+            "failures": self.failures,
+            "buffered": buffered,
+            "samples_submitted": self.samples_submitted,
+            "samples_dropped": self.samples_dropped,
+            "last_update_seconds": round(self.last_update_seconds, 3),
+            "last_update_at": self.last_update_at,
+        }
+
+
+if __name__ == "__main__":
+    # Test: fit on normal traffic, let it drift slowly, and let the background thread follow
+    from core.analysis.ensemble import AnomalyEnsemble
+
+    rng = np.random.default_rng(0)
+    mixing = rng.normal(size=(13, 13)) * 0.3
+
+    def normal(n, shift=0.0):
+        return rng.normal(size=(n, 13)) @ mixing + shift
+
+    model = AnomalyEnsemble()
+    model.fit(normal(3000))
+    # Re-expressing the GMM for a new scaler must not move calibrated GMM scores
+    probe, moved = normal(500), model.fork()
+    moved._update_scaler(normal(600) * 3 + 1, rate=0.3)
+    assert np.allclose(moved.score(probe)["gmm"], model.score(probe)["gmm"]), "scaler update moved GMM scores"
+    drift = np.linspace(0, 1.5, 13)
+    updater = OnlineUpdater(model, interval=0.05, min_samples=256, rate=0.1)
+    print(f"drifted median score before: {np.median(updater.model.score(normal(2000, drift))['aggregate']):.3f}")
+    updater.start()
+    for step in range(1, 1201):
+        # Slow drift over 20-device windows; only windows without an alert are submitted (whole)
+        window = normal(20, drift * min(step, 1000) / 1000)
+        if updater.model.window_score(updater.model.score(window)["aggregate"]) < 0.99:
+            updater.submit(window)
+        time.sleep(0.002)
+    updater.stop()
+    after = np.median(updater.model.score(normal(2000, drift))["aggregate"])
+    outliers = updater.model.score(normal(5, drift) + 8)["aggregate"]
+    print(f"drifted median score after:  {after:.3f} | {updater.get_stats()}")
+    print(f"outliers still flagged: {outliers.round(3)}")
+    assert updater.updates and not updater.failures, updater.get_stats()
+    assert after < 0.7, "the model did not follow the drift"
+    assert (outliers >= 0.99).all(), "updates must not absorb real outliers"
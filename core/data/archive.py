@@ -0,0 +1,274 @@
+"""
+Columnar Packet Archive
+
+Append-only on-disk packet history for retraining and forensics. Packets
+are stored as raw PACKET_DTYPE records in segment files and read back
+through np.memmap, so a time window comes back as a PacketBatch (NumPy
+columns) without per-row Python objects or SQL round-trips.
+
+Each segment has a small index of blocks (offset, count, min/max
+timestamp). A window read touches only the segments and blocks whose time
+range overlaps it, then filters those blocks with one vectorized mask.
+Timestamps need not be sorted (fanout workers interleave), only roughly
+local. Whole segments are deleted for retention.
+
+Layout:
+    <root>/seg_000001.bin   records
+    <root>/seg_000001.idx   block index (BLOCK_DTYPE)
+"""
+
+import os
+import threading
+from typing import Any, Dict, List
+import numpy as np
+
+from core.data.batch import PACKET_DTYPE, PacketBatch
+
+BLOCK_DTYPE = np.dtype([
+    ("offset", "<u8"),  # First record of the block in the segment
+    ("count", "<u4"),
+    ("min_ts", "<f8"),
+    ("max_ts", "<f8"),
+])
+
+
+class _Segment:
+    __slots__ = ("number", "path", "blocks", "records")
+
+    def __init__(self, number: int, path: str, blocks: np.ndarray):
+        self.number = number
+        self.path = path
+        self.blocks = blocks
+        self.records = int(blocks["count"].sum()) if len(blocks) else 0
+
+    @property
+    def min_ts(self) -> float:
+        return float(self.blocks["min_ts"].min()) if len(self.blocks) else np.inf
+
+    @property
+    def max_ts(self) -> float:
+        return float(self.blocks["max_ts"].max()) if len(self.blocks) else -np.inf
+
+
+class PacketArchive:
+    """
+    Segmented, memory-mapped packet archive.
+
+    ``append`` is called from one writer; ``read_window`` may run
+    concurrently from other threads (readers only see whole blocks).
+    """
+
+    def __init__(self, root: str = "sentra_archive", segment_packets: int = 1 << 22, block_packets: int = 8192):
+        """
+        Args:
+            root: Archive directory (created if missing).
+            segment_packets: Records per segment file (~26 B each) before a new one starts.
+            block_packets: Records per index block; smaller = finer window reads, bigger index.
+        """
+        self.root = root
+        self.segment_packets = segment_packets
+        self.block_packets = block_packets
+        os.makedirs(root, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._segments: List[_Segment] = []
+        self._pending: List[np.ndarray] = []  # Records not yet written as a block
+        self._pending_count = 0
+        self.packets_appended = 0
+        self.segments_dropped = 0
+        self._load()
+
+    # --- Layout ---
+
+    def _path(self, number: int, ext: str) -> str:
+        return os.path.join(self.root, f"seg_{number:06d}.{ext}")
+
+    def _load(self):
+        numbers = sorted(int(name[4:10]) for name in os.listdir(self.root)
+                         if name.startswith("seg_") and name.endswith(".idx"))
+        for number in numbers:
+            bin_path, idx_path = self._path(number, "bin"), self._path(number, "idx")
+            raw = np.fromfile(idx_path, dtype=BLOCK_DTYPE)
+            size = os.path.getsize(bin_path) if os.path.exists(bin_path) else 0
+            # Crash between the two writes: drop index entries past the end of the data...
+            blocks = raw[raw["offset"] + raw["count"] <= size // PACKET_DTYPE.itemsize]
+            if len(blocks) < len(raw):
+                blocks.tofile(idx_path)
+            # ...and records past the last index entry (whole or partial), so new blocks start where
+            # the index says they do and the file stays a whole number of records for np.memmap
+            end = int((blocks["offset"] + blocks["count"]).max()) * PACKET_DTYPE.itemsize if len(blocks) else 0
+            if size > end:
+                os.truncate(bin_path, end)
+            self._segments.append(_Segment(number, bin_path, blocks))
+
+    # --- Writes ---
+
+    def append(self, batch: PacketBatch):
+        """Queue a batch; full blocks are written to the current segment."""
+        if not len(batch):
+            return
+        self._pending.append(batch.data)
+        self._pending_count += len(batch)
+        self.packets_appended += len(batch)
+        if self._pending_count >= self.block_packets:
+            self.flush()
+
+    def flush(self):
+        """Write queued records as one block (any size)."""
+        if not self._pending_count:
+            return
+        data = np.concatenate(self._pending) if len(self._pending) > 1 else self._pending[0]
+        self._pending, self._pending_count = [], 0
+        while len(data):
+            segment = self._writable()
+            room = self.segment_packets - segment.records
+            chunk, data = data[:room], data[room:]
+            self._write_block(segment, chunk)
+
+    def _writable(self) -> _Segment:
+        if not self._segments or self._segments[-1].records >= self.segment_packets:
+            number = self._segments[-1].number + 1 if self._segments else 1
+            with self._lock:
+                self._segments.append(_Segment(number, self._path(number, "bin"), np.zeros(0, dtype=BLOCK_DTYPE)))
+        return self._segments[-1]
+
+    def _write_block(self, segment: _Segment, records: np.ndarray):
+        ts = records["timestamp"]
+        block = np.array([(segment.records, len(records), ts.min(), ts.max())], dtype=BLOCK_DTYPE)
+        # Data first, then index: a reader never sees an index entry without its records
+        with open(segment.path, "ab") as f:
+            f.write(np.ascontiguousarray(records, dtype=PACKET_DTYPE).tobytes())
+        with open(self._path(segment.number, "idx"), "ab") as f:
+            f.write(block.tobytes())
+        with self._lock:
+            segment.blocks = np.concatenate([segment.blocks, block])
+            segment.records += len(records)
+
+    # --- Reads ---
+
+    def read_window(self, start_ts: float, end_ts: float) -> PacketBatch:
+        """Packets with start_ts <= timestamp < end_ts as one columnar batch (written blocks only)."""
+        with self._lock:
+            segments = [(s.path, s.blocks) for s in self._segments]
+        parts = []
+        for path, blocks in segments:
+            hit = blocks[(blocks["min_ts"] < end_ts) & (blocks["max_ts"] >= start_ts)]
+            if not len(hit):
+                continue
+            records = np.memmap(path, dtype=PACKET_DTYPE, mode="r")
+            for lo, hi in _runs(hit):
+                view = records[lo:hi]
+                ts = view["timestamp"]
+                parts.append(view[(ts >= start_ts) & (ts < end_ts)])
+        if not parts:
+            return PacketBatch()
+        return PacketBatch(np.concatenate(parts) if len(parts) > 1 else np.array(parts[0]))
+
+    def time_range(self) -> tuple:
+        """(oldest, newest) archived timestamp, or (None, None) when empty."""
+        with self._lock:
+            lo = min((s.min_ts for s in self._segments if s.records), default=None)
+            hi = max((s.max_ts for s in self._segments if s.records), default=None)
+        return lo, hi
+
+    # --- Retention ---
+
+    def drop_before(self, ts: float) -> int:
+        """Delete whole segments whose newest packet is older than ``ts``; returns how many."""
+        with self._lock:
+            # Never the segment being written
+            expired = [s for s in self._segments[:-1] if s.max_ts < ts]
+            self._segments = [s for s in self._segments if s not in expired]
+        for segment in expired:
+            for ext in ("bin", "idx"):
+                try:
+                    os.remove(self._path(segment.number, ext))
+                except FileNotFoundError:
+                    pass
+        self.segments_dropped += len(expired)
+        return len(expired)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            records = sum(s.records for s in self._segments)
+            segments = len(self._segments)
+        lo, hi = self.time_range()
+        return {
+            "segments": segments,
+            "packets": records,
+            "pending": self._pending_count,
+            "bytes": records * PACKET_DTYPE.itemsize,
+            "oldest": lo,
+            "newest": hi,
+            "segments_dropped": self.segments_dropped,
+        }
+
+
+def _runs(blocks: np.ndarray) -> List[tuple]:
+    """Merge adjacent blocks into contiguous (start, stop) record ranges."""
+    runs = []
+    for offset, count in zip(blocks["offset"].tolist(), blocks["count"].tolist()):
+        if runs and runs[-1][1] == offset:
+            runs[-1] = (runs[-1][0], offset + count)
+        else:
+            runs.append((offset, offset + count))
+    return runs
+
+
+if __name__ == "__main__":
+    # Test: archive 5M packets (about 1.4h of traffic), then read 1-minute and 10-minute windows
+    import shutil
+    import time
+
+    root = "test_archive"
+    shutil.rmtree(root, ignore_errors=True)
+    archive = PacketArchive(root, segment_packets=1 << 20)
+    rng = np.random.default_rng(0)
+    started = time.perf_counter()
+    for chunk in range(500):
+        data = np.zeros(10_000, dtype=PACKET_DTYPE)
+        data["timestamp"] = 1_700_000_000 + chunk + np.sort(rng.random(10_000)) * 1.2  # Slight overlap
+        data["src_ip"] = 0xC0A80100 + rng.integers(1, 50, 10_000)
+        data["dst_ip"] = 0x08080808
+        data["size"] = rng.integers(60, 1500, 10_000)
+        data["protocol"] = 6
+        archive.append(PacketBatch(data))
+    archive.flush()
+    print(f"wrote in {time.perf_counter() - started:.2f}s | {archive.get_stats()}")
+
+    for seconds in (60, 600):
+        started = time.perf_counter()
+        window = archive.read_window(1_700_000_100, 1_700_000_100 + seconds)
+        elapsed = time.perf_counter() - started
+        assert window.timestamp.min() >= 1_700_000_100 and window.timestamp.max() < 1_700_000_100 + seconds
+        print(f"{seconds:>4}s window: {len(window):,} packets in {elapsed * 1000:.1f} ms")
+
+    reopened = PacketArchive(root)
+    print(f"reopened: {reopened.get_stats()['packets']:,} packets; dropped {reopened.drop_before(1_700_000_300)} segments")
+
+    # Crash recovery: records written past the last index entry (50 whole + 1 partial) are cut on reopen
+    last = reopened._segments[-1]
+    with open(last.path, "ab") as f:
+        f.write(np.zeros(50, dtype=PACKET_DTYPE).tobytes() + b"\x01" * 7)
+    recovered = PacketArchive(root)
+    data = np.zeros(100, dtype=PACKET_DTYPE)
+    data["timestamp"] = 1_800_000_000 + np.arange(100)
+    recovered.append(PacketBatch(data))
+    recovered.flush()
+    window = recovered.read_window(1_800_000_000, 1_800_000_100)
+    assert len(window) == 100 and (window.timestamp == data["timestamp"]).all()
+    assert os.path.getsize(last.path) == recovered._segments[-1].records * PACKET_DTYPE.itemsize
+    print(f"recovered after a torn write: {len(window)} new packets read back")
+
+    # Index entries past the data (lost data pages): dropped, and the index rewritten for the next append
+    packets = recovered.get_stats()["packets"]
+    os.truncate(last.path, os.path.getsize(last.path) - 10 * PACKET_DTYPE.itemsize)
+    recovered = PacketArchive(root)
+    assert recovered.get_stats()["packets"] == packets - 100  # The last (100-packet) block is gone
+    data["timestamp"] += 1000
+    recovered.append(PacketBatch(data))
+    recovered.flush()
+    assert len(PacketArchive(root).read_window(1_800_001_000, 1_800_001_100)) == 100
+    assert os.path.getsize(recovered._path(last.number, "idx")) == len(recovered._segments[-1].blocks) * BLOCK_DTYPE.itemsize
+    print("recovered after a lost data tail: index rewritten")
+    shutil.rmtree(root, ignore_errors=True)
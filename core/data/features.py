@@ -1,80 +1,185 @@
-import pandas as pd
 import numpy as np
-from typing import List, Dict, Any
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Union
 from loguru import logger
-from collections import Counter
+
+from core.data.batch import PacketBatch, ips_to_str, PROTO_TCP, PROTO_UDP
+from core.perception.decoder import parse_flags, TCP_SYN, TCP_ACK
+
+if TYPE_CHECKING:
+    import pandas as pd  # Imported on first use: it is slow and not needed to start capture
+
+FEATURE_COLUMNS = [
+    'packet_count', 'bytes_total', 'bytes_avg',
+    'unique_dst_ips', 'unique_dst_ports',
+    'proto_tcp_ratio', 'proto_udp_ratio',
+    'port_554_count', 'port_80_count', 'port_22_count',
+    'reserved_port_ratio', 'syn_count', 'syn_ratio',
+]
+
+
+def _count_distinct(device: np.ndarray, values: np.ndarray, n_devices: int) -> np.ndarray:
+    """Distinct non-negative ``values`` per device code (values must fit in 32 bits)."""
+    keys = np.unique((device.astype(np.int64) << 32) | values.astype(np.int64))
+    return np.bincount(keys >> 32, minlength=n_devices)
+
 
 class FeatureExtractor:
     def __init__(self):
         pass
 
-    def extract_features(self, packets: List[Dict[str, Any]]) -> pd.DataFrame:
+    def extract_features(self, packets: Union[PacketBatch, List[Dict[str, Any]]]) -> "pd.DataFrame":
         """
-        Convert a list of raw packet dicts into a DataFrame of features,
-        aggregated by Source IP (Device).
+        Convert a PacketBatch (or a list of raw packet dicts) into a DataFrame
+        of features, aggregated by Source IP (Device).
+
+        All devices are aggregated in one pass of ``np.bincount`` calls over
+        per-packet device codes; there is no per-group Python work.
         """
-        if not packets:
+        if not len(packets):
+            import pandas as pd
             return pd.DataFrame()
 
+        if isinstance(packets, PacketBatch):
+            return self._from_batch(packets)
+        return self._from_records(packets)
+
+    def _from_batch(self, batch: PacketBatch) -> "pd.DataFrame":
+        uniq, device = np.unique(batch.src_ip, return_inverse=True)
+        devices = ips_to_str(uniq)
+        # Same row order as grouping on the dotted-quad strings
+        order = np.argsort(devices, kind='stable')
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+
+        proto = batch.protocol
+        has_ports = batch.has_ports
+        return self._aggregate(
+            index=[devices[i] for i in order],
+            device=rank[device.ravel()],
+            size=batch.size.astype(np.int64),
+            dst=batch.dst_ip,
+            dst_port=batch.dst_port,
+            has_port=has_ports,
+            is_tcp=proto == PROTO_TCP,
+            is_udp=proto == PROTO_UDP,
+            has_proto=np.ones(len(batch), dtype=bool),
+            flags=batch.flags,
+        )
+
+    def _from_records(self, packets: List[Dict[str, Any]]) -> "pd.DataFrame":
+        import pandas as pd
         df = pd.DataFrame(packets)
-        
-        # Ensure numeric columns
-        df['size'] = pd.to_numeric(df['size'], errors='coerce').fillna(0)
-        
-        # Group by Source IP (The Device)
-        grouped = df.groupby('src_ip')
-        
-        features_list = []
-        
-        for src_ip, group in grouped:
-            feat = {}
-            feat['device_ip'] = src_ip
-            
-            # Volume
-            feat['packet_count'] = len(group)
-            feat['bytes_total'] = group['size'].sum()
-            feat['bytes_avg'] = group['size'].mean()
-            
-            # Diversity
-            feat['unique_dst_ips'] = group['dst_ip'].nunique()
-            feat['unique_dst_ports'] = group['dst_port'].nunique()
-            
-            # Protocols
-            proto_counts = group['proto_name'].value_counts(normalize=True)
-            feat['proto_tcp_ratio'] = proto_counts.get('TCP', 0.0)
-            feat['proto_udp_ratio'] = proto_counts.get('UDP', 0.0)
-            
-            # Specific Vulnerable Ports (Dynamic Discovery)
-            # We track these specifically so the model learns "RTSP Floods" vs "Web Browsing"
-            feat['port_554_count'] = group['dst_port'].apply(lambda x: 1 if x == 554 else 0).sum()
-            feat['port_80_count'] = group['dst_port'].apply(lambda x: 1 if x == 80 else 0).sum()
-            feat['port_22_count'] = group['dst_port'].apply(lambda x: 1 if x == 22 else 0).sum()
-            
-            # Reserved Ports (< 1024) Ratio
-            reserved_count = group['dst_port'].apply(lambda x: 1 if x < 1024 else 0).sum()
-            feat['reserved_port_ratio'] = reserved_count / len(group)
-
-            # Flags (Scan detection)
-            # Check for SYN only (naive check)
-            if 'flags' in group.columns:
-                # Scapy flags are strings like 'S', 'PA', etc.
-                syn_count = group['flags'].apply(lambda x: 'S' in str(x) and 'A' not in str(x)).sum()
-                feat['syn_count'] = syn_count
-                feat['syn_ratio'] = syn_count / len(group)
+        # Rows without a source IP belong to no device
+        df = df[df['src_ip'].notna()]
+        if df.empty:
+            return pd.DataFrame()
+
+        device, devices = pd.factorize(df['src_ip'], sort=True)
+        size = pd.to_numeric(df['size'], errors='coerce').fillna(0).to_numpy()
+        dst, _ = pd.factorize(df['dst_ip']) if 'dst_ip' in df.columns else (np.full(len(df), -1), None)
+
+        if 'dst_port' in df.columns:
+            ports = pd.to_numeric(df['dst_port'], errors='coerce').to_numpy(dtype=float)
+            has_port = ~np.isnan(ports)
+            dst_port = np.where(has_port, ports, 0).astype(np.int64)
+        else:
+            has_port = np.zeros(len(df), dtype=bool)
+            dst_port = np.zeros(len(df), dtype=np.int64)
+
+        if 'proto_name' in df.columns:
+            proto = df['proto_name']
+            is_tcp, is_udp, has_proto = (proto == 'TCP').to_numpy(), (proto == 'UDP').to_numpy(), proto.notna().to_numpy()
+        else:
+            is_tcp = is_udp = has_proto = np.zeros(len(df), dtype=bool)
+
+        # Flags are an int bitmask; older records may still hold Scapy strings like 'S', 'PA'
+        flags = None
+        if 'flags' in df.columns:
+            if pd.api.types.is_numeric_dtype(df['flags']):
+                flags = df['flags'].fillna(0).to_numpy(dtype=np.int64)
             else:
-                feat['syn_count'] = 0
-                feat['syn_ratio'] = 0.0
+                flags = df['flags'].map(parse_flags).to_numpy(dtype=np.int64)
+
+        return self._aggregate(
+            index=list(devices), device=device, size=size,
+            dst=np.where(dst >= 0, dst, 0), dst_valid=dst >= 0,
+            dst_port=dst_port, has_port=has_port,
+            is_tcp=is_tcp, is_udp=is_udp, has_proto=has_proto, flags=flags,
+        )
+
+    def _aggregate(
+        self,
+        index: List[str],
+        device: np.ndarray,
+        size: np.ndarray,
+        dst: np.ndarray,
+        dst_port: np.ndarray,
+        has_port: np.ndarray,
+        is_tcp: np.ndarray,
+        is_udp: np.ndarray,
+        has_proto: np.ndarray,
+        flags: Optional[np.ndarray],
+        dst_valid: Optional[np.ndarray] = None,
+    ) -> "pd.DataFrame":
+        """Per-device features from per-packet columns and device codes 0..n-1."""
+        import pandas as pd
+        n = len(index)
+
+        def count(mask: np.ndarray) -> np.ndarray:
+            return np.bincount(device[mask], minlength=n)
+
+        packet_count = np.bincount(device, minlength=n)
+        bytes_total = np.bincount(device, weights=size, minlength=n)
+        if np.issubdtype(size.dtype, np.integer):
+            bytes_total = bytes_total.astype(np.int64)
+        proto_seen = count(has_proto)
+
+        # Specific Vulnerable Ports (Dynamic Discovery)
+        # We track these specifically so the model learns "RTSP Floods" vs "Web Browsing"
+        port_554 = count(has_port & (dst_port == 554))
+        port_80 = count(has_port & (dst_port == 80))
+        port_22 = count(has_port & (dst_port == 22))
+        reserved = count(has_port & (dst_port < 1024))
+
+        dst_mask = dst_valid if dst_valid is not None else np.ones(len(device), dtype=bool)
+        unique_dst_ips = _count_distinct(device[dst_mask], dst[dst_mask], n)
+        unique_dst_ports = _count_distinct(device[has_port], dst_port[has_port], n)
+
+        # Flags (Scan detection): SYN set without ACK
+        if flags is not None:
+            syn_count = count((flags & (TCP_SYN | TCP_ACK)) == TCP_SYN)
+            syn_ratio = syn_count / packet_count
+        else:
+            syn_count = np.zeros(n, dtype=np.int64)
+            syn_ratio = np.zeros(n)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            tcp_ratio = np.where(proto_seen > 0, count(is_tcp) / proto_seen, 0.0)
+            udp_ratio = np.where(proto_seen > 0, count(is_udp) / proto_seen, 0.0)
 
-            features_list.append(feat)
-            
-        return pd.DataFrame(features_list).set_index('device_ip')
+        return pd.DataFrame({
+            'packet_count': packet_count,
+            'bytes_total': bytes_total,
+            'bytes_avg': bytes_total / packet_count,
+            'unique_dst_ips': unique_dst_ips,
+            'unique_dst_ports': unique_dst_ports,
+            'proto_tcp_ratio': tcp_ratio,
+            'proto_udp_ratio': udp_ratio,
+            'port_554_count': port_554,
+            'port_80_count': port_80,
+            'port_22_count': port_22,
+            'reserved_port_ratio': reserved / packet_count,
+            'syn_count': syn_count,
+            'syn_ratio': syn_ratio,
+        }, index=pd.Index(index, name='device_ip'))
 
 if __name__ == "__main__":
     # Test
     sample = [
-        {"src_ip": "10.0.0.1", "dst_ip": "8.8.8.8", "size": 100, "proto_name": "TCP", "dst_port": 80, "flags": "S"},
-        {"src_ip": "10.0.0.1", "dst_ip": "8.8.8.8", "size": 100, "proto_name": "TCP", "dst_port": 443, "flags": "S"},
-        {"src_ip": "10.0.0.2", "dst_ip": "1.1.1.1", "size": 500, "proto_name": "UDP", "dst_port": 53, "flags": ""},
+        {"src_ip": "10.0.0.1", "dst_ip": "8.8.8.8", "size": 100, "proto_name": "TCP", "dst_port": 80, "flags": TCP_SYN},
+        {"src_ip": "10.0.0.1", "dst_ip": "8.8.8.8", "size": 100, "proto_name": "TCP", "dst_port": 443, "flags": TCP_SYN},
+        {"src_ip": "10.0.0.2", "dst_ip": "1.1.1.1", "size": 500, "proto_name": "UDP", "dst_port": 53},
     ]
     fe = FeatureExtractor()
     print(fe.extract_features(sample))
+    print(fe.extract_features(PacketBatch.from_records(sample)))
@@ -0,0 +1,395 @@
+"""
+Bidirectional Flow Table
+
+Tracks flows keyed on the normalized 5-tuple, so both directions of a
+conversation land in the same entry. For each flow it keeps per-direction
+packet / byte counts, inter-arrival statistics (Welford) and TCP flag
+counts. Flows expire on an idle timeout (no packets for N seconds), an
+active timeout (flow older than N seconds) or a TCP close (RST, or FIN in
+both directions), and are then emitted as finished flow records.
+
+Expiry runs on a hashed timing wheel: a flow is filed in one slot when it
+is created (and again only if a TCP close pulls its deadline in), packets
+never touch the wheel, and a slot that fires re-files flows whose deadline
+has moved on. Timer work is O(1) amortized per flow.
+"""
+
+import math
+from collections import Counter
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+import numpy as np
+
+from core.data.batch import PacketBatch, as_batch, int_to_ip, PROTO_TCP
+from core.data.state import BoundedState
+from core.perception.decoder import TCP_FIN, TCP_SYN, TCP_RST, TCP_PSH, TCP_ACK, TCP_URG, PROTO_NAMES
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+FlowKey = Tuple[int, int]  # (lo_ip << 32 | hi_ip, lo_port << 24 | hi_port << 8 | proto)
+
+FLOW_BYTES = 512  # Approximate size of one Flow: slotted object, boxed fields, flags list
+
+FLAG_BITS = (("syn", TCP_SYN), ("fin", TCP_FIN), ("rst", TCP_RST), ("psh", TCP_PSH), ("ack", TCP_ACK), ("urg", TCP_URG))
+
+
+class Flow:
+    """State of one bidirectional flow. The forward direction is the initiator's."""
+
+    __slots__ = (
+        "key", "src_ip", "src_port", "dst_ip", "dst_port", "protocol",
+        "first_seen", "last_seen", "fwd_packets", "fwd_bytes", "bwd_packets", "bwd_bytes",
+        "iat_count", "iat_mean", "iat_m2", "iat_min", "iat_max",
+        "flags", "fwd_fin", "bwd_fin", "closing",
+    )
+
+    def __init__(self, key: FlowKey, src_ip: int, src_port: int, dst_ip: int, dst_port: int, protocol: int, ts: float):
+        self.key = key
+        self.src_ip, self.src_port = src_ip, src_port
+        self.dst_ip, self.dst_port = dst_ip, dst_port
+        self.protocol = protocol
+        self.first_seen = self.last_seen = ts
+        self.fwd_packets = self.fwd_bytes = self.bwd_packets = self.bwd_bytes = 0
+        self.iat_count = 0
+        self.iat_mean = self.iat_m2 = 0.0
+        self.iat_min, self.iat_max = math.inf, 0.0
+        self.flags = [0] * len(FLAG_BITS)  # Counts in FLAG_BITS order
+        self.fwd_fin = self.bwd_fin = 0
+        self.closing = False
+
+    def add_iat(self, count: int, mean: float, m2: float, lo: float, hi: float):
+        """Merge a partial inter-arrival summary (Chan et al.)."""
+        if not count:
+            return
+        n = self.iat_count + count
+        delta = mean - self.iat_mean
+        self.iat_m2 += m2 + delta * delta * self.iat_count * count / n
+        self.iat_mean += delta * count / n
+        self.iat_count = n
+        self.iat_min = min(self.iat_min, lo)
+        self.iat_max = max(self.iat_max, hi)
+
+    def deadline(self, idle_timeout: float, active_timeout: float) -> float:
+        if self.closing:
+            return self.last_seen
+        return min(self.last_seen + idle_timeout, self.first_seen + active_timeout)
+
+    def record(self, reason: str) -> Dict[str, Any]:
+        """Finished flow record."""
+        return {
+            "src_ip": int_to_ip(self.src_ip),
+            "src_port": self.src_port,
+            "dst_ip": int_to_ip(self.dst_ip),
+            "dst_port": self.dst_port,
+            "protocol": self.protocol,
+            "proto_name": PROTO_NAMES.get(self.protocol, "OTHER"),
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+            "duration": self.last_seen - self.first_seen,
+            "fwd_packets": self.fwd_packets,
+            "fwd_bytes": self.fwd_bytes,
+            "bwd_packets": self.bwd_packets,
+            "bwd_bytes": self.bwd_bytes,
+            "iat_mean": self.iat_mean,
+            "iat_std": math.sqrt(self.iat_m2 / self.iat_count) if self.iat_count else 0.0,
+            "iat_min": self.iat_min if self.iat_count else 0.0,
+            "iat_max": self.iat_max,
+            **{f"{name}_count": count for (name, _), count in zip(FLAG_BITS, self.flags)},
+            "end_reason": reason,
+        }
+
+
+class TimerWheel:
+    """
+    Hashed timing wheel of ``slots`` buckets, each ``tick`` seconds wide.
+    Deadlines beyond one rotation wait in their bucket and are re-checked
+    when it comes round again.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 512):
+        self.tick = tick
+        self.slots = slots
+        self._buckets: List[List[FlowKey]] = [[] for _ in range(slots)]
+        self._now: Optional[int] = None  # last tick processed
+
+    def _tick_of(self, t: float) -> int:
+        return int(t // self.tick)
+
+    def start(self, now: float):
+        """Set the wheel's clock (first call only)."""
+        if self._now is None:
+            self._now = self._tick_of(now) - 1
+
+    def schedule(self, key: FlowKey, deadline: float):
+        tick = self._tick_of(deadline)
+        if self._now is not None and tick <= self._now:
+            tick = self._now + 1  # Already due: fire on the next advance
+        self._buckets[tick % self.slots].append(key)
+
+    def advance(self, now: float) -> List[Tuple[int, List[FlowKey]]]:
+        """Pop the buckets for every tick up to ``now`` as (tick, keys)."""
+        target = self._tick_of(now)
+        if self._now is None:
+            self._now = target - 1
+        if target <= self._now:
+            return []
+        # One full rotation visits every bucket; no need to walk idle gaps tick by tick
+        start = max(self._now + 1, target - self.slots + 1)
+        fired = []
+        for tick in range(start, target + 1):
+            bucket = self._buckets[tick % self.slots]
+            if bucket:
+                self._buckets[tick % self.slots] = []
+                fired.append((tick, bucket))
+        self._now = target
+        return fired
+
+
+class FlowTable:
+    """
+    Normalized 5-tuple flow table with idle / active timeouts.
+
+    ``update`` folds in a PacketBatch (vectorized per flow); ``advance``
+    returns flows that have expired by the given event time.
+    """
+
+    def __init__(
+        self,
+        idle_timeout: float = 30.0,
+        active_timeout: float = 300.0,
+        tick: float = 1.0,
+        wheel_slots: int = 512,
+        max_flows: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        """
+        Args:
+            idle_timeout: Seconds without packets before a flow ends.
+            active_timeout: Max flow lifetime before a record is emitted.
+            tick: Timer resolution in seconds.
+            wheel_slots: Timer wheel buckets (span = tick * wheel_slots).
+            max_flows: Max flows tracked; least recently active flows are
+                       ended early (end_reason "evicted").
+            max_bytes: Approximate memory budget for the table.
+        """
+        self.idle_timeout = idle_timeout
+        self.active_timeout = active_timeout
+        # Timeouts are event-time, so the table bounds only count / memory (no TTL)
+        self.flows = BoundedState(max_entries=max_flows, max_bytes=max_bytes, sizeof=lambda key, flow: FLOW_BYTES,
+                                  on_evict=self._evicted, name="flows")
+        self._evicted_records: List[Dict[str, Any]] = []
+        self.wheel = TimerWheel(tick=tick, slots=wheel_slots)
+        self.max_event_time = -math.inf
+
+        self.flows_created = 0
+        self.flows_expired: Counter = Counter()
+
+    def __len__(self) -> int:
+        return len(self.flows)
+
+    def update(self, packets):
+        """Fold a PacketBatch (or list of packet dicts) into the table."""
+        batch = as_batch(packets)
+        if not len(batch):
+            return
+
+        src = batch.src_ip.astype(np.uint64)
+        dst = batch.dst_ip.astype(np.uint64)
+        sport = batch.src_port.astype(np.uint64)
+        dport = batch.dst_port.astype(np.uint64)
+        proto = batch.protocol.astype(np.uint64)
+        ts = batch.timestamp
+        size = batch.size.astype(np.int64)
+        flags = batch.flags
+        self.max_event_time = max(self.max_event_time, float(ts.max()))
+        self.wheel.start(float(ts.min()))
+
+        # Normalize so A->B and B->A share a key
+        a_first = (src < dst) | ((src == dst) & (sport <= dport))
+        lo_ip, hi_ip = np.where(a_first, src, dst), np.where(a_first, dst, src)
+        lo_port, hi_port = np.where(a_first, sport, dport), np.where(a_first, dport, sport)
+        k1 = (lo_ip << np.uint64(32)) | hi_ip
+        k2 = (lo_port << np.uint64(24)) | (hi_port << np.uint64(8)) | proto
+
+        # Sort by flow, then time; group boundaries give one segment per flow
+        order = np.lexsort((ts, k2, k1))
+        k1, k2, ts_s = k1[order], k2[order], ts[order]
+        new_group = np.empty(len(order), dtype=bool)
+        new_group[0] = True
+        new_group[1:] = (k1[1:] != k1[:-1]) | (k2[1:] != k2[:-1])
+        starts = np.flatnonzero(new_group)
+        ends = np.append(starts[1:], len(order))
+        gid = np.cumsum(new_group) - 1
+        n_groups = len(starts)
+
+        src_s, sport_s = src[order], sport[order]
+        first = order[starts]
+
+        # Resolve (or create) each flow; new flows take the first packet's sender as initiator
+        flows: List[Flow] = []
+        prev_last = np.full(n_groups, np.nan)
+        for g, (key1, key2, i) in enumerate(zip(k1[starts].tolist(), k2[starts].tolist(), first.tolist())):
+            key = (key1, key2)
+            flow = self.flows.get(key)
+            if flow is None:
+                flow = Flow(key, int(src[i]), int(sport[i]), int(dst[i]), int(dport[i]), int(proto[i]), float(ts[i]))
+                self.flows[key] = flow
+                self.flows_created += 1
+                self.wheel.schedule(key, flow.deadline(self.idle_timeout, self.active_timeout))
+            else:
+                prev_last[g] = flow.last_seen
+            flows.append(flow)
+
+        init_ip = np.array([f.src_ip for f in flows], dtype=np.uint64)
+        init_port = np.array([f.src_port for f in flows], dtype=np.uint64)
+        fwd = (src_s == init_ip[gid]) & (sport_s == init_port[gid])
+        size_s = size[order]
+        flags_s = flags[order]
+
+        fwd_packets = np.bincount(gid, weights=fwd, minlength=n_groups)
+        fwd_bytes = np.bincount(gid, weights=size_s * fwd, minlength=n_groups)
+        all_packets = np.diff(np.append(starts, len(order)))
+        all_bytes = np.bincount(gid, weights=size_s, minlength=n_groups)
+        flag_counts = np.stack([np.bincount(gid, weights=(flags_s & bit) != 0, minlength=n_groups)
+                                for _, bit in FLAG_BITS], axis=1).astype(np.int64)
+        fin = (flags_s & TCP_FIN) != 0
+        fwd_fin = np.bincount(gid, weights=fin & fwd, minlength=n_groups)
+        bwd_fin = np.bincount(gid, weights=fin & ~fwd, minlength=n_groups)
+
+        # Inter-arrival times within the batch, plus the gap from each known flow's last packet
+        gaps = np.diff(ts_s)
+        gap_gid = gid[1:]
+        within = ~new_group[1:]
+        gaps, gap_gid = gaps[within], gap_gid[within]
+        carried = ~np.isnan(prev_last)
+        lead = np.maximum(ts_s[starts[carried]] - prev_last[carried], 0.0)
+        gaps = np.concatenate([gaps, lead])
+        gap_gid = np.concatenate([gap_gid, np.flatnonzero(carried)])
+        gaps = np.maximum(gaps, 0.0)
+
+        iat_n = np.bincount(gap_gid, minlength=n_groups)
+        iat_sum = np.bincount(gap_gid, weights=gaps, minlength=n_groups)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            iat_mean = np.where(iat_n > 0, iat_sum / iat_n, 0.0)
+        iat_m2 = np.bincount(gap_gid, weights=(gaps - iat_mean[gap_gid]) ** 2, minlength=n_groups)
+        iat_min = np.full(n_groups, np.inf)
+        iat_max = np.zeros(n_groups)
+        np.minimum.at(iat_min, gap_gid, gaps)
+        np.maximum.at(iat_max, gap_gid, gaps)
+
+        columns = zip(
+            flows, fwd_packets.astype(np.int64).tolist(), fwd_bytes.astype(np.int64).tolist(),
+            all_packets.tolist(), all_bytes.astype(np.int64).tolist(),
+            iat_n.tolist(), iat_mean.tolist(), iat_m2.tolist(), iat_min.tolist(), iat_max.tolist(),
+            flag_counts.tolist(), fwd_fin.astype(np.int64).tolist(), bwd_fin.astype(np.int64).tolist(),
+            ts_s[starts].tolist(), ts_s[ends - 1].tolist(),
+        )
+        rst = [name for name, _ in FLAG_BITS].index("rst")
+        for flow, fp, fb, n, nb, i_n, i_mean, i_m2, i_min, i_max, fl, ffin, bfin, t0, t1 in columns:
+            flow.fwd_packets += fp
+            flow.fwd_bytes += fb
+            flow.bwd_packets += n - fp
+            flow.bwd_bytes += nb - fb
+            flow.add_iat(i_n, i_mean, i_m2, i_min, i_max)
+            flow.flags = [a + b for a, b in zip(flow.flags, fl)]
+            flow.fwd_fin += ffin
+            flow.bwd_fin += bfin
+            flow.first_seen = min(flow.first_seen, t0)
+            flow.last_seen = max(flow.last_seen, t1)
+            if not flow.closing and flow.protocol == PROTO_TCP and (flow.flags[rst] or (flow.fwd_fin and flow.bwd_fin)):
+                flow.closing = True
+                # Deadline moved earlier: file it again (the stale entry is skipped when it fires)
+                self.wheel.schedule(flow.key, flow.last_seen)
+
+    def advance(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Expire flows whose deadline has passed and return their records.
+
+        Args:
+            now: Current time; defaults to the newest packet timestamp seen
+                 (event time), so replays expire flows on capture time.
+        """
+        now = self.max_event_time if now is None else now
+        records, self._evicted_records = self._evicted_records, []
+        if now == -math.inf:
+            return records
+        for tick, keys in self.wheel.advance(now):
+            for key in keys:
+                flow = self.flows.peek(key)
+                if flow is None:
+                    continue
+                deadline = flow.deadline(self.idle_timeout, self.active_timeout)
+                if deadline <= now:
+                    records.append(self._expire(flow))
+                else:
+                    # Deadline moved since this flow was filed: re-file it (lazy reschedule)
+                    self.wheel.schedule(key, deadline)
+        return records
+
+    def _expire(self, flow: Flow, reason: Optional[str] = None) -> Dict[str, Any]:
+        if reason is None:
+            if flow.closing:
+                reason = "tcp_close"
+            elif flow.last_seen + self.idle_timeout <= flow.first_seen + self.active_timeout:
+                reason = "idle"
+            else:
+                reason = "active"
+        del self.flows[flow.key]
+        self.flows_expired[reason] += 1
+        return flow.record(reason)
+
+    def _evicted(self, key: FlowKey, flow: Flow, reason: str):
+        # Pushed out by the table bounds: emitted with the next advance()
+        self.flows_expired["evicted"] += 1
+        self._evicted_records.append(flow.record("evicted"))
+
+    def flush(self) -> List[Dict[str, Any]]:
+        """Emit every flow still in the table (shutdown / end of replay)."""
+        records, self._evicted_records = self._evicted_records, []
+        return records + [self._expire(flow, "flush") for flow in list(self.flows.values())]
+
+    @staticmethod
+    def to_frame(records: List[Dict[str, Any]]) -> "pd.DataFrame":
+        """Flow records as a DataFrame with rate features for scan / flood detection."""
+        import pandas as pd
+        df = pd.DataFrame(records)
+        if df.empty:
+            return df
+        duration = df["duration"].clip(lower=1e-6)
+        packets = df["fwd_packets"] + df["bwd_packets"]
+        df["packets_per_s"] = packets / duration
+        df["bytes_per_s"] = (df["fwd_bytes"] + df["bwd_bytes"]) / duration
+        # One-sided flows (no reply) are what scans look like
+        df["reply_ratio"] = df["bwd_packets"] / packets
+        return df
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "active_flows": len(self.flows),
+            "flows_created": self.flows_created,
+            "flows_expired": dict(self.flows_expired),
+            "state": self.flows.get_stats(),
+        }
+
+
+if __name__ == "__main__":
+    # Test: a TCP handshake + close, a one-sided SYN scan and a UDP flow that idles out
+    def pkt(ts, src, sport, dst, dport, proto=6, flags=0, size=60):
+        return {"timestamp": ts, "src_ip": src, "src_port": sport, "dst_ip": dst, "dst_port": dport,
+                "protocol": proto, "size": size, "flags": flags}
+
+    records = [
+        pkt(0.0, "10.0.0.1", 40000, "10.0.0.2", 80, flags=TCP_SYN),
+        pkt(0.1, "10.0.0.2", 80, "10.0.0.1", 40000, flags=TCP_SYN | TCP_ACK),
+        pkt(0.2, "10.0.0.1", 40000, "10.0.0.2", 80, flags=TCP_ACK, size=500),
+        pkt(0.3, "10.0.0.1", 40000, "10.0.0.2", 80, flags=TCP_FIN | TCP_ACK),
+        pkt(0.4, "10.0.0.2", 80, "10.0.0.1", 40000, flags=TCP_FIN | TCP_ACK),
+    ] + [pkt(1.0 + i * 0.01, "10.0.0.9", 50000, "10.0.0.2", port, flags=TCP_SYN) for port in range(1, 6) for i in [port]] \
+      + [pkt(2.0, "10.0.0.3", 5353, "224.0.0.251", 5353, proto=17)]
+
+    table = FlowTable(idle_timeout=10, active_timeout=60)
+    table.update(PacketBatch.from_records(records[:3]))
+    table.update(PacketBatch.from_records(records[3:]))
+    print(FlowTable.to_frame(table.advance(5.0))[["src_ip", "dst_port", "fwd_packets", "bwd_packets", "end_reason"]])
+    print(FlowTable.to_frame(table.advance(20.0))[["src_ip", "dst_port", "fwd_packets", "bwd_packets", "end_reason"]])
+    print(table.get_stats())
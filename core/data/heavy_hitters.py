@@ -0,0 +1,194 @@
+"""
+Heavy-hitter Focus Stage
+
+Sits in front of feature extraction and scoring. Count-Min sketches with
+top-k tracking find the sources, destinations and destination ports that
+carry most of the traffic in the current epoch. While the number of
+distinct sources stays within k, every packet passes through unchanged.
+Once it exceeds k (e.g. a spoofed-source SYN flood), packets from the top-k
+sources keep their source address, and all the others are folded into
+aggregate entities, one per heavy destination (and heavy port): their
+source becomes a pseudo address in 240.0.0.0/4 standing for "all other
+sources -> dst:port". Per-device features and the ensemble then see at
+most 2k entities however many sources an attacker forges, and the flood
+itself is scored as one very busy entity instead of being dropped.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+from core.data.batch import PacketBatch, int_to_ip, ip_to_int
+from core.data.sketches import HyperLogLog, TopK
+
+AGGREGATE_BASE = 0xF0000000  # 240.0.0.0 (reserved): pseudo sources; the base itself is "* -> *"
+
+
+class HeavyHitterFilter:
+    """
+    Per-epoch heavy hitters over sources, destinations and destination ports.
+
+    Epochs follow packet timestamps. At each rollover the previous epoch's
+    top sources stay tracked for one more epoch, so focus does not flap at
+    the boundary.
+    """
+
+    def __init__(self, k: int = 256, epoch: float = 10.0, epsilon: float = 0.001, delta: float = 0.01):
+        """
+        Args:
+            k: Keys tracked per dimension (and max devices passed on when focusing).
+            epoch: Seconds of event time per heavy-hitter epoch.
+            epsilon: Count-Min over-count bound (fraction of epoch traffic).
+            delta: Probability of exceeding that bound.
+        """
+        self.k = k
+        self.epoch = epoch
+        self._sketch_args = dict(k=k, epsilon=epsilon, delta=delta)
+
+        self.sources = TopK(**self._sketch_args)
+        self.destinations = TopK(**self._sketch_args)
+        self.ports = TopK(**self._sketch_args)
+        self.distinct_sources = HyperLogLog(p=12)
+        self._previous_sources = np.zeros(0, dtype=np.uint64)
+        self._epoch_index: Optional[int] = None
+        # (dst, port + 1 or 0 for any port) -> pseudo source; at most k, kept while focusing lasts
+        self._aggregates: Dict[Tuple[int, int], int] = {}
+        self._labels: Dict[int, str] = {AGGREGATE_BASE: "* -> *"}
+
+        self.packets_in = 0
+        self.packets_aggregated = 0
+        self.epochs_closed = 0
+        self.last_report: Dict[str, Any] = {}  # Report of the last closed epoch
+
+    @property
+    def focusing(self) -> bool:
+        """True when there are more distinct sources than k this epoch."""
+        return self.distinct_sources.count() > self.k
+
+    def update(self, batch: PacketBatch) -> PacketBatch:
+        """Count a batch and return it as it should be featurized and scored (other sources aggregated)."""
+        if not len(batch):
+            return batch
+        epoch_index = int(batch.timestamp.max() // self.epoch)
+        if self._epoch_index is None:
+            self._epoch_index = epoch_index
+        elif epoch_index > self._epoch_index:
+            self._rollover(epoch_index)
+
+        self.packets_in += len(batch)
+        src = batch.src_ip
+        self.sources.update(src)
+        self.destinations.update(batch.dst_ip)
+        has_ports = batch.has_ports
+        self.ports.update(batch.dst_port[has_ports])
+        self.distinct_sources.add_many(src)
+
+        if not self.focusing:
+            return batch
+        tracked = np.union1d(self.sources.keys, self._previous_sources)
+        other = ~np.isin(src, tracked)
+        if not other.any():
+            return batch
+        data = batch.data.copy()
+        data["src_ip"][other] = self._aggregate_sources(data["dst_ip"][other], data["dst_port"][other],
+                                                        has_ports[other])
+        self.packets_aggregated += int(other.sum())
+        return PacketBatch(data)
+
+    def _aggregate_sources(self, dst: np.ndarray, port: np.ndarray, has_port: np.ndarray) -> np.ndarray:
+        """Pseudo source per packet: its heavy (dst, port), heavy dst with any port, or "* -> *"."""
+        heavy_dst = np.isin(dst, self.destinations.keys)
+        heavy_port = heavy_dst & has_port & np.isin(port, self.ports.keys)
+        keys = (np.where(heavy_dst, dst, 0).astype(np.int64) << 17) \
+            | np.where(heavy_port, port.astype(np.int64) + 1, 0)
+        uniq, inverse = np.unique(keys, return_inverse=True)
+        pseudo = np.array([self._pseudo_source(key >> 17, key & 0x1FFFF) for key in uniq.tolist()],
+                          dtype=np.uint32)
+        return pseudo[inverse.ravel()]
+
+    def _pseudo_source(self, dst: int, port: int) -> int:
+        if not dst:
+            return AGGREGATE_BASE
+        address = self._aggregates.get((dst, port))
+        if address is None:
+            if len(self._aggregates) >= self.k:
+                return AGGREGATE_BASE
+            address = AGGREGATE_BASE + 1 + len(self._aggregates)
+            self._aggregates[(dst, port)] = address
+            self._labels[address] = f"* -> {int_to_ip(dst)}:{port - 1 if port else '*'}"
+        return address
+
+    def describe(self, device_ip: str) -> Optional[str]:
+        """Label of an aggregate entity (e.g. "* -> 10.0.0.2:554"), None for a real source."""
+        return self._labels.get(ip_to_int(device_ip))
+
+    def _rollover(self, epoch_index: int):
+        self.last_report = self.report()
+        if not self.focusing:
+            # Entities stay stable through a flood (sequence history) and are renumbered after it
+            self._aggregates.clear()
+            self._labels = {AGGREGATE_BASE: self._labels[AGGREGATE_BASE]}
+        self._previous_sources = self.sources.keys.copy()
+        self.sources = TopK(**self._sketch_args)
+        self.destinations = TopK(**self._sketch_args)
+        self.ports = TopK(**self._sketch_args)
+        self.distinct_sources = HyperLogLog(p=12)
+        self._epoch_index = epoch_index
+        self.epochs_closed += 1
+
+    def report(self, n: int = 5) -> Dict[str, Any]:
+        """Top keys of the current epoch with their share of its packets."""
+        total = max(1, self.sources.total)
+
+        def top(tracker: TopK, label) -> List[Dict[str, Any]]:
+            return [{"key": label(key), "packets": count, "share": round(count / total, 4)}
+                    for key, count in tracker.top(n)]
+
+        return {
+            "epoch_start": self._epoch_index * self.epoch if self._epoch_index is not None else None,
+            "packets": self.sources.total,
+            "distinct_sources": self.distinct_sources.count(),
+            "focusing": self.focusing,
+            "sources": top(self.sources, int_to_ip),
+            "destinations": top(self.destinations, int_to_ip),
+            "ports": top(self.ports, int),
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "k": self.k,
+            "packets_in": self.packets_in,
+            "packets_aggregated": self.packets_aggregated,
+            "aggregates": len(self._aggregates),
+            "focusing": self.focusing,
+        }
+
+
+if __name__ == "__main__":
+    # Test: normal traffic from 20 devices, then a spoofed SYN flood at 10.0.0.2:554
+    from core.data.batch import PACKET_DTYPE
+
+    rng = np.random.default_rng(1)
+
+    def traffic(n, ts, sources):
+        data = np.zeros(n, dtype=PACKET_DTYPE)
+        data["timestamp"] = ts
+        data["src_ip"] = sources
+        data["dst_ip"] = 0x0A000002
+        data["size"] = 60
+        data["protocol"] = 6
+        data["dst_port"] = 554
+        data["flags"] = 0x02
+        return PacketBatch(data)
+
+    hh = HeavyHitterFilter(k=64, epoch=10)
+    normal = traffic(5000, 1.0, 0xC0A80100 + rng.integers(1, 21, 5000))
+    print(f"normal: kept {len(hh.update(normal))}/{len(normal)} focusing={hh.focusing}")
+    flood = traffic(50_000, 2.0, rng.integers(0, 2**32, 50_000, dtype=np.uint64).astype(np.uint32))
+    focused = hh.update(flood)
+    sources, counts = np.unique(focused.src_ip, return_counts=True)
+    busiest = int_to_ip(sources[np.argmax(counts)])
+    print(f"flood:  {len(focused)}/{len(flood)} packets from {len(sources)} entities, focusing={hh.focusing} | "
+          f"busiest {busiest} = {hh.describe(busiest)!r} with {counts.max()} packets")
+    assert len(focused) == len(flood) and len(sources) <= 2 * hh.k
+    assert hh.describe(busiest) == "* -> 10.0.0.2:554" and counts.max() > 0.9 * len(flood)
+    print(hh.report(3))
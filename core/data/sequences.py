@@ -0,0 +1,204 @@
+"""
+Per-device Sequence Buffers
+
+Keeps the last T window feature vectors of every recently active device in
+one preallocated array, so the LSTM autoencoder gets real (N, T, F)
+sequences instead of one feature row repeated T times.
+
+Each device owns a row of a (capacity, 2T, F) array, and every window is
+written twice (at columns h and h + T of a shared head h). The last T
+windows of all devices are then the contiguous slice [:, h+1 : h+T+1] and
+can be handed to the model as a view without copying or re-stacking.
+Devices absent from a window get a zero vector for it (no traffic), and a
+device drops out once all T of its steps are zero. When every row is taken,
+a new device takes over the row of the least recently seen one.
+"""
+
+from typing import TYPE_CHECKING, Iterable, List, Optional, Sequence, Tuple, Union
+import numpy as np
+from loguru import logger
+
+from core.data.accumulators import DEFAULT_HLL_ERROR
+from core.data.batch import PacketBatch
+from core.data.features import FEATURE_COLUMNS
+from core.data.state import BoundedState
+from core.data.windows import Window, WindowEngine
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class SequenceBuffer:
+    """
+    Ring buffer of the last ``steps`` window vectors per device.
+
+    Rows 0..len(self)-1 are the tracked devices, in ``self.devices`` order;
+    ``sequences()`` and ``latest()`` are views over exactly those rows.
+    """
+
+    def __init__(
+        self,
+        steps: int = 5,
+        capacity: int = 4096,
+        columns: Sequence[str] = FEATURE_COLUMNS,
+        dtype=np.float32,
+    ):
+        """
+        Args:
+            steps: Timesteps per sequence (T).
+            capacity: Max devices tracked at once (least recently seen evicted).
+            columns: Feature columns taken from each window frame, in order.
+            dtype: Storage dtype.
+        """
+        self.steps = steps
+        self.capacity = capacity
+        self.columns = list(columns)
+
+        self._data = np.zeros((capacity, 2 * steps, len(self.columns)), dtype=dtype)
+        self._last_window = np.zeros(capacity, dtype=np.int64)
+        self._slots = BoundedState(max_entries=capacity, on_evict=self._release, name="sequence_slots")
+        self._free: List[int] = []  # Rows released by eviction
+        self._devices: List[str] = []
+        self._head = steps - 1
+
+        self.windows = 0
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    @property
+    def devices(self) -> List[str]:
+        """Device IPs, aligned with the rows of sequences() / latest()."""
+        return list(self._devices)
+
+    @property
+    def devices_evicted(self) -> int:
+        return sum(self._slots.evictions.values())
+
+    def _slot(self, device: str) -> int:
+        slot = self._slots.get(device)
+        if slot is None:
+            self._slots[device] = -1  # When full, this evicts the least recently seen device
+            if self._free:
+                slot = self._free.pop()
+                self._devices[slot] = device
+            else:
+                slot = len(self._devices)
+                self._devices.append(device)
+            self._slots.replace(device, slot)
+            self._data[slot] = 0  # Could hold a departed device's history
+        return slot
+
+    def _release(self, device: str, slot: int, reason: str):
+        self._free.append(slot)
+
+    def push(self, features: "pd.DataFrame"):
+        """Append one window (rows indexed by device_ip) to every tracked device."""
+        t = self.steps
+        h = (self._head + 1) % t
+        used = len(self._devices)
+        # Absent devices: zero activity in this window
+        self._data[:used, h] = 0
+        self._data[:used, h + t] = 0
+
+        if not features.empty:
+            evicted = self.devices_evicted
+            rows = [self._slot(device) for device in features.index]
+            values = features[self.columns].to_numpy(dtype=self._data.dtype, na_value=0)
+            if self.devices_evicted > evicted:
+                logger.warning(f"Sequence buffer full ({self.capacity} devices); "
+                               f"evicted {self.devices_evicted - evicted} least recently seen")
+                if len(rows) > self.capacity:
+                    # More devices than rows in one window: only the last ``capacity`` keep theirs
+                    rows, values = rows[-self.capacity:], values[-self.capacity:]
+            self._data[rows, h] = values
+            self._data[rows, h + t] = values
+            self._last_window[rows] = self.windows
+
+        self._head = h
+        self.windows += 1
+        self._expire()
+
+    def _expire(self):
+        """Drop devices whose whole history is zero (no traffic for T windows)."""
+        used = len(self._devices)
+        stale = np.flatnonzero(self._last_window[:used] <= self.windows - 1 - self.steps)
+        for slot in stale[::-1].tolist():
+            last = len(self._devices) - 1
+            del self._slots[self._devices[slot]]
+            if slot != last:
+                # Swap-remove keeps rows contiguous
+                self._data[slot] = self._data[last]
+                self._last_window[slot] = self._last_window[last]
+                self._devices[slot] = self._devices[last]
+                self._slots.replace(self._devices[slot], slot)
+            self._devices.pop()
+
+    def sequences(self) -> np.ndarray:
+        """(N, T, F) view, oldest step first. Overwritten by the next push()."""
+        h = self._head
+        return self._data[:len(self._devices), h + 1:h + 1 + self.steps]
+
+    def latest(self) -> np.ndarray:
+        """(N, F) view of the newest window."""
+        return self._data[:len(self._devices), self._head + self.steps]
+
+    def frame(self) -> "pd.DataFrame":
+        """Newest window as a DataFrame indexed by device_ip."""
+        import pandas as pd
+        return pd.DataFrame(self.latest(), index=pd.Index(self._devices, name="device_ip"), columns=self.columns)
+
+    def reset(self):
+        self._slots.clear()
+        self._free.clear()
+        self._devices.clear()
+        self._head = self.steps - 1
+        self.windows = 0
+
+
+def training_sequences(
+    packets: Union[PacketBatch, Iterable[PacketBatch]],
+    width: float = 5.0,
+    hop: Optional[float] = None,
+    steps: int = 5,
+    hll_error: float = DEFAULT_HLL_ERROR,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Window a stretch of archived packets the way the live loop does and
+    return ``(X, Seq_X)``: one (F,) row and one (T, F) sequence per device
+    per non-empty window, stacked.
+
+    ``packets`` is one batch or an iterable of time-ordered batches (e.g.
+    PacketStore.iter_window(..., columnar=True)); windows are closed as the
+    stream passes them, so only the open windows are held, not the packets.
+    """
+    windows = WindowEngine(width=width, hop=hop, lateness=0.0, hll_error=hll_error)
+    buffer = SequenceBuffer(steps=steps)
+    rows, sequences = [], []
+
+    def push(closed: List[Window]):
+        for window in closed:
+            buffer.push(window.features)
+            if not window.features.empty:
+                rows.append(buffer.latest().copy()) # Views are overwritten by the next push
+                sequences.append(buffer.sequences().copy())
+
+    for batch in ([packets] if isinstance(packets, PacketBatch) else packets):
+        windows.update(batch)
+        push(windows.advance())
+    push(windows.flush())
+    if not rows:
+        return np.zeros((0, len(buffer.columns)), dtype=np.float32), \
+            np.zeros((0, steps, len(buffer.columns)), dtype=np.float32)
+    return np.vstack(rows), np.vstack(sequences)
+
+
+if __name__ == "__main__":
+    # Test: three windows, one device goes quiet
+    import pandas as pd
+
+    buf = SequenceBuffer(steps=3, columns=["packet_count"])
+    for n, rows in enumerate([{"10.0.0.1": 1, "10.0.0.2": 10}, {"10.0.0.1": 2}, {"10.0.0.1": 3}, {"10.0.0.1": 4}]):
+        buf.push(pd.DataFrame({"packet_count": list(rows.values())}, index=list(rows.keys())))
+        seq = buf.sequences()
+        print(f"window {n}: devices={buf.devices} seq={seq[..., 0].tolist()} view={seq.base is not None}")
@@ -0,0 +1,265 @@
+"""
+Streaming Sketches
+
+Fixed-memory summaries for per-device streaming features.
+
+- HyperLogLog: distinct-count estimate (unique destination IPs / ports)
+  in 2^p one-byte registers, whatever the true cardinality. Sketches with
+  the same precision merge by taking the register-wise max, so windows
+  and capture workers can be combined after the fact.
+- CountMinSketch: per-key frequency estimate (never under-counts) in a
+  fixed depth x width table of counters.
+- TopK: the k heaviest keys seen so far, tracked on top of a Count-Min
+  sketch, so memory is bounded by k however many keys the traffic holds.
+"""
+
+import math
+from typing import Iterable, List, Optional, Tuple, Union
+import numpy as np
+
+_MASK64 = (1 << 64) - 1
+
+
+def splitmix64(values: np.ndarray) -> np.ndarray:
+    """Vectorized SplitMix64 finalizer: a fast, well-mixed 64-bit hash of integers."""
+    with np.errstate(over="ignore"):
+        z = values.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+def _splitmix64_int(value: int) -> int:
+    z = (value + 0x9E3779B97F4A7C15) & _MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return z ^ (z >> 31)
+
+
+def _bit_length(x: np.ndarray) -> np.ndarray:
+    """Vectorized int.bit_length() for uint64 arrays."""
+    x = x.copy()
+    n = np.zeros(x.shape, dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = x >= (np.uint64(1) << np.uint64(shift))
+        n[high] += shift
+        x[high] >>= np.uint64(shift)
+    n += (x > 0).astype(np.uint8)
+    return n
+
+
+def precision_for_error(error: float) -> int:
+    """Smallest p whose standard error 1.04 / sqrt(2^p) is at most ``error`` (4..16)."""
+    p = math.ceil(math.log2((1.04 / error) ** 2))
+    return min(16, max(4, p))
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct counter.
+
+    ``add`` / ``add_many`` take non-negative integers (e.g. uint32 IPs or
+    ports); ``count`` returns the estimate with the usual small-range
+    (linear counting) correction.
+    """
+
+    __slots__ = ("p", "registers")
+
+    def __init__(self, p: int = 10, error: float = None):
+        """
+        Args:
+            p: Precision; the sketch uses 2^p one-byte registers.
+            error: Target relative standard error; overrides ``p`` when set.
+        """
+        self.p = precision_for_error(error) if error is not None else p
+        if not 4 <= self.p <= 16:
+            raise ValueError("HyperLogLog precision must be between 4 and 16")
+        self.registers = np.zeros(1 << self.p, dtype=np.uint8)
+
+    @property
+    def error(self) -> float:
+        return 1.04 / math.sqrt(len(self.registers))
+
+    @property
+    def nbytes(self) -> int:
+        return self.registers.nbytes
+
+    # --- Updates ---
+
+    @staticmethod
+    def hash_values(values: np.ndarray, p: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(register index, rank) per value; shared by every sketch of precision p."""
+        h = splitmix64(np.asarray(values))
+        idx = (h >> np.uint64(64 - p)).astype(np.intp)
+        rest = h & np.uint64((1 << (64 - p)) - 1)
+        rank = (64 - p) - _bit_length(rest).astype(np.int16) + 1
+        return idx, rank.astype(np.uint8)
+
+    def add_hashed(self, idx: np.ndarray, rank: np.ndarray):
+        np.maximum.at(self.registers, idx, rank)
+
+    def add_many(self, values: Union[np.ndarray, Iterable[int]]):
+        values = np.asarray(values if isinstance(values, np.ndarray) else list(values), dtype=np.uint64)
+        if len(values):
+            self.add_hashed(*self.hash_values(values, self.p))
+
+    def add(self, value: int):
+        h = _splitmix64_int(int(value))
+        idx = h >> (64 - self.p)
+        rank = (64 - self.p) - (h & ((1 << (64 - self.p)) - 1)).bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        """Fold ``other`` into this sketch (in place) and return self."""
+        if other.p != self.p:
+            raise ValueError(f"Cannot merge HyperLogLog sketches of precision {self.p} and {other.p}")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    # --- Estimate ---
+
+    def count(self) -> int:
+        m = len(self.registers)
+        if m == 16:
+            alpha = 0.673
+        elif m == 32:
+            alpha = 0.697
+        elif m == 64:
+            alpha = 0.709
+        else:
+            alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.ldexp(1.0, -self.registers.astype(np.int64)).sum()
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # Linear counting for small cardinalities
+        return int(round(estimate))
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def __repr__(self) -> str:
+        return f"HyperLogLog(p={self.p}, ~{self.count()})"
+
+
+class CountMinSketch:
+    """
+    Count-Min sketch over non-negative integer keys.
+
+    With width = e / epsilon and depth = ln(1 / delta), an estimate exceeds
+    the true count by more than epsilon * total with probability < delta.
+    """
+
+    __slots__ = ("width", "depth", "table", "total", "_seeds")
+
+    def __init__(self, epsilon: float = 0.001, delta: float = 0.01):
+        """
+        Args:
+            epsilon: Over-count bound as a fraction of the total weight added.
+            delta: Probability of exceeding that bound.
+        """
+        width = math.ceil(math.e / epsilon)
+        self.width = 1 << max(4, (width - 1).bit_length())  # Power of two: index with a mask
+        self.depth = max(1, math.ceil(math.log(1 / delta)))
+        self.table = np.zeros((self.depth, self.width), dtype=np.int64)
+        self.total = 0
+        self._seeds = splitmix64(np.arange(1, self.depth + 1, dtype=np.uint64))
+
+    def _columns(self, keys: np.ndarray) -> np.ndarray:
+        """(depth, n) column per row and key."""
+        keys = np.asarray(keys, dtype=np.uint64)
+        mask = np.uint64(self.width - 1)
+        return np.stack([(splitmix64(keys ^ seed) & mask).astype(np.intp) for seed in self._seeds])
+
+    def add_many(self, keys: np.ndarray, weights: Optional[np.ndarray] = None):
+        if not len(keys):
+            return
+        weights = np.ones(len(keys), dtype=np.int64) if weights is None else np.asarray(weights, dtype=np.int64)
+        for row, cols in enumerate(self._columns(keys)):
+            self.table[row] += np.bincount(cols, weights=weights, minlength=self.width).astype(np.int64)
+        self.total += int(weights.sum())
+
+    def estimate_many(self, keys: np.ndarray) -> np.ndarray:
+        if not len(keys):
+            return np.zeros(0, dtype=np.int64)
+        cols = self._columns(keys)
+        return self.table[np.arange(self.depth)[:, None], cols].min(axis=0)
+
+    def merge(self, other: "CountMinSketch") -> "CountMinSketch":
+        if other.table.shape != self.table.shape:
+            raise ValueError("Cannot merge Count-Min sketches of different shapes")
+        self.table += other.table
+        self.total += other.total
+        return self
+
+    def reset(self):
+        self.table[:] = 0
+        self.total = 0
+
+
+class TopK:
+    """
+    Heavy hitters: the ``k`` keys with the largest Count-Min estimates.
+
+    Each update costs O(distinct keys in the batch + k), independent of how
+    many keys have been seen in total.
+    """
+
+    def __init__(self, k: int = 256, epsilon: float = 0.001, delta: float = 0.01):
+        self.k = k
+        self.cms = CountMinSketch(epsilon=epsilon, delta=delta)
+        self.keys = np.zeros(0, dtype=np.uint64)
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def update(self, keys: np.ndarray, weights: Optional[np.ndarray] = None):
+        if not len(keys):
+            return
+        uniq, inverse = np.unique(np.asarray(keys, dtype=np.uint64), return_inverse=True)
+        totals = np.bincount(inverse.ravel(), weights=weights, minlength=len(uniq)).astype(np.int64)
+        self.cms.add_many(uniq, totals)
+
+        # Batch keys get fresh estimates; other candidates keep theirs (unchanged)
+        others = ~np.isin(self.keys, uniq, assume_unique=True)
+        keys = np.concatenate([self.keys[others], uniq])
+        counts = np.concatenate([self.counts[others], self.cms.estimate_many(uniq)])
+        if len(keys) > self.k:
+            top = np.argpartition(counts, -self.k)[-self.k:]
+            keys, counts = keys[top], counts[top]
+        self.keys, self.counts = keys, counts
+
+    def top(self, n: Optional[int] = None) -> List[Tuple[int, int]]:
+        """(key, estimated count) pairs, heaviest first."""
+        order = np.argsort(self.counts)[::-1][:n]
+        return list(zip(self.keys[order].tolist(), self.counts[order].tolist()))
+
+    @property
+    def total(self) -> int:
+        return self.cms.total
+
+    def reset(self):
+        self.cms.reset()
+        self.keys = np.zeros(0, dtype=np.uint64)
+        self.counts = np.zeros(0, dtype=np.int64)
+
+
+if __name__ == "__main__":
+    # Test: estimate error at a few cardinalities, and merging
+    for error in (0.05, 0.02):
+        for n in (1, 10, 1000, 65535, 1_000_000):
+            hll = HyperLogLog(error=error)
+            hll.add_many(np.arange(n, dtype=np.uint64))
+            print(f"p={hll.p:2d} ({hll.nbytes:5d} B) n={n:>9,} est={hll.count():>9,} err={abs(hll.count() - n) / n:6.2%}")
+    a, b = HyperLogLog(), HyperLogLog()
+    a.add_many(range(0, 6000))
+    for v in range(4000, 10000):
+        b.add(v)
+    print(f"merged: {a.merge(b).count()} (expected 10000)")
+
+    # Heavy hitters: 3 loud keys among 100k quiet ones
+    rng = np.random.default_rng(0)
+    stream = np.concatenate([rng.integers(0, 100_000, 200_000), np.repeat([7, 42, 99], [30_000, 20_000, 10_000])])
+    rng.shuffle(stream)
+    topk = TopK(k=5)
+    for chunk in np.array_split(stream, 50):
+        topk.update(chunk)
+    print(f"top-3: {topk.top(3)} | CMS {topk.cms.depth}x{topk.cms.width}")
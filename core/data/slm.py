@@ -1,70 +1,301 @@
-import networkx as nx
-import community as community_louvain # python-louvain
-from typing import List, Dict, Any
+import math
+import time
+import numpy as np
+from typing import List, Dict, Any, Optional, Union
 from loguru import logger
-import pandas as pd
+
+from core.data.batch import PacketBatch, as_batch, ip_to_int
 
 class SLMCompactor:
     """
     Implements a Smart Local Moving (SLM) - style compaction.
-    It builds a graph from packet flows and detects communities (clusters of devices).
+    It keeps a time-decayed graph of who talks to whom and detects communities (clusters of devices).
     It then reduces the traffic to Inter-Community flows.
+
+    The graph persists across calls: each batch only adds its edge weights,
+    and older traffic fades with an exponential half-life. Louvain re-runs
+    when ``recompute_interval`` seconds of traffic have passed or the graph
+    changed by more than ``change_threshold`` of its weight, seeded with the
+    previous partition. In between, lookups use the cached partition; a
+    device seen since then joins its heaviest neighbour's community.
+
+    IPs are mapped to dense integer node ids and the graph is a sparse
+    upper-triangular adjacency matrix, so a batch is folded in with one
+    COO -> CSR aggregation and compaction is one grouped reduction over
+    community labels; no Python work per packet.
     """
-    def __init__(self, resolution: float = 1.0):
+    def __init__(
+        self,
+        resolution: float = 1.0,
+        half_life: float = 300.0,
+        recompute_interval: float = 30.0,
+        change_threshold: float = 0.25,
+        min_weight: float = 0.01,
+        max_nodes: int = 20000,
+    ):
+        """
+        Args:
+            resolution: Louvain resolution (higher = smaller communities).
+            half_life: Seconds (event time) for an edge's weight to halve.
+            recompute_interval: Max seconds of traffic between re-detections.
+            change_threshold: Re-detect early once this fraction of the graph's
+                              weight was added since the last detection.
+            min_weight: Decayed edges lighter than this (packets) are pruned.
+            max_nodes: Node bound; the weakest nodes are pruned beyond it.
+        """
         self.resolution = resolution
+        self.half_life = half_life
+        self.recompute_interval = recompute_interval
+        self.change_threshold = change_threshold
+        self.min_weight = min_weight
+        self.max_nodes = max_nodes
 
-    def compact(self, packets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        if not packets:
-            return []
+        # Node ids: sorted known IPs with their ids (vectorized lookup), free ids for reuse
+        self._ips = np.zeros(0, dtype=np.uint32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._free: List[int] = []
+        self._capacity = 0
+
+        from scipy import sparse # Deferred to construction, after capture starts (slow import)
+
+        # Weights are stored scaled by 2^((t - t0) / half_life) so decay needs no
+        # per-edge updates; modularity only depends on weight ratios, so Louvain
+        # can run on the stored weights directly.
+        self.adjacency = sparse.csr_matrix((0, 0), dtype=np.float64)  # [lo_id, hi_id] -> weight
+        self.labels = np.zeros(0, dtype=np.int64)  # node id -> community (-1: not assigned)
+        self._t0: Optional[float] = None
+        self.now = -math.inf
+        self._total = 0.0    # Stored weight added so far (decayed; node-bound pruning does not reduce it)
+        self._pending = 0.0  # Stored weight added since the last detection
+
+        self._next_community = 0
+        self._detected_at: Optional[float] = None
+
+        self.detections = 0
+        self.detection_seconds = 0.0
+
+    def __len__(self) -> int:
+        return len(self._ips)
+
+    # --- Node ids ---
+
+    def _lookup(self, ips: np.ndarray) -> np.ndarray:
+        """Node id per IP, -1 where unknown."""
+        if not len(self._ips):
+            return np.full(len(ips), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self._ips, ips), len(self._ips) - 1)
+        return np.where(self._ips[pos] == ips, self._ids[pos], -1)
+
+    def _node_ids(self, ips: np.ndarray) -> np.ndarray:
+        """Node id per IP, allocating ids for new IPs."""
+        uniq, inverse = np.unique(ips, return_inverse=True)
+        ids = self._lookup(uniq)
+        new = np.flatnonzero(ids < 0)
+        if len(new):
+            reused = min(len(new), len(self._free))
+            fresh = np.concatenate([
+                np.asarray(self._free[len(self._free) - reused:], dtype=np.int64),
+                np.arange(self._capacity, self._capacity + len(new) - reused, dtype=np.int64),
+            ])
+            del self._free[len(self._free) - reused:]
+            self._capacity += len(new) - reused
+            ids[new] = fresh
+            order = np.argsort(np.concatenate([self._ips, uniq[new]]), kind="stable")
+            self._ips = np.concatenate([self._ips, uniq[new]])[order]
+            self._ids = np.concatenate([self._ids, fresh])[order]
+            self._grow(self._capacity)
+            self.labels[fresh] = -1
+        return ids[inverse.ravel()]
+
+    def _grow(self, n: int):
+        if n > self.adjacency.shape[0]:
+            size = max(n, 2 * self.adjacency.shape[0], 64)
+            self.adjacency.resize((size, size))
+            self.labels = np.concatenate([self.labels, np.full(size - len(self.labels), -1, dtype=np.int64)])
+
+    # --- Graph ---
+
+    def _scale(self, ts: float) -> float:
+        return 2.0 ** ((ts - self._t0) / self.half_life)
+
+    def update(self, packets: Union[PacketBatch, List[Dict[str, Any]]]) -> bool:
+        """Fold a batch into the graph; returns True if communities were re-detected."""
+        batch = as_batch(packets)
+        valid = (batch.src_ip != 0) & (batch.dst_ip != 0)
+        if not valid.any():
+            return False
+        batch = batch[valid] if not valid.all() else batch
+        self.now = max(self.now, float(batch.timestamp.max()))
+        if self._t0 is None:
+            self._t0 = self.now
+        elif (self.now - self._t0) / self.half_life > 32:
+            self._rebase()
+
+        src = self._node_ids(batch.src_ip)
+        dst = self._node_ids(batch.dst_ip)
+        scale = self._scale(self.now)
+        n = self.adjacency.shape[0]
+        from scipy import sparse
+        # Duplicate (lo, hi) pairs are summed by the COO -> CSR conversion
+        added = sparse.coo_matrix(
+            (np.full(len(src), scale), (np.minimum(src, dst), np.maximum(src, dst))), shape=(n, n)).tocsr()
+        self.adjacency = self.adjacency + added
+        weight = scale * len(src)
+        self._total += weight
+        self._pending += weight
+
+        if self._needs_detection():
+            self.detect()
+            return True
+        return False
 
-        # 1. Build Graph
-        G = nx.Graph()
-        for p in packets:
-            src = p.get('src_ip')
-            dst = p.get('dst_ip')
-            if src and dst:
-                if G.has_edge(src, dst):
-                    G[src][dst]['weight'] += 1
-                else:
-                    G.add_edge(src, dst, weight=1)
-
-        if len(G.nodes) == 0:
-            return packets # fallback
-
-        # 2. Detect Communities (SLM / Louvain)
+    def _rebase(self):
+        """Fold the accumulated decay into the stored weights and prune faded edges."""
+        factor = 1.0 / self._scale(self.now)
+        self.adjacency.data *= factor
+        self._total *= factor
+        self._pending *= factor
+        self._t0 = self.now
+        self.prune()
+
+    def _strength(self) -> np.ndarray:
+        """Weighted degree per node id."""
+        adj = self.adjacency
+        return np.asarray(adj.sum(axis=0)).ravel() + np.asarray(adj.sum(axis=1)).ravel()
+
+    def prune(self):
+        """Drop edges whose decayed weight is below min_weight, then nodes beyond max_nodes."""
+        adj = self.adjacency
+        adj.data[adj.data < self.min_weight * self._scale(self.now)] = 0
+        strength = self._strength()
+        if len(self._ids) > self.max_nodes:
+            live = self._ids[strength[self._ids] > 0]
+            if len(live) > self.max_nodes:
+                weakest = live[np.argsort(strength[live], kind="stable")[:len(live) - self.max_nodes]]
+                keep = np.ones(adj.shape[0])
+                keep[weakest] = 0
+                from scipy import sparse
+                mask = sparse.diags(keep)
+                adj = mask @ adj @ mask
+                strength[weakest] = 0
+        adj.eliminate_zeros()
+        self.adjacency = adj.tocsr()
+
+        # Release ids of nodes left without edges
+        gone = strength[self._ids] <= 0
+        if gone.any():
+            self._free.extend(self._ids[gone].tolist())
+            self.labels[self._ids[gone]] = -1
+            self._ips, self._ids = self._ips[~gone], self._ids[~gone]
+
+    # --- Communities ---
+
+    def _needs_detection(self) -> bool:
+        if self._detected_at is None:
+            return True
+        if self.now - self._detected_at >= self.recompute_interval:
+            return True
+        return self._pending >= self.change_threshold * max(self._total - self._pending, 1e-12)
+
+    def detect(self):
+        """Re-run Louvain, warm-started from the cached partition."""
+        import networkx as nx # Deferred to the first detection (slow imports)
+        import community as community_louvain # python-louvain
+        self.prune()
+        if not len(self._ids):
+            return
+        self._assign(self._ids)
+        edges = self.adjacency.tocoo()
+        graph = nx.Graph()
+        graph.add_weighted_edges_from(zip(edges.row.tolist(), edges.col.tolist(), edges.data.tolist()))
+        seed = dict(zip(self._ids.tolist(), self.labels[self._ids].tolist()))
+        started = time.perf_counter()
         try:
-            partition = community_louvain.best_partition(G, resolution=self.resolution)
+            partition = community_louvain.best_partition(
+                graph, partition=seed, resolution=self.resolution, random_state=0)
         except Exception as e:
-            logger.warning(f"Community detection failed, returning raw: {e}")
-            return packets
+            logger.warning(f"Community detection failed, keeping previous partition: {e}")
+            return
+        self.detection_seconds = time.perf_counter() - started
+        nodes = np.fromiter(partition.keys(), dtype=np.int64, count=len(partition))
+        self.labels[nodes] = np.fromiter(partition.values(), dtype=np.int64, count=len(partition))
+        self._next_community = int(self.labels.max()) + 1
+        self._detected_at = self.now
+        self._pending = 0.0
+        self.detections += 1
+
+    def _assign(self, ids: np.ndarray):
+        """Give unlabelled nodes their heaviest labelled neighbour's community (or a new one)."""
+        new = np.unique(ids[self.labels[ids] < 0])
+        if not len(new):
+            return
+        both = self.adjacency + self.adjacency.T  # Neighbours in either direction
+        rows = both[new].tocoo()
+        labelled = self.labels[rows.col] >= 0
+        r, c, w = rows.row[labelled], rows.col[labelled], rows.data[labelled]
+        community = np.full(len(new), -1, dtype=np.int64)
+        if len(r):
+            order = np.lexsort((w, r))  # Heaviest neighbour last within each row
+            last = np.flatnonzero(np.append(r[order][1:] != r[order][:-1], True))
+            community[r[order][last]] = self.labels[c[order][last]]
+        alone = community < 0
+        community[alone] = self._next_community + np.arange(int(alone.sum()))
+        self._next_community += int(alone.sum())
+        self.labels[new] = community
+
+    def community_of(self, ip: str) -> Optional[int]:
+        """Cached community of a device IP, or None if it has not been seen."""
+        node = int(self._lookup(np.array([ip_to_int(ip)], dtype=np.uint32))[0])
+        if node < 0:
+            return None
+        self._assign(np.array([node]))
+        return int(self.labels[node])
+
+    # --- Compaction ---
 
-        # 3. Compact Packets
+    def compact(self, packets: Union[PacketBatch, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        if not len(packets):
+            return []
+
+        batch = as_batch(packets)
+
+        # 1. Update Graph (communities re-detected only when due)
+        self.update(batch)
+
+        # 2. Compact Packets
         # We transform individual IP-to-IP packets into Community-to-Community flows
         # This reduces the number of "entities" tracking in the ML model
-        
-        compacted_flows = {} # Key: (comm_src, comm_dst)
-        
-        for p in packets:
-            src = p.get('src_ip')
-            dst = p.get('dst_ip')
-            if src and dst and src in partition and dst in partition:
-                comm_src = partition[src]
-                comm_dst = partition[dst]
-                
-                key = (comm_src, comm_dst)
-                if key not in compacted_flows:
-                    compacted_flows[key] = {
-                        "src_comm": comm_src,
-                        "dst_comm": comm_dst,
-                        "packet_count": 0,
-                        "bytes": 0,
-                        "timestamp": p.get('timestamp') # Keep latest
-                    }
-                
-                compacted_flows[key]['packet_count'] += 1
-                compacted_flows[key]['bytes'] += p.get('size', 0)
-        
-        return list(compacted_flows.values())
+        src, dst = self._lookup(batch.src_ip), self._lookup(batch.dst_ip)
+        valid = (src >= 0) & (dst >= 0)
+        if not valid.any():
+            return []
+        src, dst = src[valid], dst[valid]
+        self._assign(np.concatenate([src, dst]))
+        comm_src, comm_dst = self.labels[src], self.labels[dst]
+
+        # One grouped reduction per (src_comm, dst_comm) pair
+        keys, group = np.unique((comm_src << 32) | comm_dst, return_inverse=True)
+        group = group.ravel()
+        pairs = np.stack([keys >> 32, keys & 0xFFFFFFFF], axis=1)
+        packet_count = np.bincount(group, minlength=len(pairs))
+        byte_count = np.bincount(group, weights=batch.size[valid], minlength=len(pairs))
+        latest = np.full(len(pairs), -np.inf)
+        np.maximum.at(latest, group, batch.timestamp[valid]) # Keep latest
+
+        return [
+            {"src_comm": s, "dst_comm": d, "packet_count": n, "bytes": b, "timestamp": ts}
+            for (s, d), n, b, ts in zip(pairs.tolist(), packet_count.tolist(),
+                                        byte_count.astype(np.int64).tolist(), latest.tolist())
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "nodes": len(self._ids),
+            "edges": self.adjacency.nnz,
+            "communities": len(np.unique(self.labels[self._ids])),
+            "detections": self.detections,
+            "last_detection_seconds": round(self.detection_seconds, 4),
+        }
 
 if __name__ == "__main__":
     # Test
@@ -76,3 +307,21 @@ if __name__ == "__main__":
     slm = SLMCompactor()
     compacted = slm.compact(packets)
     print(compacted)
+    print(slm.compact(PacketBatch.from_records(packets)))
+
+    # Incremental: two LANs; batches between detections reuse the cached partition
+    rng = np.random.default_rng(0)
+    slm = SLMCompactor(recompute_interval=10)
+    started = time.perf_counter()
+    for second in range(60):
+        lan = rng.integers(0, 2, 20000)
+        base = np.where(lan == 0, 0x0A000000, 0xC0A80100)
+        data = np.zeros(len(lan), dtype=PacketBatch().data.dtype)
+        data["timestamp"] = second + 0.5
+        data["src_ip"] = base + rng.integers(1, 50, len(lan))
+        data["dst_ip"] = base + rng.integers(1, 50, len(lan))
+        data["size"] = 100
+        flows = slm.compact(PacketBatch(data))
+    print(f"{time.perf_counter() - started:.2f}s for 1.2M packets", slm.get_stats())
+    print("communities of 10.0.0.1 / 192.168.1.1:", slm.community_of("10.0.0.1"), slm.community_of("192.168.1.1"))
+    print(flows)
@@ -0,0 +1,240 @@
+"""
+Bounded Keyed State
+
+One dict-like container for every piece of state Sentra keeps per IP
+address (per-device accumulators, flows, sequence slots, honeypot
+redirects, deceived attackers). A spoofed-source flood can mint millions
+of keys; this container caps them three ways and counts what it drops:
+
+- max_entries: least recently used keys go first once the count is hit.
+- ttl: keys not read or written for ``ttl`` seconds expire. Entries are
+  kept in recency order, so a sweep only looks at the expired ones.
+- max_bytes: an approximate memory budget, using ``sizeof(key, value)``
+  measured when a value is stored (call ``resize`` after growing one
+  in place).
+
+Evicted entries are passed to ``on_evict(key, value, reason)`` so owners
+can emit a final record or free a slot.
+"""
+
+import sys
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, Iterator, MutableMapping, Optional, Tuple
+
+EVICT_LRU = "lru"
+EVICT_TTL = "ttl"
+EVICT_MEMORY = "memory"
+
+
+def default_sizeof(key: Any, value: Any) -> int:
+    """Shallow size of a key / value pair, plus ``nbytes`` for array-backed values."""
+    return sys.getsizeof(key) + sys.getsizeof(value) + int(getattr(value, "nbytes", 0) or 0)
+
+
+class BoundedState(MutableMapping):
+    """
+    Ordered mapping with LRU, TTL and memory-budget eviction.
+
+    Lookups through ``get`` / ``[]`` / ``in`` count as use and move the key
+    to the most recent end; ``peek`` and iteration do not.
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        ttl: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any, Any], int] = default_sizeof,
+        on_evict: Optional[Callable[[Any, Any, str], None]] = None,
+        clock: Callable[[], float] = time.monotonic,
+        name: str = "state",
+    ):
+        """
+        Args:
+            max_entries: Max keys held (None: no count limit).
+            ttl: Seconds since last use before a key expires (None: never).
+            max_bytes: Approximate memory budget (None: no budget).
+            sizeof: Bytes charged for a (key, value) pair.
+            on_evict: Called as on_evict(key, value, reason) for every eviction.
+            clock: Time source for the TTL.
+            name: Label used in stats.
+        """
+        if max_entries is not None and max_entries <= 0:
+            raise ValueError("max_entries must be positive")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+        self.clock = clock
+        self.name = name
+
+        self._entries: "OrderedDict[Any, list]" = OrderedDict()  # key -> [value, last_used, size]
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.inserts = 0
+        self.peak_entries = 0
+        self.evictions: Counter = Counter()
+
+    # --- Mapping protocol ---
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator:
+        return iter(list(self._entries))
+
+    def __contains__(self, key) -> bool:
+        return self._lookup(key) is not None
+
+    def __getitem__(self, key):
+        entry = self._lookup(key)
+        if entry is None:
+            raise KeyError(key)
+        return entry[0]
+
+    def get(self, key, default=None):
+        entry = self._lookup(key)
+        return default if entry is None else entry[0]
+
+    def __setitem__(self, key, value):
+        now = self.clock()
+        size = self.sizeof(key, value)
+        entry = self._entries.get(key)
+        if entry is None:
+            self._entries[key] = [value, now, size]
+            self.inserts += 1
+        else:
+            self.bytes -= entry[2]
+            entry[0], entry[1], entry[2] = value, now, size
+            self._entries.move_to_end(key)
+        self.bytes += size
+        self._enforce(now, keep=key)
+        self.peak_entries = max(self.peak_entries, len(self._entries))
+
+    def __delitem__(self, key):
+        entry = self._entries.pop(key)
+        self.bytes -= entry[2]
+
+    def pop(self, key, *default):
+        """Remove a key without counting it as an eviction."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        self.bytes -= entry[2]
+        return entry[0]
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def peek(self, key, default=None):
+        """Value for ``key`` without refreshing its recency or TTL."""
+        entry = self._entries.get(key)
+        return default if entry is None else entry[0]
+
+    def replace(self, key, value):
+        """Swap the value of an existing key, keeping its recency."""
+        entry = self._entries[key]
+        size = self.sizeof(key, value)
+        self.bytes += size - entry[2]
+        entry[0], entry[2] = value, size
+
+    def items(self) -> Iterator[Tuple[Any, Any]]:
+        return ((key, entry[0]) for key, entry in list(self._entries.items()))
+
+    def values(self) -> Iterator[Any]:
+        return (entry[0] for entry in list(self._entries.values()))
+
+    # --- Bounds ---
+
+    def _lookup(self, key) -> Optional[list]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        now = self.clock()
+        if self.ttl is not None and now - entry[1] > self.ttl:
+            self._evict(key, EVICT_TTL)
+            self.misses += 1
+            return None
+        entry[1] = now
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def resize(self, key):
+        """Re-measure a value that grew or shrank in place."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            size = self.sizeof(key, entry[0])
+            self.bytes += size - entry[2]
+            entry[2] = size
+            self._enforce(self.clock(), keep=key)
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """Drop every key idle for longer than the TTL; returns how many."""
+        if self.ttl is None:
+            return 0
+        now = self.clock() if now is None else now
+        expired = 0
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if now - entry[1] <= self.ttl:
+                break  # Recency order: everything after this is fresher
+            self._evict(key, EVICT_TTL)
+            expired += 1
+        return expired
+
+    def _enforce(self, now: float, keep=None):
+        self.expire(now)
+        while self.max_entries is not None and len(self._entries) > self.max_entries:
+            self._evict(next(iter(self._entries)), EVICT_LRU)
+        while self.max_bytes is not None and self.bytes > self.max_bytes and len(self._entries) > 1:
+            oldest = next(iter(self._entries))
+            if oldest == keep:
+                break
+            self._evict(oldest, EVICT_MEMORY)
+
+    def _evict(self, key, reason: str):
+        value = self.pop(key)
+        self.evictions[reason] += 1
+        if self.on_evict is not None:
+            self.on_evict(key, value, reason)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "entries": len(self._entries),
+            "peak_entries": self.peak_entries,
+            "bytes": self.bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "inserts": self.inserts,
+            "evictions": dict(self.evictions),
+        }
+
+
+if __name__ == "__main__":
+    # Test: count, TTL and byte limits under a spoofed-source burst
+    clock = [0.0]
+    evicted = []
+    state = BoundedState(max_entries=1000, ttl=60, max_bytes=64_000, clock=lambda: clock[0],
+                         on_evict=lambda k, v, reason: evicted.append(reason), name="demo")
+    state["10.0.0.1"] = {"status": "REDIRECTED"}
+    for i in range(100_000):
+        state[f"spoofed-{i}"] = i
+    clock[0] = 30.0
+    print(f"keep-alive: {'10.0.0.1' in state} (expected False: evicted by the burst)")
+    state["10.0.0.2"] = "fresh"
+    clock[0] = 100.0
+    state.expire()
+    print(f"after ttl: entries={len(state)} bytes={state.bytes}")
+    print(state.get_stats())
@@ -1,80 +1,594 @@
+import math
 import sqlite3
 import json
+import time
 from loguru import logger
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterator, List, Optional, Union
 import threading
 from datetime import datetime
 
+import numpy as np
+
+from core.data.batch import PACKET_DTYPE, PacketBatch, ips_from_str, ips_to_str
+from core.perception.decoder import PROTO_NAMES, parse_flags
+from core.perception.handoff import PacketHandoff
+
+PACKET_COLUMNS = """
+    id INTEGER PRIMARY KEY,
+    timestamp REAL,
+    src_ip TEXT,
+    dst_ip TEXT,
+    size INTEGER,
+    protocol INTEGER,
+    src_port INTEGER,
+    dst_port INTEGER,
+    flags INTEGER,
+    proto_name TEXT
+"""
+
+INSERT_SQL = """
+    INSERT INTO {table} (timestamp, src_ip, dst_ip, size, protocol, src_port, dst_port, flags, proto_name)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+LEGACY_CHUNK = 50_000  # Rows moved per transaction when migrating the old packets table
+
+# Columnar reads: PACKET_DTYPE field order, NULL ports / flags as 0
+BATCH_COLUMNS = """
+    timestamp, src_ip, dst_ip, COALESCE(size, 0), COALESCE(src_port, 0), COALESCE(dst_port, 0),
+    COALESCE(protocol, 0), COALESCE(flags, 0)
+"""
+
+# Per-device, per-minute aggregates of one partition (idempotent: whole minutes are recomputed)
+ROLLUP_SQL = """
+    INSERT OR REPLACE INTO rollups_minute
+    SELECT CAST(timestamp / 60 AS INTEGER) * 60, src_ip,
+           COUNT(*), SUM(size),
+           SUM(protocol = 6), SUM(protocol = 17),
+           SUM(flags IS NOT NULL AND (flags & 18) = 2),
+           COUNT(DISTINCT dst_ip), COUNT(DISTINCT dst_port),
+           MIN(timestamp), MAX(timestamp)
+    FROM {table} WHERE src_ip IS NOT NULL
+    GROUP BY 1, 2
+"""
+
 class PacketStore:
-    def __init__(self, db_path: str = "sentra_raw.db"):
+    """
+    Raw packet log in SQLite.
+
+    By default every save_* call writes synchronously. With
+    ``write_behind=True`` saves only enqueue into a bounded buffer and a
+    dedicated writer thread, which owns its own connection, inserts them
+    with executemany once ``flush_rows`` packets are pending or
+    ``flush_interval`` seconds have passed. A full buffer drops packets
+    (``policy``, as for the capture hand-off) instead of stalling the caller.
+    Rows still in the buffer are not yet visible to fetch_window.
+
+    Packets go to one table per ``partition_seconds`` of capture time
+    (hourly by default), listed in a ``partitions`` catalog. Once a
+    partition has closed it is rolled up into per-device, per-minute
+    aggregates (``rollups_minute``), and partitions older than
+    ``raw_retention`` are dropped whole, with no row-by-row DELETE. Retention
+    follows the newest packet timestamp written, so replaying an old
+    capture does not expire it on arrival.
+    """
+    def __init__(
+        self,
+        db_path: str = "sentra_raw.db",
+        write_behind: bool = False,
+        buffer_size: int = 200_000,
+        flush_rows: int = 5000,
+        flush_interval: float = 1.0,
+        policy: str = "drop_oldest",
+        partition_seconds: float = 3600.0,
+        raw_retention: Optional[float] = 24 * 3600.0,
+        rollup_retention: Optional[float] = 90 * 86400.0,
+        rollup_lag: float = 300.0,
+        maintenance_interval: float = 60.0,
+    ):
+        """
+        Args:
+            db_path: SQLite database file.
+            write_behind: Buffer saves and write them from a background thread.
+            buffer_size: Write-behind buffer capacity in packets.
+            flush_rows: Pending packets that trigger a write.
+            flush_interval: Max seconds a pending packet waits to be written.
+            policy: Overload policy of a full buffer (see PacketHandoff).
+            partition_seconds: Capture time covered by one raw partition table.
+            raw_retention: Seconds of raw packets kept (None: keep all).
+            rollup_retention: Seconds of per-minute rollups kept (None: keep all).
+            rollup_lag: Seconds after a partition closes before it is rolled up
+                        (late packets still land in it).
+            maintenance_interval: Min seconds between rollup / retention passes.
+        """
         self.db_path = db_path
+        self.partition_seconds = partition_seconds
+        self.raw_retention = raw_retention
+        self.rollup_retention = rollup_retention
+        self.rollup_lag = rollup_lag
+        self.maintenance_interval = maintenance_interval
         self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None  # Synchronous writes
+        self._partitions: Dict[float, str] = {}  # partition start -> table
+        self._has_legacy = False  # Pre-partitioning single packets table
+        self.event_time = -math.inf  # Newest packet timestamp written
+        self._next_maintenance = 0.0
+
+        self.write_behind = write_behind
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self._buffer = PacketHandoff(maxsize=buffer_size, batch_size=flush_rows, policy=policy)
+        self._pending = 0       # Packets taken off the buffer, not yet committed
+        self._flushed = threading.Condition()
+        self._flush_requested = 0  # flush() calls so far
+        self._flush_done = 0       # Last request the writer has fully written
+        self._stop = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+
+        # Writer stats
+        self.rows_written = 0
+        self.rows_expired = 0  # Arrived older than the raw retention
+        self.partitions_rolled_up = 0
+        self.partitions_dropped = 0
+        self.flushes = 0
+        self.write_errors = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._flush_ms_total = 0.0
+
         self._init_db()
+        if write_behind:
+            self.start()
 
     def _init_db(self):
-        """Create the packets table if it doesn't exist."""
+        """Create the partition catalog and rollup table if they don't exist."""
         try:
             with self._get_conn() as conn:
+                # Only takes effect on a new file: dropped partitions give their pages back to the disk
+                conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                # WAL: readers (fetch_window) do not block the writer and commits are cheaper
+                conn.execute("PRAGMA journal_mode=WAL")
                 conn.execute("""
-                    CREATE TABLE IF NOT EXISTS packets (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        timestamp REAL,
-                        src_ip TEXT,
-                        dst_ip TEXT,
-                        size INTEGER,
-                        protocol INTEGER,
-                        src_port INTEGER,
-                        dst_port INTEGER,
-                        flags TEXT,
-                        proto_name TEXT
+                    CREATE TABLE IF NOT EXISTS partitions (
+                        start REAL PRIMARY KEY,
+                        end REAL,
+                        name TEXT,
+                        rows INTEGER DEFAULT 0,
+                        rolled_rows INTEGER DEFAULT 0
                     )
                 """)
-                # Index for faster time-window queries
-                conn.execute("CREATE INDEX IF NOT EXISTS idx_timestamp ON packets(timestamp)")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS rollups_minute (
+                        minute INTEGER,
+                        device_ip TEXT,
+                        packet_count INTEGER,
+                        bytes_total INTEGER,
+                        tcp_count INTEGER,
+                        udp_count INTEGER,
+                        syn_count INTEGER,
+                        unique_dst_ips INTEGER,
+                        unique_dst_ports INTEGER,
+                        first_seen REAL,
+                        last_seen REAL,
+                        PRIMARY KEY (minute, device_ip)
+                    ) WITHOUT ROWID
+                """)
+                self._partitions = dict(conn.execute("SELECT start, name FROM partitions"))
+                if self._partitions:
+                    self.event_time = max(self._partitions)  # Lower bound on the newest stored packet
+                self._has_legacy = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'packets'").fetchone() is not None
+                if self._has_legacy:
+                    self._migrate_legacy(conn)
+                    self._has_legacy = False
         except Exception as e:
             logger.error(f"Failed to init DB: {e}")
 
+    def _migrate_legacy(self, conn: sqlite3.Connection):
+        """
+        Move the pre-partitioning ``packets`` table into partitions, then drop it.
+
+        Its flags column is TEXT ('S', 'SA'); rows are converted to the integer
+        bitmask on the way. Each chunk is inserted and deleted from the old
+        table in one transaction, so an interrupted migration resumes on the
+        next open without duplicates.
+        """
+        moved = expired = 0
+        while True:
+            rows = conn.execute(
+                "SELECT id, timestamp, src_ip, dst_ip, size, protocol, src_port, dst_port, flags, proto_name "
+                "FROM packets ORDER BY id LIMIT ?", (LEGACY_CHUNK,)).fetchall()
+            if not rows:
+                break
+            rows_expired = self.rows_expired
+            with conn:
+                moved += self._insert(conn, [
+                    row[1:8] + (None if row[8] is None else parse_flags(row[8]), row[9]) for row in rows])
+                conn.execute("DELETE FROM packets WHERE id <= ?", (rows[-1][0],))
+            expired += self.rows_expired - rows_expired
+        with conn:
+            conn.execute("DROP TABLE packets")
+        logger.info(f"Migrated the legacy packets table: {moved} rows into partitions, "
+                    f"{expired} past the raw retention dropped")
+        self._maintain(conn)  # Roll up and apply retention to the migrated partitions
+
     def _get_conn(self):
-        return sqlite3.connect(self.db_path)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL") # Durable across app crashes in WAL mode
+        return conn
+
+    # --- Row conversion ---
+
+    @staticmethod
+    def _packet_row(data: Dict[str, Any]) -> tuple:
+        return (
+            data.get("timestamp"),
+            data.get("src_ip"),
+            data.get("dst_ip"),
+            data.get("size"),
+            data.get("protocol"),
+            data.get("src_port"),
+            data.get("dst_port"),
+            data.get("flags"),
+            data.get("proto_name")
+        )
+
+    @staticmethod
+    def _batch_rows(batch: PacketBatch) -> List[tuple]:
+        has_ports = batch.has_ports.tolist()
+        is_tcp = (batch.protocol == 6).tolist()
+        rows = zip(
+            batch.timestamp.tolist(),
+            ips_to_str(batch.src_ip),
+            ips_to_str(batch.dst_ip),
+            batch.size.tolist(),
+            batch.protocol.tolist(),
+            batch.src_port.tolist(),
+            batch.dst_port.tolist(),
+            batch.flags.tolist(),
+            has_ports,
+            is_tcp,
+        )
+        return [
+            (ts, src, dst, size, proto,
+             sport if ports else None, dport if ports else None,
+             flags if tcp else None, PROTO_NAMES.get(proto, "OTHER"))
+            for ts, src, dst, size, proto, sport, dport, flags, ports, tcp in rows
+        ]
+
+    def _rows(self, chunk: Any) -> List[tuple]:
+        if isinstance(chunk, PacketBatch):
+            return self._batch_rows(chunk)
+        return [self._packet_row(p) for p in chunk]
+
+    # --- Writes ---
+
+    def _partition(self, conn: sqlite3.Connection, start: float) -> str:
+        """Table for the partition starting at ``start`` (created on first use)."""
+        table = self._partitions.get(start)
+        if table is None:
+            table = f"packets_{int(start)}"
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({PACKET_COLUMNS})")
+            # Index for faster time-window queries
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_timestamp ON {table}(timestamp)")
+            conn.execute("INSERT OR IGNORE INTO partitions (start, end, name) VALUES (?, ?, ?)",
+                         (start, start + self.partition_seconds, table))
+            self._partitions[start] = table
+            self._next_maintenance = 0.0  # A partition may have just closed
+        return table
+
+    def _insert(self, conn: sqlite3.Connection, rows: List[tuple]) -> int:
+        """Insert rows into their partitions (caller owns the transaction); returns rows written."""
+        if not rows:
+            return 0
+        self.event_time = max(self.event_time, max(row[0] or 0.0 for row in rows))
+        horizon = self.event_time - self.raw_retention if self.raw_retention is not None else -math.inf
+        by_partition: Dict[float, List[tuple]] = {}
+        for row in rows:
+            ts = row[0] or 0.0
+            if ts < horizon:
+                self.rows_expired += 1
+                continue
+            by_partition.setdefault(ts - ts % self.partition_seconds, []).append(row)
+        written = 0
+        for start, part in by_partition.items():
+            conn.executemany(INSERT_SQL.format(table=self._partition(conn, start)), part)
+            conn.execute("UPDATE partitions SET rows = rows + ? WHERE start = ?", (len(part), start))
+            written += len(part)
+        return written
+
+    def _write(self, conn: sqlite3.Connection, rows: List[tuple]) -> int:
+        """Insert rows into their partitions in one transaction; returns rows written."""
+        if not rows:
+            return 0
+        with conn:
+            written = self._insert(conn, rows)
+        if time.monotonic() >= self._next_maintenance:
+            self._maintain(conn)
+        return written
+
+    def _write_sync(self, rows: List[tuple]):
+        with self._lock:
+            if self._conn is None:
+                self._conn = self._get_conn()
+            self.rows_written += self._write(self._conn, rows)
 
     def save_packet(self, data: Dict[str, Any]):
         """
         Save a single packet metadata to DB.
         """
+        if self.write_behind:
+            self._buffer.put_batch([data])
+            return
         try:
-            with self._lock:
-                with self._get_conn() as conn:
-                    conn.execute("""
-                        INSERT INTO packets (timestamp, src_ip, dst_ip, size, protocol, src_port, dst_port, flags, proto_name)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        data.get("timestamp"),
-                        data.get("src_ip"),
-                        data.get("dst_ip"),
-                        data.get("size"),
-                        data.get("protocol"),
-                        data.get("src_port"),
-                        data.get("dst_port"),
-                        data.get("flags"),
-                        data.get("proto_name")
-                    ))
+            self._write_sync([self._packet_row(data)])
         except Exception as e:
             logger.error(f"Failed to save packet: {e}")
 
+    def save_batch(self, batch: PacketBatch):
+        """
+        Save a columnar batch in one transaction (or hand it to the writer thread).
+        """
+        if not len(batch):
+            return
+        if self.write_behind:
+            self._buffer.put_batch(batch)
+            return
+        try:
+            self._write_sync(self._batch_rows(batch))
+        except Exception as e:
+            logger.error(f"Failed to save batch: {e}")
+
+    # --- Write-behind ---
+
+    def start(self):
+        """Start the writer thread (called by __init__ when write_behind=True)."""
+        if self._writer is not None and self._writer.is_alive():
+            return
+        self.write_behind = True
+        self._stop.clear()
+        self._writer = threading.Thread(target=self._writer_loop, name="sentra-store-writer", daemon=True)
+        self._writer.start()
+
+    def _writer_loop(self):
+        conn = self._get_conn()
+        chunks: List[Any] = []
+        oldest = 0.0
+        try:
+            while True:
+                wait = self.flush_interval - (time.monotonic() - oldest) if chunks else self.flush_interval
+                chunk = self._buffer.get_batch(timeout=max(wait, 0.0))
+                if chunk is not None:
+                    if not chunks:
+                        oldest = time.monotonic()
+                    chunks.append(chunk)
+                    self._pending += len(chunk)
+
+                # Read before checking the buffer: whatever a flush() caller queued is in it or in chunks
+                requested = self._flush_requested
+                stopping = self._stop.is_set()
+                draining = (stopping or requested > self._flush_done) and self._buffer.empty()
+                if chunks and (self._pending >= self.flush_rows or draining or
+                               time.monotonic() - oldest >= self.flush_interval):
+                    self._commit(conn, chunks)
+                    chunks = []
+                if not chunks and self._buffer.empty():
+                    if requested > self._flush_done:
+                        with self._flushed:
+                            self._flush_done = requested
+                            self._flushed.notify_all()
+                    if stopping:
+                        break
+        finally:
+            conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, chunks: List[Any]):
+        started = time.perf_counter()
+        try:
+            rows = [row for chunk in chunks for row in self._rows(chunk)]
+            self.rows_written += self._write(conn, rows)
+        except Exception as e:
+            self.write_errors += 1
+            logger.error(f"Failed to write {self._pending} buffered packets: {e}")
+        elapsed = (time.perf_counter() - started) * 1000
+        self._pending = 0
+        self.flushes += 1
+        self.last_flush_ms = elapsed
+        self.max_flush_ms = max(self.max_flush_ms, elapsed)
+        self._flush_ms_total += elapsed
+
+    # --- Partitions, rollups and retention ---
+
+    def _maintain(self, conn: sqlite3.Connection):
+        now = self.event_time
+        self._next_maintenance = time.monotonic() + self.maintenance_interval
+        if now == -math.inf:
+            return
+        # 1. Roll up closed partitions with rows not yet in the rollups (late rows re-roll the partition)
+        for start, name, rows in conn.execute(
+                "SELECT start, name, rows FROM partitions WHERE end <= ? AND rows != rolled_rows",
+                (now - self.rollup_lag,)).fetchall():
+            with conn:
+                conn.execute(ROLLUP_SQL.format(table=name))
+                conn.execute("UPDATE partitions SET rolled_rows = ? WHERE start = ?", (rows, start))
+            self.partitions_rolled_up += 1
+
+        # 2. Drop whole raw partitions past the retention horizon (already rolled up above)
+        if self.raw_retention is not None:
+            expired = conn.execute("SELECT start, name FROM partitions WHERE end <= ? AND rows = rolled_rows",
+                                   (now - self.raw_retention,)).fetchall()
+            for start, name in expired:
+                with conn:
+                    conn.execute(f"DROP TABLE IF EXISTS {name}")
+                    conn.execute("DELETE FROM partitions WHERE start = ?", (start,))
+                self._partitions.pop(start, None)
+                self.partitions_dropped += 1
+            if expired:
+                conn.execute("PRAGMA incremental_vacuum")
+
+        # 3. Trim rollups (range delete on the primary key)
+        if self.rollup_retention is not None:
+            with conn:
+                conn.execute("DELETE FROM rollups_minute WHERE minute < ?", (now - self.rollup_retention,))
+
+    def maintain(self):
+        """Run rollups and retention now (normally done by the write path)."""
+        if self.write_behind and self._writer is not None and self._writer.is_alive():
+            self._next_maintenance = 0.0  # Picked up by the writer's next write
+            return
+        with self._lock:
+            if self._conn is None:
+                self._conn = self._get_conn()
+            self._maintain(self._conn)
+
+    def flush(self, timeout: Optional[float] = 10.0) -> bool:
+        """Write everything buffered now; returns False if it did not finish in time."""
+        if self._writer is None or not self._writer.is_alive():
+            return self._buffer.empty()
+        with self._flushed:
+            self._flush_requested += 1
+            target = self._flush_requested
+            return self._flushed.wait_for(lambda: self._flush_done >= target, timeout)
+
+    def close(self, timeout: Optional[float] = 10.0):
+        """Flush the buffer, stop the writer thread and close connections."""
+        if self._writer is not None:
+            self._stop.set()
+            self._writer.join(timeout)
+            self._writer = None
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        buffer = self._buffer.get_stats()
+        return {
+            "write_behind": self.write_behind,
+            "queue_depth": buffer["depth"] + self._pending,
+            "queue_high_water": buffer["high_water_mark"],
+            "dropped": buffer["dropped"],
+            "rows_written": self.rows_written,
+            "rows_expired": self.rows_expired,
+            "partitions": len(self._partitions),
+            "partitions_rolled_up": self.partitions_rolled_up,
+            "partitions_dropped": self.partitions_dropped,
+            "flushes": self.flushes,
+            "write_errors": self.write_errors,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+            "avg_flush_ms": round(self._flush_ms_total / self.flushes, 2) if self.flushes else 0.0,
+        }
+
+    # --- Reads ---
+
     def fetch_window(self, start_ts: float, end_ts: float) -> List[Dict[str, Any]]:
         """
         Fetch all packets within a time window.
+        Loads the whole window into memory; prefer iter_window for long ranges.
+        """
+        return [row for chunk in self.iter_window(start_ts, end_ts) for row in chunk]
+
+    def iter_window(
+        self,
+        start_ts: float,
+        end_ts: float,
+        chunk_size: int = 10_000,
+        columnar: bool = False,
+        device: Optional[str] = None,
+        port: Optional[int] = None,
+        protocol: Optional[int] = None,
+    ) -> Iterator[Union[List[Dict[str, Any]], PacketBatch]]:
+        """
+        Stream packets in [start_ts, end_ts) in chunks of ``chunk_size``
+        (the last one may be shorter), oldest partition first, in timestamp
+        order within each partition. Memory stays bounded by one chunk
+        however long the range.
+
+        Args:
+            chunk_size: Packets per chunk.
+            columnar: Yield PacketBatch chunks instead of lists of row dicts.
+            device: Only packets from or to this IP.
+            port: Only packets from or to this port.
+            protocol: Only this IP protocol number (6 = TCP, 17 = UDP).
+        """
+        where = "timestamp >= ? AND timestamp < ?"
+        params: List[Any] = [start_ts, end_ts]
+        if device is not None:
+            where += " AND (src_ip = ? OR dst_ip = ?)"
+            params += [device, device]
+        if port is not None:
+            where += " AND (src_port = ? OR dst_port = ?)"
+            params += [int(port), int(port)]
+        if protocol is not None:
+            where += " AND protocol = ?"
+            params.append(int(protocol))
+
+        try:
+            conn = self._get_conn()
+        except Exception as e:
+            logger.error(f"Failed to fetch window: {e}")
+            return
+        try:
+            if not columnar:
+                conn.row_factory = sqlite3.Row
+            carry: List[Any] = []
+            for table in self._tables(conn, start_ts, end_ts):
+                columns = BATCH_COLUMNS if columnar else "*"
+                cursor = conn.execute(f"SELECT {columns} FROM {table} WHERE {where} ORDER BY timestamp", params)
+                while True:
+                    rows = cursor.fetchmany(chunk_size - len(carry))
+                    if not rows:
+                        break
+                    carry.extend(rows)
+                    if len(carry) >= chunk_size:
+                        yield self._chunk(carry, columnar)
+                        carry = []
+            if carry:
+                yield self._chunk(carry, columnar)
+        except (sqlite3.Error, ValueError) as e:  # ValueError: TEXT flags of an unmigrated legacy table
+            logger.error(f"Failed to fetch window: {e}")
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _chunk(rows: List[Any], columnar: bool) -> Union[List[Dict[str, Any]], PacketBatch]:
+        if not columnar:
+            return [dict(row) for row in rows]
+        ts, src, dst, size, sport, dport, proto, flags = zip(*rows)
+        data = np.empty(len(rows), dtype=PACKET_DTYPE)
+        data["timestamp"] = np.array(ts, dtype=np.float64)
+        data["src_ip"] = ips_from_str(src)
+        data["dst_ip"] = ips_from_str(dst)
+        for name, values in (("size", size), ("src_port", sport), ("dst_port", dport),
+                             ("protocol", proto), ("flags", flags)):
+            data[name] = np.array(values, dtype=np.int64)
+        return PacketBatch(data)
+
+    def _tables(self, conn: sqlite3.Connection, start_ts: float, end_ts: float) -> List[str]:
+        """Packet tables that may hold rows in [start_ts, end_ts), oldest first."""
+        tables = ["packets"] if self._has_legacy else []  # Only if its migration failed
+        tables += [name for (name,) in conn.execute(
+            "SELECT name FROM partitions WHERE start < ? AND end > ? ORDER BY start", (end_ts, start_ts))]
+        return tables
+
+    def fetch_rollups(self, start_ts: float, end_ts: float, device_ip: Optional[str] = None) -> List[Dict[str, Any]]:
         """
+        Per-device, per-minute aggregates for minutes starting in [start_ts, end_ts).
+        Covers history beyond the raw retention; a partition shows up here
+        once it has closed and been rolled up.
+        """
+        query = "SELECT * FROM rollups_minute WHERE minute >= ? AND minute < ?"
+        params: List[Any] = [start_ts, end_ts]
+        if device_ip is not None:
+            query += " AND device_ip = ?"
+            params.append(device_ip)
         try:
             with self._get_conn() as conn:
                 conn.row_factory = sqlite3.Row
-                cursor = conn.execute("""
-                    SELECT * FROM packets WHERE timestamp >= ? AND timestamp < ?
-                """, (start_ts, end_ts))
-                rows = cursor.fetchall()
-                return [dict(row) for row in rows]
+                return [dict(row) for row in conn.execute(query + " ORDER BY minute, device_ip", params)]
         except Exception as e:
-            logger.error(f"Failed to fetch window: {e}")
+            logger.error(f"Failed to fetch rollups: {e}")
             return []
 
 if __name__ == "__main__":
@@ -87,9 +601,81 @@ if __name__ == "__main__":
         "protocol": 6,
         "src_port": 12345,
         "dst_port": 80,
-        "flags": "S",
+        "flags": 0x02, # SYN
         "proto_name": "TCP"
     }
     store.save_packet(sample)
+    store.save_batch(PacketBatch.from_records([sample]))
     print(f"Saved. Fetching...")
     print(store.fetch_window(0, 9999999999))
+
+    # Write-behind: 200k packets in 1k-packet batches, timed from the caller's side
+    from core.data.batch import PACKET_DTYPE
+    import numpy as np
+    data = np.zeros(1000, dtype=PACKET_DTYPE)
+    data["timestamp"] = time.time() + np.arange(1000) * 1e-3
+    data["src_ip"], data["dst_ip"], data["size"], data["protocol"] = 0xC0A80105, 0x08080808, 64, 6
+    batch = PacketBatch(data)
+    for write_behind in (False, True):
+        store = PacketStore("test.db", write_behind=write_behind)
+        started = time.perf_counter()
+        for _ in range(200):
+            store.save_batch(batch)
+        caller = time.perf_counter() - started
+        store.flush()
+        total = time.perf_counter() - started
+        print(f"write_behind={write_behind}: caller {caller:.3f}s, durable {total:.3f}s | {store.get_stats()}")
+        assert store.rows_written == 200_000 and store.write_errors == 0, store.get_stats()
+        store.close()
+
+    # Partitions: 3 days of traffic (one batch per 10 min), 6h raw retention
+    import os
+    for f in ("test_parts.db", "test_parts.db-wal", "test_parts.db-shm"):
+        if os.path.exists(f):
+            os.remove(f)
+    store = PacketStore("test_parts.db", raw_retention=6 * 3600, maintenance_interval=0)
+    for step in range(3 * 144):
+        data["timestamp"] = 1_700_000_000 + step * 600 + np.arange(1000) * 0.5
+        store.save_batch(PacketBatch(data))
+    end = float(data["timestamp"][-1])
+    started = time.perf_counter()
+    raw = store.fetch_window(end - 3600, end + 1)
+    rollups = store.fetch_rollups(end - 3 * 86400, end)
+    print(f"raw last hour: {len(raw)} rows, rollups over 3 days: {len(rollups)} minutes "
+          f"({time.perf_counter() - started:.3f}s) | {store.get_stats()}")
+    assert len(raw) == 6001 and min(row["timestamp"] for row in raw) >= end - 3600
+    # Raw partitions past the retention are gone, their minutes live on in the rollups
+    assert store.partitions_dropped and min(store._partitions) >= end - 6 * 3600 - store.partition_seconds
+    assert min(row["minute"] for row in rollups) < end - 2 * 86400
+
+    # Streaming: one device's TCP traffic over the retained range, 1k-row columnar chunks
+    started = time.perf_counter()
+    chunks = packets = 0
+    for chunk in store.iter_window(0, end + 1, chunk_size=1000, columnar=True,
+                                   device="192.168.1.5", protocol=6):
+        chunks, packets = chunks + 1, packets + len(chunk)
+    print(f"streamed {packets} packets in {chunks} chunks ({time.perf_counter() - started:.3f}s)")
+    assert packets == len(store.fetch_window(0, end + 1)) and chunks == math.ceil(packets / 1000)
+
+    # Legacy table: a pre-partitioning database (flags as TEXT) is migrated into partitions on open
+    for f in ("test_legacy.db", "test_legacy.db-wal", "test_legacy.db-shm"):
+        if os.path.exists(f):
+            os.remove(f)
+    with sqlite3.connect("test_legacy.db") as conn:
+        conn.execute("""CREATE TABLE packets (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp REAL, src_ip TEXT,
+                        dst_ip TEXT, size INTEGER, protocol INTEGER, src_port INTEGER, dst_port INTEGER,
+                        flags TEXT, proto_name TEXT)""")
+        conn.executemany("INSERT INTO packets (timestamp, src_ip, dst_ip, size, protocol, src_port, dst_port, "
+                         "flags, proto_name) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         [(1_700_000_000 + i * 60.0, "192.168.1.5", "8.8.8.8", 64, 6, 40000, 80,
+                           ("S", "SA", "A")[i % 3], "TCP") for i in range(600)])
+    store = PacketStore("test_legacy.db", raw_retention=None, maintenance_interval=0)
+    migrated = PacketBatch.concat(list(store.iter_window(0, 2e9, columnar=True)))
+    assert not store._has_legacy and len(migrated) == 600, len(migrated)
+    assert sorted(set(migrated.flags.tolist())) == [0x02, 0x10, 0x12]  # S, A, SA as bitmasks
+    rollups = store.fetch_rollups(0, 2e9)  # Closed hours (the oldest packets); SYN counts need integer flags
+    rolled = sum(row["packet_count"] for row in rollups)
+    assert rolled and sum(row["syn_count"] for row in rollups) == (rolled + 2) // 3  # Every third packet is "S"
+    with sqlite3.connect("test_legacy.db") as conn:
+        assert conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'packets'").fetchone() is None
+    print(f"legacy table migrated: {len(migrated)} packets, flags {sorted(set(migrated.flags.tolist()))}")
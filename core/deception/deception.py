@@ -8,8 +8,11 @@ by sending fake responses to attackers.
 import socket
 import random
 import threading
+import time
 from loguru import logger
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+
+from core.data.state import BoundedState
 
 # ANSI Colors for deception logs
 GREEN_BG = "\033[42m\033[97m"
@@ -21,13 +24,20 @@ class HoneypotController:
     Controls the Cowrie honeypot and manages traffic redirection.
     """
     
-    def __init__(self, cowrie_host: str = "cowrie", cowrie_ports: Dict[str, int] = None):
+    def __init__(
+        self,
+        cowrie_host: str = "cowrie",
+        cowrie_ports: Dict[str, int] = None,
+        max_redirects: Optional[int] = 10000,
+        redirect_ttl: Optional[float] = 3600.0,
+    ):
         self.cowrie_host = cowrie_host
         self.cowrie_ports = cowrie_ports or {
             "ssh": 2222,
             "telnet": 2223
         }
-        self.active_redirects = {}  # {attacker_ip: target_port}
+        # {attacker_ip: redirect info}; bounded so spoofed sources cannot grow it forever
+        self.active_redirects = BoundedState(max_entries=max_redirects, ttl=redirect_ttl, name="active_redirects")
         self._running = False
         
     def is_honeypot_available(self) -> bool:
@@ -128,10 +138,11 @@ class DeceptionOrchestrator:
     Coordinates honeypot redirection and fake packet injection.
     """
     
-    def __init__(self):
-        self.honeypot = HoneypotController()
+    def __init__(self, max_attackers: Optional[int] = 10000, attacker_ttl: Optional[float] = 3600.0):
+        self.honeypot = HoneypotController(max_redirects=max_attackers, redirect_ttl=attacker_ttl)
         self.injector = FakePacketInjector()
-        self.deceived_attackers = set()
+        self.deceived_attackers = BoundedState(max_entries=max_attackers, ttl=attacker_ttl,
+                                               name="deceived_attackers")  # {attacker_ip: first deceived at}
         
     def handle_attack(self, attacker_ip: str, target_port: int) -> Dict[str, Any]:
         """
@@ -153,7 +164,7 @@ class DeceptionOrchestrator:
         # 1. Redirect to honeypot
         if self.honeypot.redirect_attacker(attacker_ip, target_port):
             result["actions"].append("REDIRECTED_TO_HONEYPOT")
-            self.deceived_attackers.add(attacker_ip)
+            self.deceived_attackers.setdefault(attacker_ip, time.time())
         
         # 2. Determine protocol and inject fake data
         protocol = self._guess_protocol(target_port)
@@ -187,7 +198,11 @@ class DeceptionOrchestrator:
         return {
             "deceived_attackers": len(self.deceived_attackers),
             "active_redirects": len(self.honeypot.active_redirects),
-            "fake_packets_sent": self.injector.injection_count
+            "fake_packets_sent": self.injector.injection_count,
+            "evictions": {
+                "deceived_attackers": dict(self.deceived_attackers.evictions),
+                "active_redirects": dict(self.honeypot.active_redirects.evictions),
+            },
         }
 
 
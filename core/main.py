@@ -1,7 +1,6 @@
 import os
 import sys
 import time
-import queue
 import signal
 import numpy as np
 from loguru import logger
@@ -10,24 +9,75 @@ from dotenv import load_dotenv
 # Load envs
 load_dotenv()
 
-# Imports
+# Imports (hot path only: the ML stack and the agent load in the background, see core.startup)
 from core.perception.sniffer import NetworkSniffer
+from core.perception.handoff import PacketHandoff
+from core.perception.replay import PcapReplay
 from core.data.slm import SLMCompactor
-from core.data.features import FeatureExtractor
+from core.data.windows import WindowEngine
+from core.data.sequences import SequenceBuffer
+from core.data.flows import FlowTable
+from core.data.heavy_hitters import HeavyHitterFilter
+from core.analysis.flow_detector import FlowDetector
 from core.analysis.builder import EventBuilder
-from core.agent.brain import SentraAgent
-from core.pipeline import pipeline
 from core.data.store import PacketStore
+from core.data.archive import PacketArchive
 from core.deception.deception import deception  # Deception Orchestrator
 from core.web.publisher import dashboard  # Dashboard Event Publisher
+from core.startup import Deferred, print_import_report
+from core.analysis.online import OnlineUpdater
 
 # Config
 MODE = os.getenv("SENTRA_MODE", "INFERENCE").upper() # TRAIN or INFERENCE
 INTERFACE = os.getenv("SENTRA_INTERFACE", "en0")
-THRESHOLD = float(os.getenv("SENTRA_THRESHOLD", "2.5"))
+THRESHOLD = float(os.getenv("SENTRA_THRESHOLD", "0.99")) # Calibrated score (training percentile) that raises an attack
+WARN_THRESHOLD = float(os.getenv("SENTRA_WARN_THRESHOLD", "0.95")) # Calibrated score logged as elevated
 TRAIN_DURATION = int(os.getenv("SENTRA_TRAIN_DURATION", "60"))
+CAPTURE_BACKEND = os.getenv("SENTRA_CAPTURE_BACKEND", "scapy").lower() # scapy or ring
+CAPTURE_WORKERS = int(os.getenv("SENTRA_CAPTURE_WORKERS", "1")) # >1 = PACKET_FANOUT processes (ring only)
+BPF_FILTER = os.getenv("SENTRA_BPF_FILTER") or None # tcpdump expression, e.g. "tcp port 554"
+ALLOW_PORTS = [int(p) for p in os.getenv("SENTRA_ALLOW_PORTS", "").split(",") if p.strip()]
+ALLOW_HOSTS = [h.strip() for h in os.getenv("SENTRA_ALLOW_HOSTS", "").split(",") if h.strip()]
+QUEUE_SIZE = int(os.getenv("SENTRA_QUEUE_SIZE", "100000")) # packets
+QUEUE_BATCH = int(os.getenv("SENTRA_QUEUE_BATCH", "256"))
+QUEUE_POLICY = os.getenv("SENTRA_QUEUE_POLICY", "drop_oldest").lower() # drop_newest, drop_oldest or sample
+REPLAY_FILES = [f.strip() for f in os.getenv("SENTRA_REPLAY", "").split(",") if f.strip()] # pcap/pcapng instead of live capture
+REPLAY_SPEED = float(os.getenv("SENTRA_REPLAY_SPEED", "1.0")) # 1 = original timing, N = N x faster, 0 = max speed
+REPLAY_LOOP = os.getenv("SENTRA_REPLAY_LOOP", "0") == "1"
+WINDOW_SECONDS = float(os.getenv("SENTRA_WINDOW_SECONDS", "5")) # event-time window width
+WINDOW_HOP = float(os.getenv("SENTRA_WINDOW_HOP", "0")) or WINDOW_SECONDS # < width = sliding windows
+WINDOW_LATENESS = float(os.getenv("SENTRA_WINDOW_LATENESS", "2")) # seconds a late packet may still count
+HLL_ERROR = float(os.getenv("SENTRA_HLL_ERROR", "0.05")) # relative error of unique IP / port counts
+SEQUENCE_STEPS = int(os.getenv("SENTRA_SEQUENCE_STEPS", "5")) # windows per LSTM sequence
+HEAVY_HITTER_K = int(os.getenv("SENTRA_HEAVY_HITTER_K", "256")) # max devices featurized / scored per epoch
+FLOW_IDLE_TIMEOUT = float(os.getenv("SENTRA_FLOW_IDLE_TIMEOUT", "30")) # seconds without packets
+FLOW_ACTIVE_TIMEOUT = float(os.getenv("SENTRA_FLOW_ACTIVE_TIMEOUT", "300")) # max flow lifetime
+FLOW_HORIZON = float(os.getenv("SENTRA_FLOW_HORIZON", "600")) # seconds of finished flows checked for scans / floods
+FLOW_SCAN_TARGETS = int(os.getenv("SENTRA_FLOW_SCAN_TARGETS", "20")) # unanswered targets of one source = scan
+FLOW_FLOOD_SOURCES = int(os.getenv("SENTRA_FLOW_FLOOD_SOURCES", "100")) # unanswered sources to one port = flood
+STORE_WRITE_BEHIND = os.getenv("SENTRA_STORE_WRITE_BEHIND", "1") == "1" # raw log written by a background thread
+STORE_FLUSH_ROWS = int(os.getenv("SENTRA_STORE_FLUSH_ROWS", "5000")) # packets per write-behind insert
+STORE_FLUSH_INTERVAL = float(os.getenv("SENTRA_STORE_FLUSH_INTERVAL", "1")) # max seconds before a write
+STORE_RETENTION = float(os.getenv("SENTRA_STORE_RETENTION_HOURS", "24")) * 3600 # raw packets kept (hourly partitions)
+STORE_ROLLUP_RETENTION = float(os.getenv("SENTRA_STORE_ROLLUP_DAYS", "90")) * 86400 # per-minute device rollups kept
+ARCHIVE_DIR = os.getenv("SENTRA_ARCHIVE_DIR", "sentra_archive") # columnar packet history for retraining ("" = off)
+ARCHIVE_RETENTION = float(os.getenv("SENTRA_ARCHIVE_RETENTION_HOURS", "168")) * 3600
+TRAIN_ARCHIVE_HOURS = float(os.getenv("SENTRA_TRAIN_ARCHIVE_HOURS", "0")) # TRAIN from the last N archived hours instead of live
+TRAIN_SLICE_SECONDS = float(os.getenv("SENTRA_TRAIN_SLICE_SECONDS", "600")) # Archive read per step when training from history
+TRAIN_CHUNK_PACKETS = int(os.getenv("SENTRA_TRAIN_CHUNK_PACKETS", "50000")) # Store rows per chunk when training from history
+MAX_DEVICES = int(os.getenv("SENTRA_MAX_DEVICES", "4096")) # per-device state bound (LRU evicted beyond it)
+MAX_FLOWS = int(os.getenv("SENTRA_MAX_FLOWS", "100000")) # flow table bound (LRU flows ended early)
+SLM_HALF_LIFE = float(os.getenv("SENTRA_SLM_HALF_LIFE", "300")) # seconds for a graph edge's weight to halve
+SLM_INTERVAL = float(os.getenv("SENTRA_SLM_INTERVAL", "30")) # max seconds between community re-detections
+STATE_MAX_BYTES = int(float(os.getenv("SENTRA_STATE_MAX_MB", "256")) * 2**20) # memory budget per keyed-state table
+ONLINE_UPDATE = os.getenv("SENTRA_ONLINE_UPDATE", "0") == "1" # INFERENCE: keep adapting the model to benign windows
+ONLINE_INTERVAL = float(os.getenv("SENTRA_ONLINE_INTERVAL", "300")) # seconds between incremental updates
+ONLINE_MIN_SAMPLES = int(os.getenv("SENTRA_ONLINE_MIN_SAMPLES", "512")) # benign samples needed per update
+ONLINE_RATE = float(os.getenv("SENTRA_ONLINE_RATE", "0.05")) # weight of new samples per update
+ONLINE_LSTM_EPOCHS = int(os.getenv("SENTRA_ONLINE_LSTM_EPOCHS", "1")) # LSTM-AE fine-tuning epochs (needs TensorFlow)
 
 RUNNING = True
+STARTED = time.time()
 
 def handle_signal(sig, frame):
     global RUNNING
@@ -37,173 +87,271 @@ def handle_signal(sig, frame):
 signal.signal(signal.SIGINT, handle_signal)
 signal.signal(signal.SIGTERM, handle_signal)
 
+def train_from_archive():
+    """
+    TRAIN mode on history: window the last TRAIN_ARCHIVE_HOURS of packets and fit.
+    Packets are streamed in slices (archive) or chunks (packet store when the
+    archive is empty), so memory does not grow with the range.
+    """
+    from core.pipeline import pipeline
+    archive = PacketArchive(ARCHIVE_DIR)
+    oldest, newest = archive.time_range()
+    pipeline.load_or_create()
+    window_args = dict(width=WINDOW_SECONDS, hop=WINDOW_HOP, steps=SEQUENCE_STEPS, hll_error=HLL_ERROR)
+    if newest is None:
+        end = time.time()
+        logger.info(f"[TRAIN] Archive {ARCHIVE_DIR} is empty; streaming the last {TRAIN_ARCHIVE_HOURS}h from the packet store")
+        pipeline.train(PacketStore().iter_window(end - TRAIN_ARCHIVE_HOURS * 3600, end, chunk_size=TRAIN_CHUNK_PACKETS,
+                                                 columnar=True), **window_args)
+        return
+    start = max(oldest, newest - TRAIN_ARCHIVE_HOURS * 3600)
+    logger.info(f"[TRAIN] Training on archived packets {start:.0f} - {newest:.0f} from {ARCHIVE_DIR}")
+    slices = (archive.read_window(t, min(t + TRAIN_SLICE_SECONDS, newest + 1))
+              for t in np.arange(start, newest + 1, TRAIN_SLICE_SECONDS))
+    pipeline.train(slices, **window_args)
+
+def load_model():
+    """Load (or create) the ensemble; runs on a startup thread."""
+    from core.pipeline import pipeline
+    # Keras is only needed to fine-tune the LSTM-AE online; scoring uses NumPy weights
+    model = pipeline.load_or_create(keras=ONLINE_UPDATE and ONLINE_LSTM_EPOCHS > 0)
+    if model.is_fitted and not model.calibration:
+        # Saved before calibrated scoring: its scores have no threshold to compare against
+        logger.warning("Model has no calibration tables; treating it as not fitted. "
+                       "Retrain it (SENTRA_MODE=TRAIN) to score windows.")
+        model.is_fitted = False
+    if MODE == "INFERENCE" and not model.is_fitted:
+        logger.warning("Mode is INFERENCE but model is not fitted! Windows will not be scored.")
+    return model
+
+def save_updated_model(model):
+    """OnlineUpdater callback: persist each incremental update."""
+    from core.pipeline import pipeline
+    pipeline.model = model
+    pipeline.save()
+
+def build_agent():
+    """LangGraph agent with its LLM, Neo4j and ChromaDB memory; runs on a startup thread."""
+    from core.agent.brain import SentraAgent
+    return SentraAgent()
+
 def run_app():
     global RUNNING
-    if os.geteuid() != 0:
-        logger.error("Sentra Core must run as root to capture packets.")
+    if MODE == "TRAIN" and TRAIN_ARCHIVE_HOURS > 0 and ARCHIVE_DIR:
+        train_from_archive()
+        return
+
+    if not REPLAY_FILES and os.geteuid() != 0:
+        logger.error("Sentra Core must run as root to capture packets (or set SENTRA_REPLAY to replay a pcap).")
         sys.exit(1)
 
     logger.info(f"=== SENTRA CORE v1.2 | MODE: {MODE} | PHASE 9: ACTIVE (Dynamic Realism) ===")
     
-    # 1. Pipeline & Model
-    model = pipeline.load_or_create()
-    
-    if MODE == "INFERENCE" and not model.is_fitted:
-        logger.warning("Mode is INFERENCE but model is not fitted! Switching to TRAIN mode temporarily.")
-        # Fallback to training if no model exists? Or just crash?
-        # For robustness let's warn.
-    
-    # 2. Components
-    packet_queue = queue.Queue()
-    sniffer = NetworkSniffer(interface=INTERFACE, store_queue=packet_queue)
-    store = PacketStore() # Raw Logger
-    slm = SLMCompactor()
-    fe = FeatureExtractor()
-    builder = EventBuilder(threshold=THRESHOLD)
-    agent = SentraAgent()
-    
+    # 1. Capture first: packets queue in the hand-off while everything else loads
+    packet_queue = PacketHandoff(maxsize=QUEUE_SIZE, batch_size=QUEUE_BATCH, policy=QUEUE_POLICY)
+    if REPLAY_FILES:
+        sniffer = PcapReplay(REPLAY_FILES, store_queue=packet_queue, speed=REPLAY_SPEED, loop=REPLAY_LOOP)
+    else:
+        sniffer = NetworkSniffer(
+            interface=INTERFACE,
+            store_queue=packet_queue,
+            backend=CAPTURE_BACKEND,
+            bpf_filter=BPF_FILTER,
+            allow_ports=ALLOW_PORTS,
+            allow_hosts=ALLOW_HOSTS,
+            workers=CAPTURE_WORKERS,
+        )
     sniffer.start()
+    logger.info(f"[STARTUP] Capture started {time.time() - STARTED:.2f}s after launch")
+
+    # 2. Model and agent (slow imports, database connections) build in the background
+    model_loader = Deferred(load_model, "model")
+    agent_loader = Deferred(build_agent, "agent")
+
+    # 3. Components
+    store = PacketStore(write_behind=STORE_WRITE_BEHIND, flush_rows=STORE_FLUSH_ROWS,
+                        flush_interval=STORE_FLUSH_INTERVAL, raw_retention=STORE_RETENTION,
+                        rollup_retention=STORE_ROLLUP_RETENTION) # Raw Logger
+    archive = PacketArchive(ARCHIVE_DIR) if ARCHIVE_DIR else None # Columnar history (retraining / forensics)
+    slm = SLMCompactor(half_life=SLM_HALF_LIFE, recompute_interval=SLM_INTERVAL) # Persistent device graph
+    windows = WindowEngine(width=WINDOW_SECONDS, hop=WINDOW_HOP, lateness=WINDOW_LATENESS, hll_error=HLL_ERROR,
+                           max_devices=MAX_DEVICES, max_bytes=STATE_MAX_BYTES)
+    sequences = SequenceBuffer(steps=SEQUENCE_STEPS, capacity=MAX_DEVICES) # Last T windows per device for the LSTM-AE
+    flows = FlowTable(idle_timeout=FLOW_IDLE_TIMEOUT, active_timeout=FLOW_ACTIVE_TIMEOUT,
+                      max_flows=MAX_FLOWS, max_bytes=STATE_MAX_BYTES)
+    flow_detector = FlowDetector(horizon=FLOW_HORIZON, scan_targets=FLOW_SCAN_TARGETS,
+                                 flood_sources=FLOW_FLOOD_SOURCES, max_keys=MAX_DEVICES)
+    heavy = HeavyHitterFilter(k=HEAVY_HITTER_K, epoch=WINDOW_SECONDS)
+    epochs_reported = 0
+    builder = EventBuilder(threshold=THRESHOLD)
+    updater = None # OnlineUpdater, started with the first fitted model
     
-    # 3. State
-    buffer = []
+    # 4. State
     training_data = [] # (X, Seq_X)
     start_time = time.time()
     
-    # Adaptive baseline for realistic scoring
-    score_history = []
-    baseline = None
-    baseline_window = 50  # Rolling window for baseline calculation
-    
     logger.info("System initialized. Waiting for traffic...")
     
     while RUNNING:
         try:
-            # Drain queue
-            while not packet_queue.empty():
-                pkt = packet_queue.get_nowait()
-                buffer.append(pkt)
-                store.save_packet(pkt) # Log RAW packet
+            # Drain hand-off (one lock round-trip for everything queued)
+            chunk = packet_queue.drain()
+            if len(chunk):
+                store.save_batch(chunk) # Log RAW packets
+                if archive is not None:
+                    archive.append(chunk)
+                    archive.drop_before(float(chunk.timestamp.max()) - ARCHIVE_RETENTION)
+                # Under source-cardinality floods sources beyond the top-k are scored as "* -> dst:port" entities
+                focused = heavy.update(chunk)
+                windows.update(focused) # Assign to event-time windows
+                flows.update(chunk) # Bidirectional 5-tuple flows (bounded state: real sources)
+                if slm.update(chunk): # Communities re-detected (periodic or significant change)
+                    logger.debug(f"[SLM] {slm.get_stats()}")
+
+            if heavy.epochs_closed != epochs_reported:
+                epochs_reported = heavy.epochs_closed
+                report = heavy.last_report
+                if report.get("focusing"):
+                    top_dst = report["destinations"][0] if report["destinations"] else {}
+                    top_port = report["ports"][0] if report["ports"] else {}
+                    logger.warning(
+                        f"[HEAVY] {report['distinct_sources']} distinct sources (> k={heavy.k}); others scored per destination | "
+                        f"Top destination: {top_dst.get('key')} ({top_dst.get('share', 0):.0%}) | "
+                        f"Top port: {top_port.get('key')} ({top_port.get('share', 0):.0%})"
+                    )
+
+            # A finished replay flushes the last partial batch, then shuts down
+            replay_done = getattr(sniffer, "finished", False) and packet_queue.empty()
             
-            # Process Batch
-            if len(buffer) >= 10:
-                # Flow & Feature
-                # slm.compact(buffer)... (SLM currently returns graph, not flows, simplifying for now)
-                # We use feature extractor directly on packet buffer (it groups by IP internally)
-                features_df = fe.extract_features(buffer)
-                
+            # Process closed windows: every model input covers the same span of event time
+            if replay_done:
+                closed = windows.flush()
+            else:
+                # Live capture lets wall time move the watermark through quiet periods
+                closed = windows.advance(None if REPLAY_FILES else time.time())
+
+            finished_flows = flows.flush() if replay_done else flows.advance(None if REPLAY_FILES else time.time())
+            if finished_flows:
+                one_sided = sum(1 for f in finished_flows if f["bwd_packets"] == 0)
+                logger.debug(f"[FLOWS] {len(finished_flows)} finished ({one_sided} without reply) | "
+                             f"{len(flows)} active")
+                # Slow scans / distributed floods: too spread out in time or sources for any one window
+                for alert in flow_detector.update(finished_flows):
+                    logger.critical(f"[FLOWS] {alert['kind'].upper()} DETECTED: {alert['device']} | "
+                                    f"{alert['peers']} unanswered peers in {alert['last_seen'] - alert['first_seen']:.0f}s")
+                    event = builder.build_event(alert["device"], {"aggregate": 1.0}, context=alert)
+                    if event:
+                        dashboard.attack_detected(alert["device"], event["severity"], 1.0)
+                        agent = agent_loader.result(timeout=0)
+                        if agent is not None:
+                            agent.run(event)
+
+            for n_window, window in enumerate(closed):
+                if not RUNNING:
+                    break
+                last_window = n_window == len(closed) - 1
+                features_df = window.features
+
+                sequences.push(features_df)
+
                 if not features_df.empty:
-                    X = features_df.fillna(0).values
-                    # Fake sequence for demo: (N, 5, F)
-                    X_seq = np.zeros((X.shape[0], 5, X.shape[1]))
-                    for i in range(5): X_seq[:, i, :] = X
+                    # Views over the sequence buffer: rows are the devices active in the last T windows
+                    X = sequences.latest()
+                    X_seq = sequences.sequences() # (N, T, F)
                     
                     if MODE == "TRAIN":
-                        training_data.append((X, X_seq))
+                        training_data.append((X.copy(), X_seq.copy())) # Views are overwritten by the next window
                         elapsed = time.time() - start_time
                         logger.info(f"[TRAIN] Gathering data... {int(elapsed)}/{TRAIN_DURATION}s | Samples: {len(X)}")
                         
-                        if elapsed >= TRAIN_DURATION:
-                            logger.success("Training duration reached.")
+                        if elapsed >= TRAIN_DURATION or (replay_done and last_window):
+                            logger.success("Training duration reached." if not replay_done else "Replay finished.")
                             # Aggregate
                             X_all = np.vstack([t[0] for t in training_data])
                             seq_all = np.vstack([t[1] for t in training_data])
                             
+                            model_loader.result() # Existing model (if any) is replaced
+                            from core.pipeline import pipeline
                             pipeline.train(X_all, seq_all)
                             logger.success("Model trained and saved. Exiting (or switching to inference).")
                             RUNNING = False # Stop after training? Or switch?
                             # For Docker one-shot training, we stop.
                     
                     elif MODE == "INFERENCE":
-                        if not model.is_fitted:
+                        model = model_loader.result() # Blocks only if the first window beats the model load
+                        if ONLINE_UPDATE and updater is None and model is not None and model.is_fitted:
+                            updater = OnlineUpdater(model, interval=ONLINE_INTERVAL, min_samples=ONLINE_MIN_SAMPLES,
+                                                    rate=ONLINE_RATE, lstm_epochs=ONLINE_LSTM_EPOCHS,
+                                                    on_update=save_updated_model)
+                            updater.start()
+                        if updater is not None:
+                            model = updater.model # Latest incremental update
+                        if model is None or not model.is_fitted:
                             logger.warning("Model not fitted, skipping prediction.")
                         else:
-                            logger.debug(f"Processing batch of {len(buffer)} packets...")
+                            logger.debug(f"Window [{window.start:.0f}, {window.end:.0f}): "
+                                         f"{window.packets} packets from {len(features_df)} devices...")
                             
+                            # Calibrated per device, then per window: 0.99 = one normal window in a hundred,
+                            # however many devices it holds (the worst device is the target)
                             scores = model.score(X, X_seq)
-                            raw_score = scores['aggregate'].mean()
-                            gmm_score = scores.get('gmm', raw_score * 0.5)
-                            if hasattr(gmm_score, 'mean'):
-                                gmm_score = gmm_score.mean()
-                            
-                            # Sanity check: raw_score should be in reasonable range
-                            # If score is > 1 million, it's likely corrupted - use fallback
-                            if raw_score > 1000000:
-                                logger.warning(f"Outlier score detected: {raw_score:.0f}, using capped value")
-                                raw_score = min(raw_score, 200000)  # Cap at 200k
-                            
-                            # Update baseline tracker with outlier filtering
-                            if len(score_history) > 0:
-                                median_score = sorted(score_history)[len(score_history)//2]
-                                # Only add if not a massive outlier (10x median)
-                                if raw_score < median_score * 10:
-                                    score_history.append(raw_score)
-                                else:
-                                    logger.debug(f"Skipping outlier: {raw_score:.0f} (median: {median_score:.0f})")
+                            worst = int(np.argmax(scores['aggregate']))
+                            raw_score = model.window_score(scores['aggregate'])
+                            gmm_score = float(scores['gmm'][worst])
+                            target_ip = sequences.devices[worst]
+                            aggregate = heavy.describe(target_ip) # Many sources folded into one entity
+                            if aggregate is not None:
+                                target_ip = aggregate
+                            severity = int(min(100, raw_score * 100))
+
+                            if updater is not None and raw_score < THRESHOLD:
+                                # Window raised no alert: all of it is normal traffic, minus devices under deception
+                                benign = np.array([deception.deceived_attackers.peek(ip) is None
+                                                   for ip in sequences.devices], dtype=bool)
+                                updater.submit(X[benign], X_seq[benign])
+
+                            if raw_score < WARN_THRESHOLD:
+                                logger.opt(colors=True).info(
+                                    f"<green>[DEFENSE] System Stable</green> | "
+                                    f"Score: <white>{raw_score:.4f}</white> (GMM: {gmm_score:.2f})"
+                                )
+                            elif raw_score < THRESHOLD:
+                                # Elevated - worth watching
+                                logger.opt(colors=True).warning(
+                                    f"<yellow>[DEFENSE] Anomaly Score:</yellow> <white>{raw_score:.4f}</white> "
+                                    f"(GMM: {gmm_score:.2f}) | {target_ip}"
+                                )
                             else:
-                                score_history.append(raw_score)
-                            
-                            if len(score_history) > baseline_window:
-                                score_history.pop(0)
-                            
-                            # Compute adaptive baseline (mean + std of recent history)
-                            if len(score_history) >= 5:
-                                import statistics
-                                base_mean = statistics.mean(score_history)
-                                base_std = statistics.stdev(score_history) if len(score_history) > 1 else base_mean * 0.1
-                                
-                                # Score deviation from baseline
-                                if base_std > 0:
-                                    z_score = (raw_score - base_mean) / base_std
-                                else:
-                                    z_score = 0
-                                
-                                # Severity based on how many std deviations above baseline
-                                severity = int(min(100, max(0, 50 + z_score * 25)))
-                                
-                                # Debug: show z-score
-                                logger.debug(f"Z-Score: {z_score:.2f} | Base: {base_mean:.0f} ± {base_std:.0f}")
-                                
-                                # TUNED THRESHOLDS (more sensitive):
-                                # - z_score < 0.3: Normal 
-                                # - z_score 0.3-0.7: Elevated/Warning
-                                # - z_score >= 0.7: Attack
-                                
-                                if z_score < 0.3:
-                                    # Normal - within 0.3 std of baseline
-                                    logger.opt(colors=True).info(
-                                        f"<green>[DEFENSE] System Stable</green> | "
-                                        f"Score: <white>{raw_score:.4f}</white> (GMM: {gmm_score:.2f})"
-                                    )
-                                elif z_score < 0.7:
-                                    # Elevated - worth watching
-                                    logger.opt(colors=True).warning(
-                                        f"<yellow>[DEFENSE] Anomaly Score:</yellow> <white>{raw_score:.4f}</white> (GMM: {gmm_score:.2f})"
-                                    )
-                                else:
-                                    # ATTACK - more than 0.7 std above baseline
-                                    target_ip = features_df.index[0]
-                                    logger.opt(colors=True).info(
-                                        f"<yellow>[DEFENSE] Anomaly Score:</yellow> <white>{raw_score:.4f}</white> (GMM: {gmm_score:.2f})"
-                                    )
-                                    # Use ANSI escape codes for red background
+                                logger.opt(colors=True).info(
+                                    f"<yellow>[DEFENSE] Anomaly Score:</yellow> <white>{raw_score:.4f}</white> (GMM: {gmm_score:.2f})"
+                                )
+                                # Use ANSI escape codes for red background
+                                logger.critical(
+                                    f"\033[41m\033[97m !!! ATTACK DETECTED !!! \033[0m Severity: \033[91m{severity}\033[0m"
+                                )
+
+                                event = builder.build_event(target_ip, {"aggregate": float(raw_score)})
+                                if event:
+                                    # Publish to dashboard
+                                    dashboard.attack_detected(target_ip, severity, raw_score)
+                                    
+                                    agent = agent_loader.result(timeout=0)
+                                    if agent is not None:
+                                        agent.run(event)
+                                    else:
+                                        logger.warning("[AGENT] Not available (starting or failed); response skipped.")
                                     logger.critical(
-                                        f"\033[41m\033[97m !!! ATTACK DETECTED !!! \033[0m Severity: \033[91m{severity}\033[0m"
+                                        f"\033[41m\033[97m AGENT RESPONSE: \033[0m {{'intent': 'DEPLOY_HONEYPOT', 'target': '\033[93m{target_ip}\033[0m'}}"
                                     )
                                     
-                                    event = builder.build_event(target_ip, {"aggregate": float(raw_score)})
-                                    if event:
-                                        # Publish to dashboard
-                                        dashboard.attack_detected(target_ip, severity, raw_score)
-                                        
-                                        agent.run(event)
-                                        logger.critical(
-                                            f"\033[41m\033[97m AGENT RESPONSE: \033[0m {{'intent': 'DEPLOY_HONEYPOT', 'target': '\033[93m{target_ip}\033[0m'}}"
-                                        )
-                                        
-                                        # Publish LLM decision to dashboard
-                                        dashboard.llm_decision("DEPLOY_HONEYPOT", target_ip, "High severity anomaly detected")
-                                        
-                                        # ACTIVATE DECEPTION LAYER
+                                    # Publish LLM decision to dashboard
+                                    dashboard.llm_decision("DEPLOY_HONEYPOT", target_ip, "High severity anomaly detected")
+                                    
+                                    # ACTIVATE DECEPTION LAYER (needs one source to redirect)
+                                    if aggregate is not None:
+                                        logger.warning(f"[DECEPTION] {target_ip}: traffic from many sources, "
+                                                       "no single attacker to redirect.")
+                                    else:
                                         try:
                                             deception_result = deception.handle_attack(target_ip, 554)
                                             # Log with green background for honeypotted message
@@ -216,11 +364,11 @@ def run_app():
                                             dashboard.deception_success(target_ip, 73)
                                         except Exception as e:
                                             logger.warning(f"Deception layer error: {e}")
-                            else:
-                                # Still building baseline
-                                logger.info(f"[BASELINE] Collecting samples... {len(score_history)}/5")
-            
-                buffer = [] # Flush
+
+            if replay_done:
+                logger.success("Replay complete.")
+                RUNNING = False
+                break
             
             time.sleep(0.5)
             
@@ -229,7 +377,29 @@ def run_app():
             time.sleep(1)
 
     sniffer.stop()
+    if updater is not None:
+        updater.stop()
+        logger.info(f"Online update stats: {updater.get_stats()}")
+    store.close() # Writes out the write-behind buffer
+    if archive is not None:
+        archive.flush()
+        logger.info(f"Archive stats: {archive.get_stats()}")
+    logger.info(f"Capture stats: {sniffer.get_stats()}")
+    logger.info(f"Store stats: {store.get_stats()}")
+    logger.info(f"Window stats: {windows.get_stats()}")
+    logger.info(f"Flow stats: {flows.get_stats()} | Flow detector: {flow_detector.get_stats()}")
+    logger.info(f"Heavy-hitter stats: {heavy.get_stats()}")
+    logger.info(f"SLM stats: {slm.get_stats()}")
+    logger.info(f"Sequence devices evicted: {sequences.devices_evicted} | Deception stats: {deception.get_stats()}")
     logger.info("Shutdown complete.")
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Sentra Core")
+    parser.add_argument("--import-time", nargs="*", metavar="MODULE",
+                        help="Print what importing each module costs (default: startup path and deferred stages) and exit")
+    args = parser.parse_args()
+    if args.import_time is not None:
+        print_import_report(args.import_time or ["core.main", "core.pipeline", "core.agent.brain"])
+        sys.exit(0)
     run_app()
@@ -0,0 +1,188 @@
+"""
+Fast Header Decoder
+
+Decodes Ethernet / IPv4 / TCP / UDP headers straight from raw frame bytes
+with precompiled ``struct`` formats. This replaces Scapy dissection on the
+capture path: no Packet objects are built and TCP flags come out as an
+integer bitmask rather than a string.
+"""
+
+import socket
+import struct
+from typing import Dict, Any, Optional, Tuple, Union
+
+# Link-layer types (pcap DLT_* / LINKTYPE_* values)
+DLT_NULL = 0
+DLT_EN10MB = 1
+DLT_RAW = 101
+DLT_LOOP = 108
+DLT_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+RAW_LINKTYPES = (DLT_RAW, 12, 14, LINKTYPE_IPV4)
+
+ETH_P_IP = 0x0800
+VLAN_TPIDS = (0x8100, 0x88A8, 0x9100)
+
+# TCP flag bits (low byte of the TCP flags field)
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_PSH = 0x08
+TCP_ACK = 0x10
+TCP_URG = 0x20
+TCP_ECE = 0x40
+TCP_CWR = 0x80
+
+# Same letter order Scapy uses when it renders TCP flags
+FLAG_LETTERS = "FSRPAUEC"
+
+PROTO_NAMES = {6: "TCP", 17: "UDP"}
+
+ETH_TYPE = struct.Struct("!H")
+IPV4_HDR = struct.Struct("!BxHxxxxxB2x4s4s")  # ver_ihl, total_len, proto, src, dst
+IPV4_HDR_INT = struct.Struct("!BxHxxxxxB2xII")  # same, addresses as uint32
+PORTS = struct.Struct("!HH")
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+def flags_to_str(flags: int) -> str:
+    """Render a flag bitmask the way Scapy does (e.g. 0x12 -> 'SA')."""
+    return "".join(c for i, c in enumerate(FLAG_LETTERS) if flags & (1 << i))
+
+
+def parse_flags(value: Any) -> int:
+    """
+    Normalize a flags value to an integer bitmask.
+
+    Accepts ints, Scapy-style letter strings ('S', 'PA') and numeric strings
+    (older databases store the bitmask in a TEXT column).
+    """
+    if value is None:
+        return 0
+    if isinstance(value, (int, float)):
+        return 0 if value != value else int(value)  # NaN -> 0
+    text = str(value)
+    if text.isdigit():
+        return int(text)
+    bits = 0
+    for letter in text:
+        idx = FLAG_LETTERS.find(letter)
+        if idx >= 0:
+            bits |= 1 << idx
+    return bits
+
+
+def ip_offset(frame: Buffer, linktype: int = DLT_EN10MB) -> Optional[int]:
+    """
+    Return the offset of the IPv4 header inside a frame, or None if the
+    frame does not carry IPv4.
+    """
+    if linktype == DLT_EN10MB:
+        off = 12
+        if len(frame) < off + 2:
+            return None
+        (ethertype,) = ETH_TYPE.unpack_from(frame, off)
+        # Skip (possibly stacked) VLAN tags
+        while ethertype in VLAN_TPIDS:
+            off += 4
+            if len(frame) < off + 2:
+                return None
+            (ethertype,) = ETH_TYPE.unpack_from(frame, off)
+        return off + 2 if ethertype == ETH_P_IP else None
+
+    if linktype in RAW_LINKTYPES:
+        return 0
+
+    if linktype == DLT_LINUX_SLL:
+        if len(frame) < 16:
+            return None
+        (ethertype,) = ETH_TYPE.unpack_from(frame, 14)
+        return 16 if ethertype == ETH_P_IP else None
+
+    if linktype in (DLT_NULL, DLT_LOOP):
+        # 4-byte address family in host (NULL) or network (LOOP) byte order
+        if len(frame) < 4:
+            return None
+        family = frame[0] | frame[3]
+        return 4 if family == socket.AF_INET else None
+
+    return None
+
+
+def decode_frame(frame: Buffer, timestamp: float, linktype: int = DLT_EN10MB) -> Optional[Dict[str, Any]]:
+    """
+    Decode one captured frame into packet metadata.
+
+    Produces the fields the pipeline expects (timestamp, src_ip, dst_ip,
+    size, protocol, proto_name and, for TCP/UDP, src_port / dst_port).
+    TCP packets carry ``flags`` as an int bitmask. Returns None for
+    non-IPv4 or truncated frames.
+    """
+    off = ip_offset(frame, linktype)
+    if off is None or len(frame) < off + IPV4_HDR.size:
+        return None
+
+    ver_ihl, _total_len, proto, src, dst = IPV4_HDR.unpack_from(frame, off)
+    if ver_ihl >> 4 != 4:
+        return None
+
+    metadata = {
+        "timestamp": timestamp,
+        "src_ip": socket.inet_ntoa(src),
+        "dst_ip": socket.inet_ntoa(dst),
+        "size": len(frame),
+        "protocol": proto,
+        "proto_name": PROTO_NAMES.get(proto, "OTHER"),
+    }
+
+    l4 = off + (ver_ihl & 0x0F) * 4
+    if proto == 6:
+        if len(frame) < l4 + 14:
+            metadata["proto_name"] = "OTHER"
+            return metadata
+        metadata["src_port"], metadata["dst_port"] = PORTS.unpack_from(frame, l4)
+        metadata["flags"] = frame[l4 + 13]
+    elif proto == 17:
+        if len(frame) < l4 + 4:
+            metadata["proto_name"] = "OTHER"
+            return metadata
+        metadata["src_port"], metadata["dst_port"] = PORTS.unpack_from(frame, l4)
+
+    return metadata
+
+
+def decode_row(frame: Buffer, timestamp: float, linktype: int = DLT_EN10MB) -> Optional[Tuple[int, ...]]:
+    """
+    Decode one frame into a row for core.data.batch.PacketBatch:
+    (timestamp, src_ip, dst_ip, size, src_port, dst_port, protocol, flags)
+    with addresses as uint32. Ports and flags are 0 when not applicable.
+    """
+    off = ip_offset(frame, linktype)
+    if off is None or len(frame) < off + IPV4_HDR_INT.size:
+        return None
+
+    ver_ihl, _total_len, proto, src, dst = IPV4_HDR_INT.unpack_from(frame, off)
+    if ver_ihl >> 4 != 4:
+        return None
+
+    sport = dport = flags = 0
+    l4 = off + (ver_ihl & 0x0F) * 4
+    if proto == 6 and len(frame) >= l4 + 14:
+        sport, dport = PORTS.unpack_from(frame, l4)
+        flags = frame[l4 + 13]
+    elif proto == 17 and len(frame) >= l4 + 4:
+        sport, dport = PORTS.unpack_from(frame, l4)
+
+    return (timestamp, src, dst, len(frame), sport, dport, proto, flags)
+
+
+if __name__ == "__main__":
+    # Test: a SYN from 10.0.0.1:12345 -> 10.0.0.2:80 over Ethernet
+    eth = bytes(6) + bytes(6) + b"\x08\x00"
+    ip = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 40, 0, 0, 64, 6, 0,
+                     socket.inet_aton("10.0.0.1"), socket.inet_aton("10.0.0.2"))
+    tcp = struct.pack("!HHIIBBHHH", 12345, 80, 0, 0, 0x50, TCP_SYN, 8192, 0, 0)
+    decoded = decode_frame(eth + ip + tcp, 0.0)
+    print(decoded, flags_to_str(decoded["flags"]))
+    print(decode_row(eth + ip + tcp, 0.0))
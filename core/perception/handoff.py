@@ -0,0 +1,219 @@
+"""
+Bounded Packet Hand-off
+
+Moves decoded packets from the capture thread to the analysis loop in
+batches. Capacity is bounded in packets, and a full hand-off applies a
+configurable overload policy instead of growing memory without limit:
+
+- ``drop_newest``: keep what is queued, drop the overflow of the new batch
+- ``drop_oldest``: evict the oldest queued packets to make room
+- ``sample``: thin the new batch to 1-in-N and let the survivors replace
+  the oldest queued packets, so the queue keeps a mix of old and new
+
+The lock is taken once per batch, not once per packet.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+POLICIES = ("drop_newest", "drop_oldest", "sample")
+
+
+class PacketHandoff:
+    """
+    Single-producer / single-consumer batched queue.
+
+    Batches can be lists or any sliceable batch type with a ``concat``
+    classmethod (e.g. core.data.batch.PacketBatch).
+
+    ``put`` is a drop-in for ``queue.Queue.put`` on the producer side: it
+    stages packets locally and publishes them once ``batch_size`` is
+    reached or ``flush_interval`` has passed. Only one thread may call
+    ``put``/``flush``; ``put_batch`` is safe from any thread.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 100_000,
+        batch_size: int = 256,
+        policy: str = "drop_oldest",
+        flush_interval: float = 0.1,
+        sample_every: int = 10,
+    ):
+        """
+        Args:
+            maxsize: Capacity in packets.
+            batch_size: Packets staged by put() before they are published.
+            policy: Overload policy, one of POLICIES.
+            flush_interval: Max seconds a partially staged batch waits.
+            sample_every: Keep 1 of every N packets when full (policy='sample').
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overload policy '{policy}'. Choose from {POLICIES}.")
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.policy = policy
+        self.flush_interval = flush_interval
+        self.sample_every = max(1, sample_every)
+
+        self._chunks = deque()
+        self._depth = 0
+        self._cond = threading.Condition(threading.Lock())
+
+        # Producer-side staging (no lock)
+        self._staged: List[Any] = []
+        self._staged_since = 0.0
+
+        # Counters
+        self.enqueued = 0
+        self.dropped = 0
+        self.high_water = 0
+        self.batches = 0
+
+    # --- Producer side ---
+
+    def put(self, packet: Any):
+        """Stage one packet; publish the staged batch when it is full or stale."""
+        if not self._staged:
+            self._staged_since = time.monotonic()
+        self._staged.append(packet)
+        if len(self._staged) >= self.batch_size or time.monotonic() - self._staged_since >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Publish whatever is staged."""
+        if self._staged:
+            staged, self._staged = self._staged, []
+            self.put_batch(staged)
+
+    def flush_if_stale(self):
+        """Publish staged packets that have waited longer than flush_interval."""
+        if self._staged and time.monotonic() - self._staged_since >= self.flush_interval:
+            self.flush()
+
+    def put_batch(self, batch: Any):
+        """Admit a batch, applying the overload policy if it does not fit."""
+        n = len(batch)
+        if not n:
+            return
+
+        with self._cond:
+            self.batches += 1
+            free = self.maxsize - self._depth
+
+            if n > free:
+                if self.policy == "drop_newest":
+                    self.dropped += n - free
+                    batch = batch[:free]
+                else:
+                    if self.policy == "sample":
+                        kept = batch[::self.sample_every]
+                        self.dropped += n - len(kept)
+                        batch = kept
+                    if len(batch) > self.maxsize:
+                        self.dropped += len(batch) - self.maxsize
+                        batch = batch[-self.maxsize:]
+                    self._evict_oldest(len(batch) - (self.maxsize - self._depth))
+
+            if len(batch):
+                self._chunks.append(batch)
+                self._depth += len(batch)
+                self.enqueued += len(batch)
+                self.high_water = max(self.high_water, self._depth)
+                self._cond.notify()
+
+    def _evict_oldest(self, count: int):
+        """Drop ``count`` packets from the head of the queue (lock held)."""
+        while count > 0 and self._chunks:
+            head = self._chunks[0]
+            if len(head) <= count:
+                self._chunks.popleft()
+                self._depth -= len(head)
+                self.dropped += len(head)
+                count -= len(head)
+            else:
+                self._chunks[0] = head[count:]
+                self._depth -= count
+                self.dropped += count
+                count = 0
+
+    # --- Consumer side ---
+
+    def _concat(self, chunks: List[Any]) -> Any:
+        if chunks and hasattr(chunks[0], "concat"):
+            # Columnar batches (core.data.batch.PacketBatch)
+            return type(chunks[0]).concat(chunks)
+        out = []
+        for chunk in chunks:
+            out.extend(chunk)
+        return out
+
+    def drain(self, max_packets: Optional[int] = None) -> Any:
+        """
+        Take everything queued (or up to ``max_packets``) without blocking.
+
+        Returns one concatenated batch: a PacketBatch if producers publish
+        columnar batches, otherwise a list.
+        """
+        with self._cond:
+            if max_packets is None or max_packets >= self._depth:
+                chunks = list(self._chunks)
+                self._chunks.clear()
+                self._depth = 0
+            else:
+                chunks = []
+                taken = 0
+                while self._chunks and taken < max_packets:
+                    head = self._chunks[0]
+                    room = max_packets - taken
+                    if len(head) <= room:
+                        chunks.append(self._chunks.popleft())
+                        taken += len(head)
+                    else:
+                        chunks.append(head[:room])
+                        self._chunks[0] = head[room:]
+                        taken += room
+                self._depth -= taken
+        return self._concat(chunks)
+
+    def get_batch(self, timeout: Optional[float] = None) -> Optional[Any]:
+        """Block until one published batch is available (None on timeout)."""
+        with self._cond:
+            if not self._chunks and not self._cond.wait_for(lambda: self._chunks, timeout):
+                return None
+            batch = self._chunks.popleft()
+            self._depth -= len(batch)
+            return batch
+
+    def empty(self) -> bool:
+        return self._depth == 0
+
+    def qsize(self) -> int:
+        return self._depth
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "policy": self.policy,
+            "capacity": self.maxsize,
+            "depth": self._depth,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "high_water_mark": self.high_water,
+            "batches": self.batches,
+        }
+
+
+if __name__ == "__main__":
+    # Test: overflow a small hand-off under each policy
+    for policy in POLICIES:
+        handoff = PacketHandoff(maxsize=100, batch_size=32, policy=policy)
+        for i in range(1000):
+            handoff.put({"seq": i})
+        handoff.flush()
+        packets = handoff.drain()
+        print(f"{policy:<12} kept={len(packets)} first={packets[0]['seq']} last={packets[-1]['seq']} | {handoff.get_stats()}")
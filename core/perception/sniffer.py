@@ -1,80 +1,216 @@
 import asyncio
+import select
+import sys
 import time
-from typing import Dict, Any, Optional
-from scapy.all import sniff, IP, TCP, UDP
-from scapy.packet import Packet
+from typing import Dict, Any, Iterable, Optional
 from loguru import logger
 import threading
-import queue
+
+from core.perception.bpf import BpfFilter, interface_linktype
+from core.data.batch import PacketBatch
+from core.perception.decoder import decode_row, DLT_EN10MB
+from core.perception.fanout import FanoutCapture
+from core.perception.handoff import PacketHandoff
+from core.perception.ring import PacketRing, ring_supported
+
+BACKENDS = ("scapy", "ring")
 
 class NetworkSniffer:
-    def __init__(self, interface: str = "en0", store_queue: Optional[queue.Queue] = None):
+    def __init__(
+        self,
+        interface: str = "en0",
+        store_queue: Optional[PacketHandoff] = None,
+        backend: str = "scapy",
+        ring_blocks: int = 64,
+        ring_block_size: int = 1 << 20,
+        bpf_filter: Optional[str] = None,
+        allow_ports: Optional[Iterable[int]] = None,
+        allow_hosts: Optional[Iterable[str]] = None,
+        workers: int = 1,
+        batch_size: int = 256,
+        flush_interval: float = 0.1,
+    ):
         """
         Initialize the Network Sniffer.
         
         Args:
             interface: Network interface to sniff on (e.g., 'en0', 'eth0').
-            store_queue: Thread-safe queue to push parsed metadata to.
+            store_queue: Bounded hand-off (or any queue.Queue) to push parsed metadata to.
+            backend: 'scapy' (portable) or 'ring' (Linux TPACKET_V3 mmap ring).
+                     Falls back to 'scapy' if the ring cannot be opened.
+            ring_blocks: Number of ring blocks (ring backend only).
+            ring_block_size: Bytes per ring block (ring backend only).
+            bpf_filter: tcpdump-style expression evaluated in the kernel (needs libpcap).
+            allow_ports: TCP/UDP ports to keep (compiled to BPF; ignored if bpf_filter is set).
+            allow_hosts: IPv4 hosts to keep (compiled to BPF; ignored if bpf_filter is set).
+            workers: Capture processes (ring backend only). More than one joins a
+                     PACKET_FANOUT group so capture and decoding use several cores.
+            batch_size: Packets per columnar batch published by the Scapy backend.
+            flush_interval: Max seconds a partial batch waits before it is published.
         """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown capture backend '{backend}'. Choose from {BACKENDS}.")
+
         self.interface = interface
-        self.queue = store_queue if store_queue else queue.Queue()
+        self.queue = store_queue if store_queue else PacketHandoff()
+        self.backend = backend
+        self.ring_blocks = ring_blocks
+        self.ring_block_size = ring_block_size
+        self.ring = None
+        self.linktype = interface_linktype(interface)
+        self.bpf = BpfFilter.from_config(bpf_filter, allow_ports, allow_hosts, self.linktype)
+        self.workers = max(1, int(workers))
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fanout = None
+        self._rows = []
+        self._rows_since = 0.0
         self.running = False
         self.thread = None
+        self.packets_captured = 0
 
-    def _parse_packet(self, packet: Packet) -> Optional[Dict[str, Any]]:
+    def _ring_loop(self):
         """
-        Extract structured metadata from a raw packet.
+        Blocking ring read loop to be run in a separate thread.
         """
+        logger.info(f"Starting TPACKET_V3 ring capture on {self.interface}...")
         try:
-            if not packet.haslayer(IP):
-                return None
-
-            metadata = {
-                "timestamp": packet.time,
-                "src_ip": packet[IP].src,
-                "dst_ip": packet[IP].dst,
-                "size": len(packet),
-                "protocol": packet[IP].proto, # 6 for TCP, 17 for UDP
-            }
-
-            if packet.haslayer(TCP):
-                metadata.update({
-                    "src_port": packet[TCP].sport,
-                    "dst_port": packet[TCP].dport,
-                    "flags": str(packet[TCP].flags),
-                    "proto_name": "TCP"
-                })
-            elif packet.haslayer(UDP):
-                metadata.update({
-                    "src_port": packet[UDP].sport,
-                    "dst_port": packet[UDP].dport,
-                    "proto_name": "UDP"
-                })
-            else:
-                metadata["proto_name"] = "OTHER"
-
-            return metadata
+            while self.running:
+                rows = []
+                for ts, frame in self.ring.frames(timeout_ms=500):
+                    row = decode_row(frame, ts, self.linktype)
+                    if row:
+                        rows.append(row)
+                if rows:
+                    self.packets_captured += len(rows)
+                    self._emit(PacketBatch.from_rows(rows))
+        finally:
+            self.ring.close()
+        logger.info("Ring capture stopped.")
+
+    def _emit(self, batch: PacketBatch):
+        """Hand a batch to the consumer (one lock round-trip with a PacketHandoff)."""
+        if hasattr(self.queue, "put_batch"):
+            self.queue.put_batch(batch)
+        else:
+            # Plain queue.Queue consumers still get one dict per packet
+            for data in batch.to_records():
+                self.queue.put(data)
+
+    def _stage(self, row):
+        """Collect a decoded row; publish once the batch is full or stale."""
+        if not self._rows:
+            self._rows_since = time.monotonic()
+        self._rows.append(row)
+        if len(self._rows) >= self.batch_size:
+            self._flush_rows()
+
+    def _flush_rows(self):
+        if self._rows:
+            rows, self._rows = self._rows, []
+            self._emit(PacketBatch.from_rows(rows))
+
+    def _flush_if_stale(self):
+        if self._rows and time.monotonic() - self._rows_since >= self.flush_interval:
+            self._flush_rows()
+
+    def _open_ring(self) -> bool:
+        """Try to open the mmap ring; on failure switch to the Scapy backend."""
+        if not ring_supported():
+            logger.warning("Ring backend needs Linux AF_PACKET. Falling back to Scapy.")
+            self.backend = "scapy"
+            return False
+
+        try:
+            self.ring = PacketRing(
+                self.interface,
+                block_size=self.ring_block_size,
+                block_count=self.ring_blocks,
+                bpf=self.bpf,
+            )
+            self.ring.open()
+            return True
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not open capture ring on {self.interface}: {e}. Falling back to Scapy.")
+            self.ring = None
+            self.backend = "scapy"
+            return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get capture statistics (kernel counters are only available for the ring backend)."""
+        stats = {
+            "backend": self.backend,
+            "interface": self.interface,
+            "packets_captured": self.packets_captured,
+            "filter": self.bpf.expression if self.bpf else None,
+            "filter_attached": bool(self.bpf and self.bpf.attached),
+        }
+        if hasattr(self.queue, "get_stats"):
+            stats["handoff"] = self.queue.get_stats()
+        if self.ring:
+            stats.update(self.ring.get_stats())
+        if self.fanout:
+            stats.update(self.fanout.get_stats())
+            stats["packets_captured"] = self.fanout.packets_received
+        return stats
+
+    def _open_listen_socket(self):
+        """Open Scapy's L2 listen socket with the capture filter applied in the kernel."""
+        from scapy.all import conf # Imported on first use: Scapy takes ~1s to load
+        if not self.bpf:
+            return conf.L2listen(iface=self.interface)
+
+        if sys.platform.startswith("linux"):
+            sock = conf.L2listen(iface=self.interface)
+            try:
+                self.bpf.attach(sock.ins, self.interface)
+            except Exception as e:
+                logger.error(f"Could not attach capture filter '{self.bpf.expression}': {e}. Capturing unfiltered.")
+            return sock
 
+        # BSD/macOS: let Scapy hand the expression to libpcap
+        try:
+            sock = conf.L2listen(iface=self.interface, filter=self.bpf.expression)
+            self.bpf.attached = True
+            logger.info(f"Kernel capture filter attached on {self.interface}: '{self.bpf.expression}'")
+            return sock
         except Exception as e:
-            logger.error(f"Error parsing packet: {e}")
-            return None
+            logger.error(f"Could not attach capture filter '{self.bpf.expression}': {e}. Capturing unfiltered.")
+            return conf.L2listen(iface=self.interface)
 
     def _sniff_loop(self):
         """
         Blocking sniff loop to be run in a separate thread.
+
+        Reads raw frames from Scapy's L2 listen socket and decodes them with
+        the struct decoder, so no Scapy layers are dissected per packet.
         """
         logger.info(f"Starting Scapy Sniffer on {self.interface}...")
-        
-        def process_packet(packet):
-            if not self.running:
-                return True # Stop sniffing
-            
-            data = self._parse_packet(packet)
-            if data:
-                self.queue.put(data)
+        from scapy.all import conf, MTU
+        sock = self._open_listen_socket()
+        linktype = None
+
+        try:
+            while self.running:
+                ready, _, _ = select.select([sock], [], [], 0.5)
+                if not ready:
+                    self._flush_if_stale()
+                    continue
+
+                cls, raw, ts = sock.recv_raw(MTU)
+                if raw is None:
+                    continue
+                if linktype is None:
+                    linktype = conf.l2types.layer2num.get(cls, DLT_EN10MB)
 
-        # store=0 to avoid keeping packets in memory
-        sniff(iface=self.interface, prn=process_packet, store=0, stop_filter=lambda x: not self.running)
+                row = decode_row(raw, ts if ts is not None else time.time(), linktype)
+                if row:
+                    self.packets_captured += 1
+                    self._stage(row)
+                self._flush_if_stale()
+        finally:
+            self._flush_rows()
+            sock.close()
         logger.info("Sniffer stopped.")
 
     def start(self):
@@ -85,32 +221,68 @@ class NetworkSniffer:
             logger.warning("Sniffer is already running.")
             return
 
+        if self.bpf:
+            logger.info(f"Capture filter: '{self.bpf.expression}'")
+        else:
+            logger.info("Capture filter: none (all traffic)")
+
         self.running = True
-        self.thread = threading.Thread(target=self._sniff_loop, daemon=True)
+
+        if self.backend == "ring" and self.workers > 1:
+            if ring_supported():
+                self.fanout = FanoutCapture(
+                    self.interface,
+                    self.queue,
+                    workers=self.workers,
+                    bpf=self.bpf,
+                    linktype=self.linktype,
+                    ring_blocks=self.ring_blocks,
+                    ring_block_size=self.ring_block_size,
+                    on_failed=self._fanout_failed,
+                )
+                self.fanout.start()
+                return
+            logger.warning("Fanout capture needs Linux AF_PACKET. Using a single capture thread.")
+
+        target = self._sniff_loop
+        if self.backend == "ring" and self._open_ring():
+            target = self._ring_loop
+
+        self.thread = threading.Thread(target=target, daemon=True)
         self.thread.start()
 
+    def _fanout_failed(self, errors: Dict[int, str]):
+        """No fanout worker could open its ring: capture with Scapy instead, as the single-ring path does."""
+        logger.warning(f"Fanout capture on {self.interface} failed in every worker. Falling back to Scapy.")
+        self.fanout.stop()
+        self.fanout = None
+        self.backend = "scapy"
+        if self.running:
+            self.thread = threading.Thread(target=self._sniff_loop, daemon=True)
+            self.thread.start()
+
     def stop(self):
         """
         Stop the sniffer.
         """
         logger.info("Stopping sniffer...")
         self.running = False
+        if self.fanout:
+            self.fanout.stop()
         if self.thread:
             self.thread.join(timeout=2.0)
 
 if __name__ == "__main__":
     # Test harness
-    q = queue.Queue()
+    q = PacketHandoff()
     sniffer = NetworkSniffer(interface="en0", store_queue=q)
     sniffer.start()
     
     try:
         print("Sniffer running... Press Ctrl+C to stop.")
         while True:
-            try:
-                data = q.get(timeout=1)
-                print(f"Captured: {data}")
-            except queue.Empty:
-                pass
+            batch = q.get_batch(timeout=1)
+            if batch is not None:
+                print(f"Captured: {batch.to_records()}")
     except KeyboardInterrupt:
         sniffer.stop()
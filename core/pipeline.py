@@ -1,6 +1,9 @@
 import os
+from collections.abc import Iterator
 from loguru import logger
 from core.analysis.ensemble import AnomalyEnsemble
+from core.data.batch import PacketBatch
+from core.data.sequences import training_sequences
 
 MODEL_PATH = os.getenv("SENTRA_MODEL_PATH", "models/sentra_v1.pkl")
 
@@ -9,12 +12,15 @@ class ModelPipeline:
         self.model = None
         self.path = MODEL_PATH
 
-    def load_or_create(self):
-        """Loads model from disk if exists, else creates new."""
+    def load_or_create(self, keras=False):
+        """
+        Loads model from disk if exists, else creates new.
+        keras: also load the Keras LSTM-AE (needed to fine-tune it online).
+        """
         if os.path.exists(self.path):
             logger.info(f"Loading existing model from {self.path}...")
             try:
-                self.model = AnomalyEnsemble.load(self.path)
+                self.model = AnomalyEnsemble.load(self.path, keras=keras)
                 logger.success("Model loaded successfully.")
             except Exception as e:
                 logger.error(f"Failed to load model: {e}. Creating new instance.")
@@ -34,11 +40,24 @@ class ModelPipeline:
         else:
             logger.warning("No model to save.")
 
-    def train(self, X, Seq_X):
-        """Trains the model."""
+    def train(self, X, Seq_X=None, **window_args):
+        """
+        Trains the model.
+        X is a feature matrix (with Seq_X its sequences), a PacketBatch such
+        as PacketArchive.read_window(...), or an iterator of batches such as
+        PacketStore.iter_window(..., columnar=True); packets are windowed into
+        both first (window_args: width, hop, steps, hll_error).
+        """
         if not self.model:
             self.model = AnomalyEnsemble()
-        
+
+        if isinstance(X, (PacketBatch, Iterator)):
+            X, Seq_X = training_sequences(X, **window_args)
+            logger.info(f"Windowed archived packets into {len(X)} samples.")
+            if not len(X):
+                logger.warning("No training samples in the archived window.")
+                return
+
         logger.info("Starting training...")
         self.model.fit(X, Seq_X)
         self.save()
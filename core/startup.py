@@ -0,0 +1,128 @@
+"""
+Staged Startup
+
+Capture should start as soon as the process does. Anything slow to import
+or connect (the ML stack, the LangGraph agent and its Neo4j / ChromaDB
+memory) is built by a ``Deferred`` on a background thread after the
+sniffer is running, and the main loop waits for it only when it first
+needs the result.
+
+``import_report`` runs ``python -X importtime`` in a fresh interpreter
+and sums the self time per top-level package, which shows what a module
+costs to import (``python -m core.main --import-time``).
+"""
+
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from loguru import logger
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+class Deferred:
+    """
+    Build a component on a daemon thread.
+
+    ``result()`` blocks until it is ready and returns None if the factory
+    raised, so optional components (the agent) degrade instead of stopping
+    capture.
+    """
+
+    def __init__(self, factory: Callable[[], Any], name: str):
+        self.name = name
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+        self.seconds: Optional[float] = None
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(factory,), name=f"init-{name}", daemon=True)
+        self._thread.start()
+
+    def _run(self, factory: Callable[[], Any]):
+        started = time.perf_counter()
+        try:
+            self.value = factory()
+        except BaseException as e: # ImportError / SystemExit from optional backends included
+            self.error = e
+            logger.error(f"[STARTUP] {self.name} failed to initialize: {e}")
+        finally:
+            self.seconds = time.perf_counter() - started
+            if self.error is None:
+                logger.info(f"[STARTUP] {self.name} ready in {self.seconds:.2f}s")
+            self._done.set()
+
+    @property
+    def ready(self) -> bool:
+        return self._done.is_set()
+
+    def result(self, timeout: Optional[float] = None) -> Any:
+        """The built component (None if it failed or is not ready within ``timeout``)."""
+        if not self._done.wait(timeout):
+            return None
+        return self.value
+
+
+def _importtime(module: str) -> List[Tuple[str, int, int, int]]:
+    """(name, self_us, cumulative_us, depth) per module imported by ``import module``."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()
+        raise ImportError(error[-1] if error else f"import {module} failed")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return rows
+
+
+def import_report(modules: Sequence[str] = ("core.main",), top: int = 10) -> Dict[str, Any]:
+    """
+    Import cost of each module in a fresh interpreter.
+
+    Returns per module: total seconds, module count, and the ``top``
+    top-level packages by summed self time (what an import pulls in).
+    """
+    report = {}
+    for module in modules:
+        try:
+            rows = _importtime(module)
+        except ImportError as e:
+            report[module] = {"error": str(e)}
+            continue
+        packages: Dict[str, int] = defaultdict(int)
+        for name, self_us, _, _ in rows:
+            packages[name.split(".")[0]] += self_us
+        total = max((cumulative for name, _, cumulative, _ in rows if name == module), default=0)
+        report[module] = {
+            "seconds": round(total / 1e6, 3),
+            "modules": len(rows),
+            "packages": [(name, round(us / 1e6, 4)) for name, us in
+                         sorted(packages.items(), key=lambda item: -item[1])[:top]],
+        }
+    return report
+
+
+def print_import_report(modules: Sequence[str], top: int = 10):
+    for module, entry in import_report(modules, top).items():
+        if "error" in entry:
+            print(f"{module}: not importable ({entry['error']})")
+            continue
+        print(f"{module}: {entry['seconds']:.3f}s, {entry['modules']} modules")
+        for name, seconds in entry["packages"]:
+            print(f"    {name:<24} {seconds * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    # Test: a deferred build alongside the main thread, then the import report for the hot path
+    slow = Deferred(lambda: time.sleep(0.2) or "agent", "demo")
+    print(f"ready immediately: {slow.ready} | result: {slow.result()} after {slow.seconds:.2f}s")
+    failing = Deferred(lambda: 1 / 0, "broken")
+    print(f"failed build returns: {failing.result()} ({type(failing.error).__name__})")
+    print_import_report(["core.data.windows", "core.perception.sniffer"], top=5)
@@ -1,7 +1,6 @@
 import sys
 import os
 import time
-import queue
 import signal
 from loguru import logger
 import numpy as np
@@ -11,9 +10,12 @@ import pandas as pd
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from core.perception.sniffer import NetworkSniffer
+from core.perception.handoff import PacketHandoff
+from core.data.batch import PacketBatch
 from core.data.store import PacketStore
 from core.data.features import FeatureExtractor
 from core.data.slm import SLMCompactor
+from core.data.sequences import SequenceBuffer
 from core.analysis.ensemble import AnomalyEnsemble
 from core.analysis.builder import EventBuilder
 from core.agent.brain import SentraAgent
@@ -21,6 +23,10 @@ from core.agent.brain import SentraAgent
 # Global flag for graceful shutdown
 RUNNING = True
 
+# Calibrated window scores: 0.99 = one normal window in a hundred
+THRESHOLD = 0.99
+WARN_THRESHOLD = 0.95
+
 def handle_signal(sig, frame):
     global RUNNING
     logger.info("Stopping Live Monitor...")
@@ -37,13 +43,15 @@ def run_live():
     
     # 1. Initialize Pipeline
     # Using 'en0' (Physical LAN) to capture traffic from Docker VM targeting Host IP
-    packet_queue = queue.Queue()
-    sniffer = NetworkSniffer(interface="en0", store_queue=packet_queue) 
+    packet_queue = PacketHandoff(maxsize=50_000, policy="drop_oldest")
+    # Only keep simulation traffic (5554 is our RTSP map, 8081 is HTTP map); filtered in the kernel
+    sniffer = NetworkSniffer(interface="en0", store_queue=packet_queue, allow_ports=[5554, 8081])
     
     # Store & Features
     # store = PacketStore("live_data.db")
     slm = SLMCompactor()
     fe = FeatureExtractor()
+    sequences = SequenceBuffer(steps=5) # Last 5 batches per device for the LSTM-AE
     
     # Brain (ML)
     # Note: In a real system, we'd load a pre-trained model. 
@@ -51,7 +59,7 @@ def run_live():
     ensemble = AnomalyEnsemble(contamination=0.05)
     
     # Agent
-    builder = EventBuilder(threshold=2.5) # Tuning threshold for demo
+    builder = EventBuilder(threshold=THRESHOLD)
     agent = SentraAgent()
     
     # 2. Start Sniffing
@@ -60,7 +68,7 @@ def run_live():
     # 3. Processing Loop
     logger.info("Waiting for traffic... (Generate traffic using the Docker Simulation)")
     
-    buffer = []
+    buffer = PacketBatch()
     training_data = []      # To hold initial "normal" traffic
     is_training_mode = True
     start_time = time.time()
@@ -69,11 +77,7 @@ def run_live():
     while RUNNING:
         try:
             # Drain queue into buffer
-            while not packet_queue.empty():
-                pkt = packet_queue.get_nowait()
-                # Filter related ports (5554 is our RTSP map, 8081 is HTTP map)
-                if pkt.get('dst_port') in [5554, 8081] or pkt.get('src_port') in [5554, 8081]:
-                    buffer.append(pkt)
+            buffer = PacketBatch.concat([buffer, packet_queue.drain()])
             
             if len(buffer) >= 5: # Process batches
                 logger.debug(f"Processing batch of {len(buffer)} packets...")
@@ -85,20 +89,17 @@ def run_live():
                 features_df = fe.extract_features(buffer) # Extract from raw buffer for better granularity
                 
                 if features_df.empty:
-                    buffer = []
+                    buffer = PacketBatch()
                     continue
 
                 # Prepare input vectors
-                # Using a subset of features for the model (Size, proto_ratio, syn_ratio)
-                # Just using raw 9-dim features for now, filling NaN
-                X = features_df.fillna(0).values
-                # Fake sequence dim for LSTM (just repeat X for now or use history)
-                # (Samples, Time, Feat) -> (N, 5, F)
-                X_seq = np.zeros((X.shape[0], 5, X.shape[1]))
-                for i in range(5): X_seq[:, i, :] = X 
+                # Per-device history of the last 5 batches: (Samples, Time, Feat) -> (N, 5, F)
+                sequences.push(features_df)
+                X = sequences.latest()
+                X_seq = sequences.sequences()
                 
                 if is_training_mode:
-                    training_data.append((X, X_seq))
+                    training_data.append((X.copy(), X_seq.copy())) # Views are overwritten by the next push
                     elapsed = time.time() - start_time
                     logger.info(f"[LEARNING] Collecting normal baseline... ({int(elapsed)}/{TRAINING_DURATION}s) | Packets: {len(buffer)}")
                     
@@ -118,23 +119,25 @@ def run_live():
                 
                 else:
                     # PREDICTION MODE
+                    # Per device (rows of X follow sequences.devices), then per window
                     scores = ensemble.score(X, X_seq)
-                    agg_score = scores['aggregate'].mean() # Mean of batch
+                    worst = int(np.argmax(scores['aggregate']))
+                    agg_score = ensemble.window_score(scores['aggregate'])
+                    target_ip = sequences.devices[worst]
                     
-                    if agg_score > 0.1: # Noisy logs reduction
-                        logger.info(f"[DEFENSE] Anomaly Score: {agg_score:.4f} (GMM: {scores['gmm'].mean():.2f})")
+                    if agg_score >= WARN_THRESHOLD: # Noisy logs reduction
+                        logger.info(f"[DEFENSE] Anomaly Score: {agg_score:.4f} (GMM: {scores['gmm'][worst]:.2f}) | {target_ip}")
                     
                     # Check for Event
-                    if agg_score > builder.threshold:
-                        target_ip = features_df.index[0] # The device IP
-                        event = builder.build_event(target_ip, {"aggregate": float(agg_score)})
+                    if agg_score >= builder.threshold:
+                        event = builder.build_event(target_ip, {"aggregate": agg_score})
                         
                         if event:
                             logger.critical(f"!!! ATTACK DETECTED !!! Severity: {event['severity']}")
                             decision = agent.run(event)
                             logger.critical(f"AGENT RESPONSE: {decision['intent']}")
             
-                buffer = [] # Flush
+                buffer = PacketBatch() # Flush
             
             time.sleep(1)
             